@@ -1,7 +1,45 @@
-from .optimizer import optimize_prompt
+"""promptfit: fit prompts into token budgets.
 
-# Optionally, provide a placeholder for optimize_prompt if not yet implemented
+Submodules are imported on first attribute access, so ``import promptfit`` stays cheap
+and heavy dependencies (cohere, numpy, nltk) load only when a feature needs them.
+"""
+import importlib
 
-def optimize_prompt(prompt, query, max_tokens=2048):
-    """Optimize a prompt to fit within a token budget (placeholder)."""
-    return prompt  # TODO: Implement full optimization pipeline 
\ No newline at end of file
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "optimize_prompt": "optimizer",
+    "optimize_prompts": "optimizer",
+    "optimize_prompt_detailed": "optimizer",
+    "optimize_for_budgets": "optimizer",
+    "enforce_budget": "optimizer",
+    "OptimizationResult": "optimizer",
+    "optimize_document": "hierarchical",
+    "optimize_file": "hierarchical",
+    "optimize_from_index": "index",
+    "SegmentIndex": "index",
+    "estimate_tokens": "token_budget",
+    "estimate_tokens_many": "token_budget",
+    "split_sentences": "segmentation",
+    "split_many": "segmentation",
+    "dedup_segments": "dedup",
+    "PromptTemplate": "template",
+    "Slot": "template",
+    "CompressionPolicy": "policy",
+    "PromptFitSession": "session",
+    "set_tracer": "tracing",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,197 @@
+"""Streaming JSONL batch optimization (``promptfit batch``).
+
+Each input line is a JSON object with ``prompt``, ``query`` and optionally ``max_tokens``
+(or ``budget``) and ``id``. Lines are grouped into chunks and handed to a pool of worker
+processes; each chunk goes through ``optimize_prompts``, so repeated sentences and queries
+within it are embedded once. Workers can share a persistent SQLite embedding cache.
+
+At most ``max_inflight`` chunks are outstanding at any time, so memory stays bounded no
+matter how large the input is. Output lines are ``{"index", "id"?, "optimized"}`` or
+``{"index", "id"?, "error"}``, written in input order or as chunks finish.
+"""
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .config import DEFAULT_MAX_TOKENS
+
+
+@dataclass(frozen=True)
+class BatchConfig:
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    embedding_provider: Optional[str] = None
+    tokenizer: Optional[str] = None
+    cache_path: Optional[str] = None
+    selector: str = "greedy"
+    preserve_order: bool = False
+    mode: str = "paraphrase_if_over_budget"
+    strategy: str = "paraphrase"
+
+
+# Per-process state, set up once by _init_worker
+_config: Optional[BatchConfig] = None
+_embed_fn = None
+
+
+def _init_worker(config: BatchConfig) -> None:
+    global _config, _embed_fn
+    from . import embedder, providers, tokenizer_backends
+    from .embedding_cache import SQLiteEmbeddingCache
+
+    _config = config
+    if config.cache_path:
+        embedder.set_embedding_cache(SQLiteEmbeddingCache(config.cache_path))
+    if config.tokenizer:
+        tokenizer_backends.set_default_tokenizer(config.tokenizer)
+    _embed_fn = providers.get_provider(config.embedding_provider) if config.embedding_provider else embedder.get_embeddings_array
+
+
+def _result(index: int, record_id, key: str, value) -> str:
+    out = {"index": index}
+    if record_id is not None:
+        out["id"] = record_id
+    out[key] = value
+    return json.dumps(out, ensure_ascii=False)
+
+
+def _parse(line: str, default_budget: int) -> Tuple[object, str, str, int]:
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("record must be a JSON object")
+    prompt, query = record["prompt"], record["query"]
+    if not isinstance(prompt, str) or not isinstance(query, str):
+        raise ValueError("prompt and query must be strings")
+    budget = record.get("max_tokens", record.get("budget", default_budget))
+    return record.get("id"), prompt, query, int(budget)
+
+
+def _run_chunk(chunk: List[Tuple[int, str]]) -> Tuple[List[str], int]:
+    """Optimize one chunk of (index, raw line) pairs inside a worker; returns (output lines, error count)."""
+    from .optimizer import optimize_prompt, optimize_prompts
+    from .policy import CompressionPolicy
+
+    config = _config
+    policy = CompressionPolicy(mode=config.mode, strategy=config.strategy)
+    out: List[Optional[str]] = [None] * len(chunk)
+    errors = 0
+    parsed = []
+    for k, (index, line) in enumerate(chunk):
+        try:
+            parsed.append((k, index) + _parse(line, config.max_tokens))
+        except (KeyError, TypeError, ValueError) as e:
+            out[k] = _result(index, None, "error", f"bad record: {e}")
+            errors += 1
+
+    options = dict(selector=config.selector, preserve_order=config.preserve_order, policy=policy)
+    try:
+        texts = optimize_prompts(
+            [(prompt, query, budget) for _, _, _, prompt, query, budget in parsed],
+            config.max_tokens,
+            get_embeddings_fn=_embed_fn,
+            **options,
+        )
+    except Exception:
+        # Isolate the failing record(s) instead of failing the whole chunk
+        texts = []
+        for _, _, _, prompt, query, budget in parsed:
+            try:
+                texts.append(optimize_prompt(prompt, query, budget, embedding_provider=_embed_fn, **options))
+            except Exception as e:
+                texts.append(e)
+    for (k, index, record_id, *_), text in zip(parsed, texts):
+        if isinstance(text, Exception):
+            out[k] = _result(index, record_id, "error", f"{type(text).__name__}: {text}")
+            errors += 1
+        else:
+            out[k] = _result(index, record_id, "optimized", text)
+    return out, errors  # type: ignore
+
+
+def _chunks(lines: Iterable[str], size: int) -> Iterator[List[Tuple[int, str]]]:
+    chunk: List[Tuple[int, str]] = []
+    index = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        chunk.append((index, line))
+        index += 1
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_lines(paths: Iterable[str]) -> Iterator[str]:
+    """Lines of each file in turn; ``-`` reads standard input."""
+    import sys
+    for path in paths:
+        if path == "-":
+            yield from sys.stdin
+        else:
+            with open(path, encoding="utf-8") as f:
+                yield from f
+
+
+def run_batch(
+    lines: Iterable[str],
+    write: Callable[[str], None],
+    config: BatchConfig = BatchConfig(),
+    *,
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+    max_inflight: Optional[int] = None,
+    ordered: bool = True,
+) -> Dict[str, float]:
+    """Optimize a stream of JSONL records, calling ``write`` with each output line.
+
+    ``workers=0`` runs in-process; the default is one worker per CPU. ``max_inflight``
+    (default ``2 * workers``) caps the chunks submitted but not yet written.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be > 0")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stats = {"records": 0, "errors": 0, "chunks": 0, "seconds": 0.0}
+    start = time.perf_counter()
+
+    def emit(result: Tuple[List[str], int]) -> None:
+        lines_out, errors = result
+        stats["chunks"] += 1
+        stats["records"] += len(lines_out)
+        stats["errors"] += errors
+        for line in lines_out:
+            write(line)
+
+    chunks = _chunks(lines, chunk_size)
+    if workers <= 0:
+        _init_worker(config)
+        for chunk in chunks:
+            emit(_run_chunk(chunk))
+    else:
+        limit = max_inflight or 2 * workers
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config,)) as pool:
+            if ordered:
+                queue: Deque[Future] = deque()
+                for chunk in chunks:
+                    queue.append(pool.submit(_run_chunk, chunk))
+                    if len(queue) >= limit:
+                        emit(queue.popleft().result())
+                while queue:
+                    emit(queue.popleft().result())
+            else:
+                running: Set[Future] = set()
+                for chunk in chunks:
+                    running.add(pool.submit(_run_chunk, chunk))
+                    if len(running) >= limit:
+                        done, running = wait(running, return_when=FIRST_COMPLETED)
+                        for fut in done:
+                            emit(fut.result())
+                for fut in as_completed(running):
+                    emit(fut.result())
+    stats["seconds"] = time.perf_counter() - start
+    return stats
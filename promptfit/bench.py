@@ -0,0 +1,327 @@
+"""Offline, reproducible benchmarks for the promptfit pipeline.
+
+Every backend is a deterministic stub with configurable simulated latency, so results
+depend only on the code under test and can be compared across releases::
+
+    python -m promptfit.bench --sizes 10,1000,100000 --output bench.json
+    python -m promptfit.bench --sizes 10,1000 --compare-to bench.json
+
+Each stage is timed over ``repeats`` runs (latency percentiles and throughput) plus one
+extra run under tracemalloc for peak memory; backend call counts come from the stubs.
+"""
+import json
+import time
+import zlib
+import random
+import platform
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np # type: ignore
+
+from . import embedder, paraphraser, segmentation, token_budget, tokenizer_backends
+from .embedding_cache import MemoryEmbeddingCache
+from .optimizer import optimize_prompt
+from .policy import CompressionPolicy
+from .relevance import rank_segments_by_relevance
+from .selection import select_segments
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+STAGES = ("split", "tokens", "embed", "rank", "pack_greedy", "pack_knapsack", "paraphrase", "optimize")
+
+
+# ----- deterministic stub backends -----
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class StubEmbedClient:
+    """Cohere-compatible ``embed``: hashed bag-of-words vectors, so texts sharing words are similar."""
+
+    def __init__(self, dim: int = 64, latency: float = 0.0, vocab_buckets: int = 4096, seed: int = 0):
+        self.latency = latency
+        self.table = np.random.default_rng(seed).standard_normal((vocab_buckets, dim)).astype(np.float32)
+        self.calls = 0
+        self.texts = 0
+
+    def vector(self, text: str) -> np.ndarray:
+        ids = [zlib.crc32(w.encode("utf-8")) % len(self.table) for w in text.lower().split()]
+        return self.table[ids].sum(axis=0) if ids else self.table[0]
+
+    def embed(self, texts, model=None, input_type=None, **kwargs):
+        self.calls += 1
+        self.texts += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return _Obj(embeddings=[self.vector(t).tolist() for t in texts])
+
+
+class StubLLMClient:
+    """Cohere-compatible ``generate`` that 'compresses' by keeping the first ``ratio`` of the words."""
+
+    def __init__(self, latency: float = 0.0, ratio: float = 0.5):
+        self.latency = latency
+        self.ratio = ratio
+        self.calls = 0
+
+    def generate(self, prompt, max_tokens=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        text = prompt.split("PROMPT:\n", 1)[-1].split("\n\n", 1)[-1]
+        words = text.split()
+        return _Obj(generations=[_Obj(text=" ".join(words[:max(1, int(len(words) * self.ratio))]))])
+
+
+class StubTokenizer(tokenizer_backends.HeuristicTokenizer):
+    """Heuristic counts plus a simulated per-request latency."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.name = "bench-stub"
+        self.latency = latency
+        self.calls = 0
+
+    def count_many(self, texts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return super().count_many(texts)
+
+
+# ----- corpus -----
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "shi", "vo", "en", "qui", "dar", "pel", "os", "ty", "bex", "ul"]
+
+
+def make_corpus(n_segments: int, seed: int = 0) -> List[str]:
+    """Deterministic pseudo-English sentences over a fixed 2000-word vocabulary."""
+    rng = random.Random(seed)
+    vocab = ["".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 3))) for _ in range(2000)]
+    sentences = []
+    for _ in range(n_segments):
+        words = [rng.choice(vocab) for _ in range(rng.randint(8, 25))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return sentences
+
+
+# ----- runner -----
+
+@dataclass
+class StageResult:
+    stage: str
+    segments: int
+    repeats: int
+    latency_ms: Dict[str, float]
+    throughput_per_s: float
+    peak_memory_bytes: int
+    backend_calls: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class BenchConfig:
+    sizes: Sequence[int] = DEFAULT_SIZES
+    repeats: int = 5
+    budget_ratio: float = 0.1
+    embed_latency: float = 0.0
+    llm_latency: float = 0.0
+    tokenizer_latency: float = 0.0
+    dim: int = 64
+    seed: int = 0
+    stages: Sequence[str] = STAGES
+
+
+@contextmanager
+def _stub_backends(config: BenchConfig):
+    embed_client = StubEmbedClient(config.dim, config.embed_latency, seed=config.seed)
+    llm_client = StubLLMClient(config.llm_latency)
+    tokenizer = StubTokenizer(config.tokenizer_latency)
+    saved = (embedder._client, embedder._cache, paraphraser._client, tokenizer_backends._default_name)
+    saved_factory = tokenizer_backends._registry.get(tokenizer.name)
+    embedder.set_embedding_client(embed_client)
+    paraphraser.set_llm_client(llm_client)
+    tokenizer_backends.register_tokenizer(tokenizer.name, lambda: tokenizer)
+    tokenizer_backends.set_default_tokenizer(tokenizer.name)
+    try:
+        yield embed_client, llm_client, tokenizer
+    finally:
+        embedder._client, embedder._cache, paraphraser._client = saved[:3]
+        if saved_factory is None:
+            tokenizer_backends.unregister_tokenizer(tokenizer.name)
+        else:
+            tokenizer_backends.register_tokenizer(tokenizer.name, saved_factory)
+        tokenizer_backends.set_default_tokenizer(saved[3])
+        token_budget.clear_token_cache()
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples) * 1000.0
+    return {
+        "p50": float(np.percentile(arr, 50)),
+        "p90": float(np.percentile(arr, 90)),
+        "p99": float(np.percentile(arr, 99)),
+        "mean": float(arr.mean()),
+        "min": float(arr.min()),
+    }
+
+
+def _measure(stage: str, n: int, setup: Callable[[], Callable[[], object]], repeats: int, counters: Callable[[], Dict[str, int]]) -> StageResult:
+    timings = []
+    calls: Dict[str, int] = {}
+    for r in range(repeats):
+        fn = setup()
+        before = counters()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+        if r == 0:
+            calls = {k: v - before[k] for k, v in counters().items()}
+    fn = setup()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    latency = _percentiles(timings)
+    return StageResult(
+        stage=stage,
+        segments=n,
+        repeats=repeats,
+        latency_ms=latency,
+        throughput_per_s=n / (latency["p50"] / 1000.0) if latency["p50"] > 0 else float("inf"),
+        peak_memory_bytes=int(peak),
+        backend_calls=calls,
+    )
+
+
+def run_benchmarks(config: BenchConfig = BenchConfig(), progress: Optional[Callable[[StageResult], None]] = None) -> dict:
+    """Run every stage for every corpus size and return a JSON-serializable report."""
+    results: List[StageResult] = []
+    with _stub_backends(config) as (embed_client, llm_client, tokenizer):
+        def counters():
+            return {"embed": embed_client.calls, "llm": llm_client.calls, "tokenizer": tokenizer.calls}
+
+        for n in config.sizes:
+            segments = make_corpus(n, config.seed)
+            prompt = " ".join(segments)
+            query = " ".join(segments[0].split()[:6])
+            tokens = tokenizer.count_many(segments)
+            budget = max(16, int(sum(tokens) * config.budget_ratio))
+            lookup = {t: embed_client.vector(t) for t in [query] + segments}
+            scores = (np.asarray([lookup[t] for t in segments]) @ lookup[query]).tolist()
+            pruned = " ".join(segments[i] for i in select_segments(scores, tokens, budget).indices)
+
+            def fresh_cache():
+                embedder.set_embedding_cache(MemoryEmbeddingCache(max(1, 2 * n)))
+
+            def cold(fn):
+                def setup():
+                    token_budget.clear_token_cache()
+                    paraphraser.clear_paraphrase_cache()
+                    fresh_cache()
+                    return fn
+                return setup
+
+            stages = {
+                "split": cold(lambda: segmentation.split_sentences(prompt, method="regex")),
+                "tokens": cold(lambda: token_budget.estimate_tokens_many(segments)),
+                "embed": cold(lambda: embedder.get_embeddings(segments)),
+                "rank": cold(lambda: rank_segments_by_relevance(segments, query, lambda ts: [lookup[t] for t in ts])),
+                "pack_greedy": cold(lambda: select_segments(scores, tokens, budget, method="greedy")),
+                "pack_knapsack": cold(lambda: select_segments(scores, tokens, budget, method="knapsack")),
+                "paraphrase": cold(lambda: paraphraser.paraphrase_prompt(pruned, max_tokens=budget, use_cache=False)),
+                "optimize": cold(lambda: optimize_prompt(prompt, query, max_tokens=budget, policy=CompressionPolicy(cache=False))),
+            }
+            for stage in config.stages:
+                result = _measure(stage, n, stages[stage], config.repeats, counters)
+                results.append(result)
+                if progress:
+                    progress(result)
+
+    return {
+        "promptfit_version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "config": asdict(config) | {"sizes": list(config.sizes), "stages": list(config.stages)},
+        "results": [asdict(r) for r in results],
+    }
+
+
+def _version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("promptfit")
+    except Exception:
+        return "unknown"
+
+
+def compare(baseline: dict, current: dict) -> List[dict]:
+    """Pair up (stage, segments) rows of two reports with the p50 latency ratio (current / baseline)."""
+    old = {(r["stage"], r["segments"]): r for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        b = old.get((r["stage"], r["segments"]))
+        if b is None:
+            continue
+        ratio = r["latency_ms"]["p50"] / b["latency_ms"]["p50"] if b["latency_ms"]["p50"] else float("inf")
+        rows.append({"stage": r["stage"], "segments": r["segments"], "baseline_p50_ms": b["latency_ms"]["p50"],
+                     "current_p50_ms": r["latency_ms"]["p50"], "ratio": ratio})
+    return rows
+
+
+def main(
+    sizes: str = "10,100,1000,10000,100000",
+    repeats: int = 5,
+    stages: str = ",".join(STAGES),
+    budget_ratio: float = 0.1,
+    embed_latency: float = 0.0,
+    llm_latency: float = 0.0,
+    tokenizer_latency: float = 0.0,
+    seed: int = 0,
+    output: Optional[str] = None,
+    compare_to: Optional[str] = None,
+):
+    """Run the offline pipeline benchmarks and optionally write/compare JSON reports."""
+    from rich import print # type: ignore
+
+    config = BenchConfig(
+        sizes=[int(s) for s in sizes.split(",") if s],
+        repeats=repeats,
+        budget_ratio=budget_ratio,
+        embed_latency=embed_latency,
+        llm_latency=llm_latency,
+        tokenizer_latency=tokenizer_latency,
+        seed=seed,
+        stages=[s for s in stages.split(",") if s],
+    )
+    unknown = set(config.stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {sorted(unknown)}. Available: {list(STAGES)}")
+
+    def show(r: StageResult):
+        print(f"{r.stage:>14} n={r.segments:<7} p50={r.latency_ms['p50']:10.3f}ms p99={r.latency_ms['p99']:10.3f}ms "
+              f"peak={r.peak_memory_bytes / 1e6:8.2f}MB calls={r.backend_calls}")
+
+    report = run_benchmarks(config, progress=show)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bold green]Wrote {output}[/bold green]")
+    if compare_to:
+        with open(compare_to) as f:
+            baseline = json.load(f)
+        for row in compare(baseline, report):
+            print(f"{row['stage']:>14} n={row['segments']:<7} {row['baseline_p50_ms']:10.3f}ms -> "
+                  f"{row['current_p50_ms']:10.3f}ms  x{row['ratio']:.2f}")
+    return report
+
+
+if __name__ == "__main__":
+    import typer # type: ignore
+    typer.run(main)
@@ -1,14 +1,77 @@
+import sys
+from typing import List, Optional
+
 import typer # type: ignore
 from rich import print # type: ignore
-from . import optimize_prompt
 
+app = typer.Typer(help="Fit prompts into token budgets.", add_completion=False)
+
+@app.command("optimize")
 def main(prompt: str = typer.Argument(..., help="Prompt to optimize."),
          query: str = typer.Argument(..., help="Reference query for relevance scoring."),
-         max_tokens: int = typer.Option(2048, help="Token budget for the optimized prompt.")):
+         max_tokens: int = typer.Option(2048, help="Token budget for the optimized prompt."),
+         embeddings: str = typer.Option(None, help="Embedding provider: cohere, hashing, onnx or sentence-transformers."),
+         strategy: str = typer.Option("paraphrase", help="How to compress past pruning: paraphrase (LLM) or extractive (local).")):
     """Optimize a prompt to fit within a token budget."""
-    optimized = optimize_prompt(prompt, query, max_tokens=max_tokens)
+    from .optimizer import optimize_prompt  # deferred so `--help` doesn't load the pipeline
+    from .policy import CompressionPolicy
+    optimized = optimize_prompt(prompt, query, max_tokens=max_tokens, embedding_provider=embeddings,
+                                policy=CompressionPolicy(strategy=strategy))
     print("[bold green]Optimized Prompt:[/bold green]")
     print(optimized)
 
+@app.command()
+def serve(host: str = typer.Option("127.0.0.1", help="Interface to listen on."),
+          port: int = typer.Option(8765, help="TCP port."),
+          socket: str = typer.Option(None, help="Listen on this Unix socket path instead of TCP."),
+          embeddings: str = typer.Option(None, help="Embedding provider: cohere, hashing, onnx or sentence-transformers."),
+          tokenizer: str = typer.Option(None, help="Tokenizer backend for budget counting."),
+          window_ms: float = typer.Option(5.0, help="How long to gather concurrent requests into one batch."),
+          max_batch: int = typer.Option(1024, help="Most texts sent to a backend in one batch."),
+          max_inflight: int = typer.Option(256, help="Concurrent requests before answering 503."),
+          verbose: bool = typer.Option(False, help="Log every request.")):
+    """Run a long-lived optimization server that batches work across requests."""
+    from .server import serve as run_server
+    where = socket or f"http://{host}:{port}"
+    print(f"[bold green]promptfit serving on {where}[/bold green]")
+    run_server(host, port, socket, verbose=verbose, embedding_provider=embeddings, tokenizer=tokenizer,
+               window=window_ms / 1000.0, max_batch=max_batch, max_inflight=max_inflight)
+
+@app.command()
+def batch(inputs: List[str] = typer.Argument(None, help="JSONL files with prompt, query and optional max_tokens/id; '-' or nothing reads stdin."),
+          output: str = typer.Option(None, "--output", "-o", help="Write JSONL results here instead of stdout."),
+          max_tokens: int = typer.Option(2048, help="Budget for records without max_tokens."),
+          workers: int = typer.Option(None, help="Worker processes (default: one per CPU; 0 runs in-process)."),
+          chunk_size: int = typer.Option(64, help="Records per task; each chunk shares one embedding pass."),
+          max_inflight: int = typer.Option(None, help="Chunks in flight before reading more input (default: 2 per worker)."),
+          ordered: bool = typer.Option(True, help="Write results in input order, or as soon as they finish."),
+          cache: str = typer.Option(None, help="SQLite embedding cache shared by all workers."),
+          embeddings: str = typer.Option(None, help="Embedding provider: cohere, hashing, onnx or sentence-transformers."),
+          tokenizer: str = typer.Option(None, help="Tokenizer backend for budget counting."),
+          selector: str = typer.Option("greedy", help="Segment selector: greedy, knapsack or mmr."),
+          mode: str = typer.Option("paraphrase_if_over_budget", help="Compression mode: prune_only, paraphrase_if_over_budget or always."),
+          strategy: str = typer.Option("paraphrase", help="How to compress past pruning: paraphrase (LLM) or extractive (local).")):
+    """Optimize a stream of JSONL records across all cores."""
+    from .batch import BatchConfig, iter_lines, run_batch
+    config = BatchConfig(max_tokens=max_tokens, embedding_provider=embeddings, tokenizer=tokenizer,
+                         cache_path=cache, selector=selector, mode=mode, strategy=strategy)
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+    try:
+        stats = run_batch(iter_lines(inputs or ["-"]), lambda line: out.write(line + "\n"), config,
+                          workers=workers, chunk_size=chunk_size, max_inflight=max_inflight, ordered=ordered)
+    finally:
+        if output:
+            out.close()
+    rate = stats["records"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(f"[bold green]{stats['records']} records ({stats['errors']} errors) in {stats['seconds']:.1f}s, {rate:.0f}/s[/bold green]", file=sys.stderr)
+
+def run(argv: Optional[List[str]] = None) -> None:
+    """Console entry point. ``promptfit PROMPT QUERY`` still means ``promptfit optimize PROMPT QUERY``."""
+    args = list(sys.argv[1:] if argv is None else argv)
+    commands = {c.name or c.callback.__name__ for c in app.registered_commands}
+    if args and args[0] not in commands and not args[0].startswith("-"):
+        args.insert(0, "optimize")
+    app(args, prog_name="promptfit")
+
 if __name__ == "__main__":
-    typer.run(main) 
\ No newline at end of file
+    run()
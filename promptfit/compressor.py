@@ -0,0 +1,210 @@
+"""Local extractive compression: drop low-information words until the text fits.
+
+An alternative to LLM paraphrasing with no remote calls. Every whitespace-delimited word is
+scored by its self-information ``-log2 p(word)`` under a ``UnigramModel``, which combines
+the text's own word counts with a background model. With no background model, common
+English function words get a high prior probability. Then:
+
+- filler phrases ("please note that", "in order to" -> "to", "basically") score zero;
+- repeated mentions of a word are worth a little less each time (the first mention keeps its score);
+- words inside parentheses are discounted as likely asides;
+- query terms, numbers and negations are protected and go last.
+
+Words are removed lowest score first. A binary search over how many to drop, checked with
+the real tokenizer on the rebuilt text, finds the fewest removals that meet the budget.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np # type: ignore
+
+from .token_budget import estimate_tokens
+from .tokenizer_backends import TokenizerSpec
+from .tracing import count, span
+
+_PIECE_RE = re.compile(r"\S+")
+_CORE_RE = re.compile(r"\w+(?:['’]\w+)*")
+# Closing punctuation moved onto the previous kept word when its own word is dropped
+_TRAILING_RE = re.compile(r"[.!?:;]+[\"')\]”’]*$")
+
+STOPWORDS = frozenset(
+    "a about above after again against all am an and any are as at be because been before being below "
+    "between both but by can could did do does doing down during each few for from further had has have "
+    "having he her here hers herself him himself his how i if in into is it its itself just me more most "
+    "my myself of off on once only or other our ours ourselves out over own same she should so some such "
+    "than that the their theirs them themselves then there these they this those through to too under "
+    "until up very was we were what when where which while who whom why will with would you your yours "
+    "yourself yourselves also really actually basically simply quite rather".split()
+)
+NEGATIONS = frozenset("no not nor never none nothing without cannot can't don't doesn't didn't isn't aren't wasn't weren't won't shouldn't mustn't".split())
+
+# Phrase -> number of leading words that can go ("in order to" keeps "to")
+FILLER_PHRASES: Dict[Tuple[str, ...], int] = {
+    ("please", "note", "that"): 3,
+    ("note", "that"): 2,
+    ("it", "is", "important", "to", "note", "that"): 6,
+    ("it", "should", "be", "noted", "that"): 5,
+    ("as", "a", "matter", "of", "fact"): 5,
+    ("at", "the", "end", "of", "the", "day"): 6,
+    ("for", "all", "intents", "and", "purposes"): 5,
+    ("in", "order", "to"): 2,
+    ("due", "to", "the", "fact", "that"): 4,
+    ("in", "terms", "of"): 2,
+    ("basically",): 1,
+    ("actually",): 1,
+    ("essentially",): 1,
+    ("kind", "of"): 2,
+    ("sort", "of"): 2,
+    ("you", "know"): 2,
+}
+_MAX_PHRASE = max(len(p) for p in FILLER_PHRASES)
+
+_STOPWORD_PRIOR = 0.05  # background probability of a function word
+_WORD_PRIOR = 1e-5  # background probability of anything else
+_PROTECTED = 1e6
+
+
+class UnigramModel:
+    """Smoothed unigram probabilities: the text's own counts mixed with a background model.
+
+    ``background`` maps lowercase words to counts (``from_texts`` builds one from a corpus);
+    without it, ``STOPWORDS`` get a high prior and every other word a small one.
+    """
+
+    def __init__(self, background: Optional[Mapping[str, float]] = None, *, weight: float = 100.0):
+        self.background = dict(background) if background else None
+        self.total = float(sum(self.background.values())) if self.background else 0.0
+        self.weight = weight
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], **kwargs) -> "UnigramModel":
+        counts: Counter = Counter()
+        for text in texts:
+            counts.update(w.lower() for w in _CORE_RE.findall(text))
+        return cls(counts, **kwargs)
+
+    def prior(self, word: str) -> float:
+        if self.background is not None:
+            return (self.background.get(word, 0.0) + 0.5) / (self.total + 0.5 * max(1, len(self.background)))
+        return _STOPWORD_PRIOR if word in STOPWORDS else _WORD_PRIOR
+
+    def information(self, words: Sequence[str]) -> np.ndarray:
+        """Self-information in bits of each of ``words`` given the rest of the text."""
+        local = Counter(words)
+        n = len(words)
+        return np.array(
+            [-math.log2((local[w] + self.weight * self.prior(w)) / (n + self.weight)) for w in words],
+            dtype=np.float64,
+        )
+
+
+DEFAULT_MODEL = UnigramModel()
+
+
+def _filler_mask(words: List[str]) -> np.ndarray:
+    mask = np.zeros(len(words), dtype=bool)
+    i = 0
+    while i < len(words):
+        for size in range(min(_MAX_PHRASE, len(words) - i), 0, -1):
+            drop = FILLER_PHRASES.get(tuple(words[i:i + size]))
+            if drop:
+                mask[i:i + drop] = True
+                i += size - 1
+                break
+        i += 1
+    return mask
+
+
+def information_scores(
+    text: str,
+    query: Optional[str] = None,
+    model: Optional[UnigramModel] = None,
+) -> List[Tuple[str, float]]:
+    """(word, score) for every whitespace-delimited word of ``text``; low scores are dropped first."""
+    pieces = _PIECE_RE.findall(text)
+    return list(zip(pieces, _scores(pieces, query, model).tolist()))
+
+
+def _scores(pieces: List[str], query: Optional[str], model: Optional[UnigramModel]) -> np.ndarray:
+    model = model or DEFAULT_MODEL
+    cores = [" ".join(_CORE_RE.findall(p)).lower() for p in pieces]
+    scores = model.information(cores)
+
+    seen: Counter = Counter()
+    depth = 0
+    query_terms = {w.lower() for w in _CORE_RE.findall(query or "")} - STOPWORDS
+    for i, (piece, core) in enumerate(zip(pieces, cores)):
+        opening = piece.count("(") - piece.count(")")
+        if depth > 0 or opening > 0:
+            scores[i] *= 0.5
+        depth = max(0, depth + opening)
+        if not core:
+            scores[i] = 0.0  # bare punctuation, bullets
+            continue
+        if core in NEGATIONS or core in query_terms or any(c.isdigit() for c in core):
+            scores[i] = _PROTECTED
+            continue
+        if core not in STOPWORDS:
+            scores[i] /= 1.0 + 0.5 * seen[core]
+            seen[core] += 1
+    scores[_filler_mask(cores)] = 0.0
+    return scores
+
+
+def _rebuild(text: str, spans: List[Tuple[int, int]], keep: np.ndarray) -> str:
+    out: List[str] = []
+    gap_start = 0
+    for (start, end), kept in zip(spans, keep):
+        if kept:
+            if out:
+                gap = text[gap_start:start]
+                out.append("\n\n" if "\n\n" in gap else "\n" if "\n" in gap else " ")
+            out.append(text[start:end])
+            gap_start = end
+        elif out:
+            trailing = _TRAILING_RE.search(text, start, end)
+            if trailing and not _TRAILING_RE.search(out[-1]):
+                out[-1] += trailing.group(0)
+    return "".join(out)
+
+
+def extractive_compress(
+    text: str,
+    max_tokens: int,
+    *,
+    query: Optional[str] = None,
+    model: Optional[UnigramModel] = None,
+    tokenizer: TokenizerSpec = None,
+) -> str:
+    """Remove the lowest-information words of ``text`` until it fits ``max_tokens``.
+
+    Counts use ``tokenizer`` (default: the configured backend), so the result is within
+    budget by the same measure the optimizer uses. Text already within budget is returned as is.
+    """
+    if estimate_tokens(text, tokenizer) <= max_tokens:
+        return text
+    with span("compress.extractive") as s:
+        matches = list(_PIECE_RE.finditer(text))
+        spans = [m.span() for m in matches]
+        scores = _scores([m.group(0) for m in matches], query, model)
+        # Lowest score first; among equals, later words go first
+        order = np.lexsort((-np.arange(len(scores)), scores))
+
+        def attempt(k: int) -> str:
+            keep = np.ones(len(spans), dtype=bool)
+            keep[order[:k]] = False
+            return _rebuild(text, spans, keep)
+
+        lo, hi = 0, len(spans)  # fewest removals that fit lie in (lo, hi]
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if estimate_tokens(attempt(mid), tokenizer) <= max_tokens:
+                hi = mid
+            else:
+                lo = mid
+        result = attempt(hi)
+        s.set(words=len(spans), removed=hi)
+    count("compress.extractive_words_removed", hi)
+    return result
@@ -0,0 +1,276 @@
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, bursts of up to ``capacity``.
+
+    ``reserve`` never blocks; it books the tokens and returns how long the caller has to wait,
+    which lets the same bucket pace threads (``acquire``) and coroutines (``aacquire``).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, n: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= n
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, n: float = 1.0) -> None:
+        wait = self.reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, n: float = 1.0) -> None:
+        wait = self.reserve(n)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class Overloaded(RuntimeError):
+    """Raised instead of queueing when a component is at capacity; callers should retry later."""
+
+
+class MicroBatcher:
+    """Coalesce concurrent submissions into shared calls of ``fn``.
+
+    Each ``submit(items)`` joins a queue. A worker waits up to ``window`` seconds after the
+    oldest pending submission (or until ``max_batch`` items are queued), then calls ``fn``
+    once with the items of every submission it took, in order, and hands each submitter its
+    slice of the results. ``fn`` must return one result per item.
+
+    At most ``max_pending`` items wait at once; past that ``submit`` raises ``Overloaded``
+    rather than letting the queue grow without bound.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        *,
+        window: float = 0.005,
+        max_batch: int = 512,
+        max_pending: int = 8192,
+        workers: int = 1,
+        name: str = "batch",
+    ):
+        if max_batch <= 0 or max_pending <= 0:
+            raise ValueError("max_batch and max_pending must be > 0")
+        self.fn = fn
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.name = name
+        self._queue: Deque[Tuple[List[Any], Future, float]] = deque()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._loop, name=f"promptfit-{name}-{i}", daemon=True) for i in range(workers)]
+        self._stats = {"requests": 0, "items": 0, "batches": 0, "rejected": 0, "max_depth": 0, "wait_seconds": 0.0}
+        for t in self._threads:
+            t.start()
+
+    def submit(self, items: Sequence[Any]) -> Future:
+        items = list(items)
+        fut: Future = Future()
+        if not items:
+            fut.set_result([])
+            return fut
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} batcher is closed")
+            if self._pending and self._pending + len(items) > self.max_pending:
+                self._stats["rejected"] += 1
+                raise Overloaded(f"{self.name} queue is full ({self._pending} items pending)")
+            self._queue.append((items, fut, time.monotonic()))
+            self._pending += len(items)
+            self._stats["requests"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], self._pending)
+            self._cond.notify()
+        return fut
+
+    def __call__(self, items: Sequence[Any]) -> List[Any]:
+        return self.submit(items).result()
+
+    def _take(self) -> List[Tuple[List[Any], Future, float]]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+            deadline = self._queue[0][2] + self.window
+            while self._pending < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            taken = []
+            n = 0
+            while self._queue and (not taken or n + len(self._queue[0][0]) <= self.max_batch):
+                entry = self._queue.popleft()
+                taken.append(entry)
+                n += len(entry[0])
+            self._pending -= n
+            now = time.monotonic()
+            self._stats["batches"] += 1
+            self._stats["items"] += n
+            self._stats["wait_seconds"] += sum(now - t for _, _, t in taken)
+            return taken
+
+    def _loop(self) -> None:
+        while True:
+            taken = self._take()
+            if not taken:
+                return
+            items = [item for entry_items, _, _ in taken for item in entry_items]
+            try:
+                results = self.fn(items)
+                if len(results) != len(items):
+                    raise ValueError(f"{self.name}: expected {len(items)} results, got {len(results)}")
+            except BaseException as e:
+                for _, fut, _ in taken:
+                    fut.set_exception(e)
+                continue
+            offset = 0
+            for entry_items, fut, _ in taken:
+                fut.set_result(results[offset:offset + len(entry_items)])
+                offset += len(entry_items)
+
+    @property
+    def depth(self) -> int:
+        """Items currently waiting to be batched."""
+        return self._pending
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["depth"] = self._pending
+        stats["mean_batch_items"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        stats["mean_wait_seconds"] = stats["wait_seconds"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+    def close(self) -> None:
+        """Finish queued work and stop the workers."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stop calling a failing backend for a while.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and ``allow`` refuses
+    calls for ``reset_timeout`` seconds. Then one trial call is let through ("half-open"):
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        if failure_threshold <= 0:
+            raise ValueError("failure_threshold must be > 0")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        if not self.allow():
+            raise CircuitOpen("circuit open; backend calls suspended after repeated failures")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+def first_accepted(
+    executor: Executor,
+    calls: Sequence[Callable[[], T]],
+    accept: Callable[[T], bool],
+    *,
+    timeout: Optional[float] = None,
+) -> Tuple[Optional[T], List[T], List[BaseException]]:
+    """Run ``calls`` concurrently and return as soon as one result passes ``accept``.
+
+    Returns ``(accepted or None, every finished result, every exception)``. Calls still
+    queued when a result is accepted (or ``timeout`` runs out) are cancelled; calls already
+    running finish in the background and their results are dropped. Each call runs in a
+    copy of the caller's context, so tracing spans reach the caller's recorder.
+    """
+    pending = {executor.submit(contextvars.copy_context().run, call) for call in calls}
+    end = None if timeout is None else time.monotonic() + timeout
+    results: List[T] = []
+    errors: List[BaseException] = []
+    try:
+        while pending:
+            remaining = None if end is None else end - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                error = fut.exception()
+                if error is not None:
+                    errors.append(error)
+                    continue
+                result = fut.result()
+                results.append(result)
+                if accept(result):
+                    return result, results, errors
+        return None, results, errors
+    finally:
+        for fut in pending:
+            fut.cancel()
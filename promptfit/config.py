@@ -4,6 +4,13 @@
 COHERE_COMMAND_R_PLUS_TOKEN_LIMIT = 32768  # Example value, adjust as needed
 OPENAI_GPT4_TOKEN_LIMIT = 8192
 
+# Model name -> (context budget, tokenizer backend), for optimize_for_budgets. Only local
+# backends: "local-bpe" falls back to "heuristic" when PROMPTFIT_TOKENIZER_JSON is unset
+MODEL_BUDGETS = {
+    "command-r-plus": (COHERE_COMMAND_R_PLUS_TOKEN_LIMIT, "local-bpe"),
+    "gpt-4": (OPENAI_GPT4_TOKEN_LIMIT, "tiktoken"),
+}
+
 # Model names
 COHERE_EMBED_MODEL = "embed-english-v3.0"
 COHERE_LLM_MODEL = "command-r-plus"
@@ -12,4 +19,40 @@ COHERE_LLM_MODEL = "command-r-plus"
 COHERE_API_KEY_ENV = "COHERE_API_KEY"
 
 # Default values
-DEFAULT_MAX_TOKENS = 2048 
\ No newline at end of file
+DEFAULT_MAX_TOKENS = 2048 
+# Token counting
+TOKENIZER_BACKEND_ENV = "PROMPTFIT_TOKENIZER"  # overrides DEFAULT_TOKENIZER_BACKEND
+TOKENIZER_JSON_ENV = "PROMPTFIT_TOKENIZER_JSON"  # path used by the "local-bpe" backend
+DEFAULT_TOKENIZER_BACKEND = "heuristic"
+TOKEN_CACHE_SIZE = 4096
+
+# Embedding cache
+EMBED_CACHE_PATH_ENV = "PROMPTFIT_EMBED_CACHE"  # SQLite file; unset keeps an in-process LRU
+EMBED_CACHE_MAX_ENTRIES = 50000
+EMBED_BATCH_SIZE = 96  # texts per embed request
+EMBED_MAX_CONCURRENCY = 4  # concurrent embed requests for the threaded/async variants
+
+# Paraphrasing
+PARAPHRASE_CACHE_SIZE = 1024  # paraphrases kept per process, keyed by (text, instructions, budget, hyde, tokenizer)
+PARAPHRASE_CANDIDATES = 3  # compression candidates generated concurrently per round
+PARAPHRASE_ROUNDS = 2  # rounds of candidates before returning the best attempt
+PARAPHRASE_MAX_WORKERS = 8  # threads shared by all concurrent paraphrase calls
+PARAPHRASE_BREAKER_FAILURES = 5  # consecutive API errors before generation is suspended
+PARAPHRASE_BREAKER_RESET = 30.0  # seconds before a suspended LLM is tried again
+
+# Ranking
+RANK_WORKERS_ENV = "PROMPTFIT_RANK_WORKERS"  # processes scoring large segment sets (default 1: in-process)
+RANK_PARALLEL_MIN_SEGMENTS = 20000  # below this, process start-up costs more than it saves
+
+# Embedding providers
+EMBEDDING_PROVIDER_ENV = "PROMPTFIT_EMBEDDINGS"  # overrides DEFAULT_EMBEDDING_PROVIDER
+LOCAL_EMBED_MODEL_ENV = "PROMPTFIT_EMBED_MODEL"  # .onnx file or sentence-transformers directory for local providers
+DEFAULT_EMBEDDING_PROVIDER = "cohere"
+HASHING_EMBED_DIM = 1024
+
+# Hierarchical (chunk-then-sentence) optimization
+HIERARCHICAL_CHUNK_TOKENS = 256  # approximate size of the coarse chunks
+HIERARCHICAL_EXPAND = 4.0  # coarse pass keeps chunks holding up to this many times the budget
+
+# Near-duplicate elimination
+DEDUP_THRESHOLD = 0.8  # estimated Jaccard similarity of word 3-grams that counts as a duplicate
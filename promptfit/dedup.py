@@ -0,0 +1,199 @@
+"""Exact and near-duplicate segment elimination.
+
+RAG contexts often carry the same passage several times. ``dedup_segments`` groups
+segments into clusters and keeps the first segment of each cluster as its representative:
+
+1. Exact duplicates (after lowercasing and collapsing whitespace/punctuation) share a hash key.
+2. Near duplicates are found with MinHash over word shingles and LSH banding. Only segments
+   that share a band bucket are compared, and a pair is merged when its estimated Jaccard
+   similarity reaches ``threshold``.
+
+Each step is a single pass or a sort over the segments, so cost grows linearly: about a
+second for 25k sentence-length segments.
+"""
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np # type: ignore
+
+from .tracing import count, span
+
+_WORD_RE = re.compile(r"\w+")
+# Signature entries computed per block: bounds the (num_perm, shingles) temporary
+_BLOCK_ENTRIES = 1 << 22
+
+
+@dataclass
+class DedupResult:
+    """``segments`` holds one representative per cluster in input order. ``representatives``
+    gives their input positions, and ``clusters[i]`` is the cluster of input segment ``i``
+    (an index into ``segments``)."""
+
+    segments: List[str]
+    representatives: List[int]
+    clusters: List[int]
+
+    @property
+    def removed(self) -> int:
+        return len(self.clusters) - len(self.segments)
+
+    def members(self) -> List[List[int]]:
+        """Input positions of every cluster, representative first."""
+        out: List[List[int]] = [[] for _ in self.segments]
+        for i, c in enumerate(self.clusters):
+            out[c].append(i)
+        return out
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+class _WordHashes(dict):
+    def __missing__(self, word: str) -> int:
+        h = self[word] = zlib.crc32(word.encode("utf-8")) + 1  # 0 is the padding word
+        return h
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _union(parent: List[int], i: int, j: int) -> None:
+    ri, rj = _find(parent, i), _find(parent, j)
+    if ri != rj:
+        # The earlier segment stays the root, so it becomes the representative
+        parent[max(ri, rj)] = min(ri, rj)
+
+
+def lsh_params(threshold: float, num_perm: int, recall: float = 0.99) -> Tuple[int, int]:
+    """(bands, rows) with ``bands * rows <= num_perm``: the most rows per band (fewest
+    candidate pairs) that still make a pair at exactly ``threshold`` a candidate with
+    probability ``1 - (1 - threshold ** rows) ** bands >= recall``."""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if 1.0 - (1.0 - threshold ** rows) ** bands >= recall:
+            best = (bands, rows)
+    return best
+
+
+def minhash_signatures(texts: Sequence[str], *, num_perm: int = 64, shingle: int = 3, seed: int = 0) -> np.ndarray:
+    """MinHash signatures over word ``shingle``-grams, shape (len(texts), num_perm), uint32.
+
+    Texts shorter than ``shingle`` words form one shingle.
+    """
+    return _signatures([_words(t) for t in texts], num_perm, shingle, seed)
+
+
+def _signatures(word_lists: Sequence[List[str]], num_perm: int, shingle: int, seed: int) -> np.ndarray:
+    # Hash each distinct word once, then build shingle hashes and all num_perm permutations
+    # (multiply-shift hashes) with vectorized passes over the concatenated word hashes
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 63, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64)
+    lookup = _WordHashes().__getitem__
+    flat: List[int] = []
+    lengths = np.empty(len(word_lists), dtype=np.int64)
+    for t, words in enumerate(word_lists):
+        flat.extend(map(lookup, words))
+        pad = shingle - len(words)
+        if pad > 0:
+            flat.extend([0] * pad)  # short (or empty) texts: one padded shingle
+        lengths[t] = max(len(words), shingle)
+    ids = np.asarray(flat, dtype=np.uint64)
+    word_starts = np.r_[0, np.cumsum(lengths)[:-1]]
+
+    # Shingle j of a text starts at word j; each text has length - shingle + 1 of them
+    counts = lengths - shingle + 1
+    starts = np.r_[0, np.cumsum(counts)]
+    first_word = np.repeat(word_starts, counts) + (np.arange(starts[-1]) - np.repeat(starts[:-1], counts))
+    shingles = np.zeros(starts[-1], dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for k in range(shingle):
+            shingles = shingles * np.uint64(0x100000001B3) + ids[first_word + k]
+
+    sigs = np.empty((len(word_lists), num_perm), dtype=np.uint32)
+    per_block = max(1, _BLOCK_ENTRIES // num_perm)
+    i = 0
+    while i < len(word_lists):
+        # A block of texts holding about per_block shingles (at least one text)
+        j = int(np.searchsorted(starts, starts[i] + per_block, side="right")) - 1
+        j = min(len(word_lists), max(j, i + 1))
+        block = shingles[starts[i]:starts[j]]
+        with np.errstate(over="ignore"):
+            permuted = ((a * block + b) >> np.uint64(32)).astype(np.uint32)
+        sigs[i:j] = np.minimum.reduceat(permuted, starts[i:j] - starts[i], axis=1).T
+        i = j
+    return sigs
+
+
+def dedup_segments(
+    segments: Sequence[str],
+    *,
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    shingle: int = 3,
+    near: bool = True,
+    seed: int = 0,
+) -> DedupResult:
+    """Cluster exact and near-duplicate ``segments``; see the module docstring.
+
+    ``threshold`` is the estimated Jaccard similarity of word shingles needed to merge two
+    segments. ``near=False`` only removes exact duplicates.
+    """
+    if not 0.0 < threshold <= 1.0:
+        raise ValueError("threshold must be in (0, 1]")
+    n = len(segments)
+    parent = list(range(n))
+    with span("dedup", segments=n) as s:
+        # 1. Exact duplicates
+        first: Dict[str, int] = {}
+        unique: List[int] = []
+        unique_words: List[List[str]] = []
+        for i, segment in enumerate(segments):
+            words = _words(segment)
+            key = " ".join(words) or segment.strip()
+            j = first.setdefault(key, i)
+            if j == i:
+                unique.append(i)
+                unique_words.append(words)
+            else:
+                parent[i] = j
+
+        # 2. Near duplicates among the exact-unique segments
+        if near and len(unique) > 1:
+            sigs = _signatures(unique_words, num_perm, shingle, seed)
+            bands, rows = lsh_params(threshold, num_perm)
+            need = threshold * num_perm
+            for band in range(bands):
+                keys = np.ascontiguousarray(sigs[:, band * rows:(band + 1) * rows]).view(np.dtype((np.void, 4 * rows))).ravel()
+                order = np.argsort(keys, kind="stable")
+                sorted_keys = keys[order]
+                # Runs of equal band keys are candidate groups; compare each member to its run's first
+                same = np.r_[False, sorted_keys[1:] == sorted_keys[:-1]]
+                if not same.any():
+                    continue
+                run_start = np.maximum.accumulate(np.where(same, 0, np.arange(len(order))))
+                heads, others = order[run_start[same]], order[same]
+                agree = np.count_nonzero(sigs[heads] == sigs[others], axis=1)
+                for h, k in zip(heads[agree >= need].tolist(), others[agree >= need].tolist()):
+                    _union(parent, unique[h], unique[k])
+
+        roots = [_find(parent, i) for i in range(n)]
+        cluster_of: Dict[int, int] = {}
+        representatives: List[int] = []
+        clusters: List[int] = []
+        for root in roots:
+            if root not in cluster_of:
+                cluster_of[root] = len(representatives)
+                representatives.append(root)
+            clusters.append(cluster_of[root])
+        s.set(clusters=len(representatives))
+    count("dedup.removed", n - len(representatives))
+    return DedupResult([segments[i] for i in representatives], representatives, clusters)
@@ -1,36 +1,246 @@
-from typing import List, Dict
-
-try:
-    import cohere # type: ignore
-except ImportError:
-    cohere = None
-
-from .utils import get_cohere_api_key
-from .config import COHERE_EMBED_MODEL
-
-# Simple in-memory cache for embeddings
-_embedding_cache: Dict[str, List[float]] = {}
-
-def get_embeddings(texts: List[str]) -> List[List[float]]:
-    """Get embeddings for a list of texts using Cohere. Uses in-memory cache."""
-    if cohere is None:
-        raise ImportError("cohere package is required for embedding generation.")
-    api_key = get_cohere_api_key()
-    co = cohere.Client(api_key)
-    uncached = [t for t in texts if t not in _embedding_cache]
-    if uncached:
-        # ===== CHANGED: Batch calls to avoid model limits =====
-        def _batch(iterable, size=96):
-            for i in range(0, len(iterable), size):
-                yield iterable[i:i + size]
-
-        for batch_texts in _batch(uncached):
-            response = co.embed(
-                texts=batch_texts,
-                model=COHERE_EMBED_MODEL,
-                input_type="search_document"  # Required for embed-english-v3.0
-            )
-            for text, emb in zip(batch_texts, response.embeddings):
-                _embedding_cache[text] = emb
-    return [_embedding_cache[t] for t in texts]
+import os
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
+from .utils import LazyModule, get_cohere_api_key
+from .config import (
+    COHERE_EMBED_MODEL,
+    EMBED_BATCH_SIZE,
+    EMBED_CACHE_MAX_ENTRIES,
+    EMBED_CACHE_PATH_ENV,
+    EMBED_MAX_CONCURRENCY,
+)
+import numpy as np # type: ignore
+
+from .concurrency import TokenBucket
+from .tracing import count, span
+from .embedding_cache import EmbeddingCache, MemoryEmbeddingCache, SQLiteEmbeddingCache, cache_key
+from .quantize import l2_normalize
+
+# Imported on first use: cohere takes most of a second to import
+cohere = LazyModule("cohere")
+
+_cache: Optional[EmbeddingCache] = None
+
+# One client per process, reused by every call (sync, threaded and async)
+_client = None
+_client_lock = threading.Lock()
+
+# Process-wide pacing of embed requests; None means unlimited
+_rate_limiter: Optional[TokenBucket] = None
+
+# Texts currently being embedded by some caller, so concurrent callers share one request
+_inflight: Dict[bytes, Future] = {}
+_inflight_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the active cache, creating it on first use.
+
+    Set PROMPTFIT_EMBED_CACHE to a file path to share a persistent SQLite cache between
+    processes and restarts; otherwise a bounded in-process LRU is used.
+    """
+    global _cache
+    if _cache is None:
+        path = os.getenv(EMBED_CACHE_PATH_ENV)
+        if path:
+            _cache = SQLiteEmbeddingCache(path, max_entries=EMBED_CACHE_MAX_ENTRIES)
+        else:
+            _cache = MemoryEmbeddingCache(EMBED_CACHE_MAX_ENTRIES)
+    return _cache
+
+def set_embedding_cache(cache: Optional[EmbeddingCache]) -> None:
+    """Install a cache (e.g. ``SQLiteEmbeddingCache(path, dtype="int8")``). ``None`` resets to the default."""
+    global _cache
+    _cache = cache
+
+def get_embedding_client():
+    """Return the pooled Cohere client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not cohere:
+                    raise ImportError("cohere package is required for embedding generation.")
+                _client = cohere.Client(get_cohere_api_key())
+    return _client
+
+def set_embedding_client(client) -> None:
+    """Install the client used for embed calls (any object with a Cohere-compatible ``embed``). ``None`` resets it."""
+    global _client
+    _client = client
+
+def set_rate_limit(requests_per_second: Optional[float], burst: Optional[float] = None) -> None:
+    """Limit embed requests (one per batch) across all callers in this process. ``None`` disables it."""
+    global _rate_limiter
+    _rate_limiter = TokenBucket(requests_per_second, burst) if requests_per_second else None
+
+def _batches(items: List[str], size: int) -> List[List[str]]:
+    if size <= 0:
+        raise ValueError("batch_size must be > 0")
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _claim(model: str, input_type: str, texts: List[str]) -> Tuple[List[str], Dict[str, Future]]:
+    """Return the texts this caller must embed itself, and a future for every text."""
+    owned: List[str] = []
+    futures: Dict[str, Future] = {}
+    with _inflight_lock:
+        for text in texts:
+            key = cache_key(model, input_type, text)
+            fut = _inflight.get(key)
+            if fut is None:
+                fut = Future()
+                _inflight[key] = fut
+                owned.append(text)
+            futures[text] = fut
+    return owned, futures
+
+def _release(model: str, input_type: str, texts: List[str], futures: Dict[str, Future], error: Optional[BaseException] = None) -> None:
+    with _inflight_lock:
+        for text in texts:
+            _inflight.pop(cache_key(model, input_type, text), None)
+    for text in texts:
+        fut = futures[text]
+        if not fut.done():
+            fut.set_exception(error or RuntimeError("embedding request was not completed"))
+
+def _embed_batch(batch: List[str], model: str, input_type: str, futures: Dict[str, Future]) -> None:
+    try:
+        response = get_embedding_client().embed(
+            texts=batch,
+            model=model,
+            input_type=input_type  # Required for embed-english-v3.0
+        )
+        get_embedding_cache().put_many(model, input_type, batch, response.embeddings)
+        vectors = np.asarray(response.embeddings, dtype=np.float32)
+        for text, emb in zip(batch, vectors):
+            futures[text].set_result(emb)
+    except BaseException as e:
+        _release(model, input_type, batch, futures, e)
+        raise
+    _release(model, input_type, batch, futures)
+
+def _lookup(texts: List[str], model: str, input_type: str):
+    found = get_embedding_cache().get_many(model, input_type, texts)
+    uncached = list(dict.fromkeys(t for t, v in zip(texts, found) if v is None))
+    count("embed.cache_hits", len(texts) - sum(v is None for v in found))
+    count("embed.cache_misses", len(uncached))
+    return found, uncached
+
+def _assemble(texts: List[str], found, values: Dict[str, np.ndarray]) -> List[List[float]]:
+    return [(values[t] if v is None else v).tolist() for t, v in zip(texts, found)]
+
+def _assemble_array(texts: List[str], found, values: Dict[str, np.ndarray], normalize: bool) -> np.ndarray:
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    out = np.stack([values[t] if v is None else v for t, v in zip(texts, found)]).astype(np.float32, copy=False)
+    return l2_normalize(out, inplace=True) if normalize else out
+
+def _fetch(texts: List[str], input_type: str, model: str, max_concurrency: int, batch_size: int):
+    """Cache lookups plus requests for the rest: returns (cached vectors or None, fetched vectors by text)."""
+    with span("embed", texts=len(texts)) as s:
+        found, uncached = _lookup(texts, model, input_type)
+        if not uncached:
+            return found, {}
+
+        owned, futures = _claim(model, input_type, uncached)
+        try:
+            batches = _batches(owned, batch_size)
+            count("embed.requests", len(batches))
+            s.set(uncached=len(uncached), requests=len(batches))
+            _run_batches(batches, model, input_type, futures, max_concurrency)
+        finally:
+            _release(model, input_type, owned, futures)
+        return found, {t: futures[t].result() for t in uncached}
+
+def get_embeddings(
+    texts: List[str],
+    input_type: str = "search_document",
+    model: str = COHERE_EMBED_MODEL,
+    *,
+    max_concurrency: int = 1,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> List[List[float]]:
+    """Get embeddings for a list of texts using Cohere. Cached by (model, input_type, text).
+
+    Uncached texts are sent in batches of ``batch_size``; with ``max_concurrency > 1`` the
+    batches run on a thread pool. Texts already being embedded by another caller are awaited
+    instead of requested again.
+    """
+    found, values = _fetch(texts, input_type, model, max_concurrency, batch_size)
+    return _assemble(texts, found, values)
+
+def get_embeddings_array(
+    texts: List[str],
+    input_type: str = "search_document",
+    model: str = COHERE_EMBED_MODEL,
+    *,
+    normalize: bool = True,
+    max_concurrency: int = 1,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> np.ndarray:
+    """``get_embeddings`` as one contiguous float32 (n_texts, dim) array, L2-normalized by default.
+
+    Cached vectors are stacked directly, without a round-trip through Python lists.
+    """
+    found, values = _fetch(texts, input_type, model, max_concurrency, batch_size)
+    return _assemble_array(texts, found, values, normalize)
+
+def _run_batches(batches: List[List[str]], model: str, input_type: str, futures: Dict[str, Future], max_concurrency: int) -> None:
+    def run(batch):
+        if _rate_limiter is not None:
+            _rate_limiter.acquire()
+        _embed_batch(batch, model, input_type, futures)
+
+    if max_concurrency <= 1 or len(batches) <= 1:
+        for batch in batches:
+            run(batch)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as pool:
+            for f in [pool.submit(run, b) for b in batches]:
+                f.result()
+
+def get_embeddings_concurrent(
+    texts: List[str],
+    input_type: str = "search_document",
+    model: str = COHERE_EMBED_MODEL,
+    *,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> List[List[float]]:
+    """Thread-pool variant of ``get_embeddings`` that sends up to ``max_concurrency`` batches at once."""
+    return get_embeddings(texts, input_type, model, max_concurrency=max_concurrency, batch_size=batch_size)
+
+async def aget_embeddings(
+    texts: List[str],
+    input_type: str = "search_document",
+    model: str = COHERE_EMBED_MODEL,
+    *,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> List[List[float]]:
+    """Async ``get_embeddings``: batches run concurrently (bounded by ``max_concurrency``) on the pooled client."""
+    found, uncached = await asyncio.to_thread(_lookup, texts, model, input_type)
+    if not uncached:
+        return [v.tolist() for v in found]
+
+    owned, futures = _claim(model, input_type, uncached)
+    sem = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(batch):
+        async with sem:
+            if _rate_limiter is not None:
+                await _rate_limiter.aacquire()
+            await asyncio.to_thread(_embed_batch, batch, model, input_type, futures)
+
+    try:
+        batches = _batches(owned, batch_size)
+        count("embed.requests", len(batches))
+        await asyncio.gather(*(run(b) for b in batches))
+    finally:
+        _release(model, input_type, owned, futures)
+    values = {}
+    for t in uncached:
+        values[t] = await asyncio.wrap_future(futures[t])
+    return _assemble(texts, found, values)
@@ -0,0 +1,244 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np  # type: ignore
+
+from .config import EMBED_CACHE_MAX_ENTRIES
+
+_DTYPES = ("float32", "int8")
+
+
+def cache_key(model: str, input_type: str, text: str) -> bytes:
+    """Stable key for a (model, input_type, text) triple; the text is only stored as a hash."""
+    return hashlib.sha256(f"{model}\x00{input_type}\x00{text}".encode("utf-8")).digest()
+
+
+def _to_int8(arr: np.ndarray) -> Tuple[np.ndarray, float]:
+    scale = float(np.abs(arr).max()) / 127.0 or 1.0
+    return np.round(arr / scale).astype(np.int8), scale
+
+
+def _encode(vec, dtype: str) -> Tuple[bytes, float]:
+    arr = np.asarray(vec, dtype=np.float32)
+    if dtype == "int8":
+        codes, scale = _to_int8(arr)
+        return codes.tobytes(), scale
+    return arr.tobytes(), 1.0
+
+
+def _decode(blob: bytes, dtype: str, scale: float) -> np.ndarray:
+    if dtype == "int8":
+        return np.frombuffer(blob, dtype=np.int8).astype(np.float32) * np.float32(scale)
+    return np.frombuffer(blob, dtype=np.float32).copy()
+
+
+class EmbeddingCache:
+    """Base class for embedding caches keyed by (model, input_type, content hash).
+
+    ``get_many`` returns one vector or ``None`` per text; ``hits``/``misses`` count lookups
+    made through this instance.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, input_type: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        raise NotImplementedError
+
+    def put_many(self, model: str, input_type: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def _record(self, found: List[Optional[np.ndarray]]) -> List[Optional[np.ndarray]]:
+        n_hit = sum(1 for v in found if v is not None)
+        self.hits += n_hit
+        self.misses += len(found) - n_hit
+        return found
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+
+class MemoryEmbeddingCache(EmbeddingCache):
+    """In-process LRU capped at ``max_entries`` vectors.
+
+    ``dtype="int8"`` keeps each vector as int8 codes plus one scale (4x less memory);
+    lookups return dequantized float32.
+    """
+
+    def __init__(self, max_entries: int = EMBED_CACHE_MAX_ENTRIES, *, dtype: str = "float32"):
+        super().__init__()
+        if dtype not in _DTYPES:
+            raise ValueError(f"dtype must be one of {_DTYPES}")
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self._data: "OrderedDict[bytes, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, model, input_type, texts):
+        found: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for text in texts:
+                key = cache_key(model, input_type, text)
+                entry = self._data.get(key)
+                vec = None
+                if entry is not None:
+                    self._data.move_to_end(key)
+                    codes, scale = entry
+                    vec = codes if self.dtype == "float32" else codes.astype(np.float32) * np.float32(scale)
+                found.append(vec)
+        return self._record(found)
+
+    def put_many(self, model, input_type, texts, vectors):
+        with self._lock:
+            for text, vec in zip(texts, vectors):
+                arr = np.asarray(vec, dtype=np.float32)
+                self._data[cache_key(model, input_type, text)] = _to_int8(arr) if self.dtype == "int8" else (arr, 1.0)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def nbytes(self) -> int:
+        """Bytes held by cached vectors (excluding keys and bookkeeping)."""
+        with self._lock:
+            return sum(codes.nbytes for codes, _ in self._data.values())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteEmbeddingCache(EmbeddingCache):
+    """Persistent cache in a single SQLite file, safe to share between processes.
+
+    Vectors are stored as float32 or per-vector-scaled int8 blobs (``dtype="int8"`` is 4x
+    smaller at a small precision cost). When ``max_entries`` or ``max_bytes`` is exceeded the
+    least recently used rows are evicted. Nothing is held in memory beyond the current batch.
+    """
+
+    def __init__(self, path: str, *, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 dtype: str = "float32", timeout: float = 30.0):
+        super().__init__()
+        if dtype not in _DTYPES:
+            raise ValueError(f"dtype must be one of {_DTYPES}")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so reopen in child processes
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key BLOB PRIMARY KEY, dtype TEXT NOT NULL, scale REAL NOT NULL,"
+                " vec BLOB NOT NULL, nbytes INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_many(self, model, input_type, texts):
+        keys = [cache_key(model, input_type, t) for t in texts]
+        rows: Dict[bytes, Tuple[str, float, bytes]] = {}
+        with self._lock:
+            conn = self._connect()
+            unique = list(dict.fromkeys(keys))
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                for key, dtype, scale, vec in conn.execute(
+                    f"SELECT key, dtype, scale, vec FROM embeddings WHERE key IN ({marks})", chunk
+                ):
+                    rows[key] = (dtype, scale, vec)
+            if rows:
+                now = time.time()
+                conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, k) for k in rows])
+        found = [_decode(rows[k][2], rows[k][0], rows[k][1]) if k in rows else None for k in keys]
+        return self._record(found)
+
+    def put_many(self, model, input_type, texts, vectors):
+        now = time.time()
+        records = []
+        for text, vec in zip(texts, vectors):
+            blob, scale = _encode(vec, self.dtype)
+            records.append((cache_key(model, input_type, text), self.dtype, scale, blob, len(blob), now))
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, dtype, scale, vec, nbytes, last_access)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    records,
+                )
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        if self.max_entries is not None:
+            (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN"
+                    " (SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+        if self.max_bytes is not None:
+            (total,) = conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                doomed = []
+                for key, nbytes in conn.execute("SELECT key, nbytes FROM embeddings ORDER BY last_access ASC"):
+                    doomed.append((key,))
+                    excess -= nbytes
+                    if excess <= 0:
+                        break
+                conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM embeddings")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
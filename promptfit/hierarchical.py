@@ -0,0 +1,235 @@
+"""Two-level optimization for very long documents.
+
+``optimize_prompt`` embeds and sorts every sentence, so its cost grows with the document.
+Here a coarse pass first streams the document as chunks (paragraphs, merged or split to
+about ``chunk_tokens``), scores each chunk against the query and keeps only the best chunks
+holding ``expand * max_tokens`` tokens. Sentence-level ranking, packing and compression then
+run on the surviving chunks alone, so that part costs O(budget) rather than O(document).
+
+The coarse pass keeps only offsets, token counts and one score per chunk; chunk text is
+re-read from the source when needed. ``optimize_file`` memory-maps the file, so a large
+document is never held in memory as one string.
+"""
+import mmap
+import os
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np # type: ignore
+
+from .config import DEFAULT_MAX_TOKENS, HIERARCHICAL_CHUNK_TOKENS, HIERARCHICAL_EXPAND
+from .optimizer import OptimizationResult, _embedding_fn, _optimize
+from .policy import CompressionPolicy, DEFAULT_POLICY
+from .prerank import bm25_from_counts, query_terms, term_counts
+from .providers import ProviderSpec
+from .relevance import _call_get_embeddings_batched
+from .token_budget import estimate_tokens_many
+from .tokenizer_backends import TokenizerSpec
+from .tracing import count, span
+
+COARSE_SCORERS = ("embed", "bm25")
+
+# Rough characters per token, used only to size chunks before they are counted
+_CHARS_PER_TOKEN = 4
+
+Buffer = Union[str, bytes, mmap.mmap]
+
+
+def chunk_spans(buf: Buffer, max_chars: int) -> Iterator[Tuple[int, int]]:
+    """Yield ``(start, end)`` offsets of chunks of ``buf`` (a str, bytes or mmap).
+
+    Paragraphs (separated by blank lines) are merged while they fit in ``max_chars``;
+    longer paragraphs are cut at the last whitespace before the limit.
+    """
+    if max_chars <= 0:
+        raise ValueError("max_chars must be > 0")
+    text_mode = isinstance(buf, str)
+    sep = "\n\n" if text_mode else b"\n\n"
+    space = " " if text_mode else b" "
+    newline = "\n" if text_mode else b"\n"
+    n = len(buf)
+    start = end = -1  # current chunk
+    pos = 0
+    while pos < n:
+        stop = buf.find(sep, pos)
+        if stop < 0:
+            stop = n
+        if buf[pos:stop].strip():
+            if start >= 0 and stop - start <= max_chars:
+                end = stop
+            else:
+                if start >= 0:
+                    yield start, end
+                start, end = pos, stop
+                while end - start > max_chars:
+                    cut = max(buf.rfind(space, start + 1, start + max_chars), buf.rfind(newline, start + 1, start + max_chars))
+                    if cut < 0:
+                        cut = buf.find(space, start + max_chars, end)
+                        if cut < 0:
+                            break  # one unbreakable run; keep it whole
+                    yield start, cut
+                    start = cut + 1
+        pos = stop + len(sep)
+    if start >= 0:
+        yield start, end
+
+
+def _decoder(buf: Buffer, encoding: str):
+    if isinstance(buf, str):
+        return lambda start, end: buf[start:end].strip()
+    return lambda start, end: buf[start:end].decode(encoding, errors="replace").strip()
+
+
+def _select_chunks(
+    buf: Buffer,
+    query: str,
+    max_tokens: int,
+    *,
+    chunk_tokens: int,
+    expand: float,
+    coarse: str,
+    embedding_provider: ProviderSpec,
+    tokenizer: TokenizerSpec,
+    encoding: str = "utf-8",
+    batch_size: int = 64,
+) -> Tuple[List[str], int]:
+    """Coarse pass: return the text of the kept chunks in document order, and the document's token count."""
+    if coarse not in COARSE_SCORERS:
+        raise ValueError(f"Unknown coarse scorer {coarse!r}. Available: {list(COARSE_SCORERS)}")
+    decode = _decoder(buf, encoding)
+    spans: List[Tuple[int, int]] = []
+    tokens: List[int] = []
+    scores: List[np.ndarray] = []
+    if coarse == "embed":
+        embed_fn = _embedding_fn(embedding_provider)
+        q = _call_get_embeddings_batched([query], embed_fn, 1, normalize=True)[0]
+    else:
+        terms = query_terms(query)
+        tf: List[np.ndarray] = []
+        lengths: List[np.ndarray] = []
+
+    def score(batch: List[Tuple[int, int]]) -> None:
+        texts = [decode(start, end) for start, end in batch]
+        spans.extend(batch)
+        tokens.extend(estimate_tokens_many(texts, tokenizer))
+        if coarse == "embed":
+            scores.append(_call_get_embeddings_batched(texts, embed_fn, batch_size, normalize=True) @ q)
+        else:
+            counts, lens = term_counts(texts, terms)
+            tf.append(counts)
+            lengths.append(lens)
+
+    with span("coarse", method=coarse) as s:
+        batch: List[Tuple[int, int]] = []
+        for chunk in chunk_spans(buf, chunk_tokens * _CHARS_PER_TOKEN):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                score(batch)
+                batch = []
+        if batch:
+            score(batch)
+        if not spans:
+            return [], 0
+        if coarse == "embed":
+            chunk_scores = np.concatenate(scores)
+        else:
+            chunk_scores = bm25_from_counts(np.concatenate(tf), np.concatenate(lengths))
+
+        # Best chunks first until they hold expand * budget tokens (always at least one)
+        target = expand * max_tokens
+        order = np.argsort(-chunk_scores, kind="stable")
+        held = np.cumsum(np.asarray(tokens)[order])
+        n_keep = max(1, int(np.searchsorted(held, target, side="left")) + 1)
+        keep = np.sort(order[:n_keep])
+        s.set(chunks=len(spans), kept=len(keep))
+    count("hierarchical.chunks", len(spans))
+    count("hierarchical.kept_chunks", len(keep))
+    return [decode(*spans[i]) for i in keep], int(sum(tokens))
+
+
+def _hierarchical(
+    buf: Buffer,
+    query: str,
+    max_tokens: int,
+    *,
+    chunk_tokens: int,
+    expand: float,
+    coarse: str,
+    selector: str,
+    preserve_order: bool,
+    prerank_top_n: Optional[int],
+    policy: CompressionPolicy,
+    embedding_provider: ProviderSpec,
+    tokenizer: TokenizerSpec,
+    dedup: Union[bool, float] = False,
+    encoding: str = "utf-8",
+) -> OptimizationResult:
+    kept, total = _select_chunks(
+        buf, query, max_tokens, chunk_tokens=chunk_tokens, expand=expand, coarse=coarse,
+        embedding_provider=embedding_provider, tokenizer=tokenizer, encoding=encoding,
+    )
+    result = _optimize("\n\n".join(kept), query, max_tokens, selector, preserve_order, prerank_top_n, policy, embedding_provider, tokenizer, dedup)
+    result.original_tokens = total
+    return result
+
+
+def optimize_document(
+    document: str,
+    query: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    *,
+    chunk_tokens: int = HIERARCHICAL_CHUNK_TOKENS,
+    expand: float = HIERARCHICAL_EXPAND,
+    coarse: str = "embed",
+    selector: str = "greedy",
+    preserve_order: bool = False,
+    prerank_top_n: Optional[int] = None,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+    embedding_provider: ProviderSpec = None,
+    tokenizer: TokenizerSpec = None,
+    dedup: Union[bool, float] = False,
+) -> str:
+    """
+    Optimize a long document in two passes:
+    1. Chunk it into paragraphs/windows of about ``chunk_tokens`` tokens and score each chunk
+       (``coarse``: "embed" for embedding similarity, "bm25" for a lexical score with no
+       embedding calls)
+    2. Keep the best chunks holding ``expand * max_tokens`` tokens, in document order
+    3. Run the sentence-level ``optimize_prompt`` pipeline on the kept chunks only
+
+    The remaining options (including ``dedup``) are as for ``optimize_prompt``. Kept chunks
+    are joined with a blank line, so whitespace between them is normalized.
+    """
+    return _hierarchical(
+        document, query, max_tokens, chunk_tokens=chunk_tokens, expand=expand, coarse=coarse,
+        selector=selector, preserve_order=preserve_order, prerank_top_n=prerank_top_n,
+        policy=policy, embedding_provider=embedding_provider, tokenizer=tokenizer, dedup=dedup,
+    ).text
+
+
+def optimize_file(
+    path: Union[str, "os.PathLike[str]"],
+    query: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    *,
+    encoding: str = "utf-8",
+    chunk_tokens: int = HIERARCHICAL_CHUNK_TOKENS,
+    expand: float = HIERARCHICAL_EXPAND,
+    coarse: str = "embed",
+    selector: str = "greedy",
+    preserve_order: bool = False,
+    prerank_top_n: Optional[int] = None,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+    embedding_provider: ProviderSpec = None,
+    tokenizer: TokenizerSpec = None,
+    dedup: Union[bool, float] = False,
+) -> str:
+    """``optimize_document`` over a file, read through a memory map rather than into one string."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _hierarchical(
+                buf, query, max_tokens, chunk_tokens=chunk_tokens, expand=expand, coarse=coarse,
+                selector=selector, preserve_order=preserve_order, prerank_top_n=prerank_top_n,
+                policy=policy, embedding_provider=embedding_provider, tokenizer=tokenizer, dedup=dedup, encoding=encoding,
+            ).text
@@ -0,0 +1,338 @@
+"""Prebuilt segment index for optimizing against a fixed corpus.
+
+``SegmentIndex.build`` embeds, token-counts and L2-normalizes a corpus once (policies,
+product docs, few-shot banks). ``save`` writes it as a directory of ``.npy`` arrays plus a
+UTF-8 text blob, and ``SegmentIndex.load`` memory-maps it back, so opening even a large
+index costs nearly nothing and pages are read only when touched.
+
+Search is IVF: spherical k-means puts segments into ``n_lists`` lists, stored contiguously.
+A query scores the centroids and then only the rows of the ``n_probe`` closest lists.
+Rows can be stored as float32 or int8 (``QuantizedEmbeddings``). ``optimize_from_index``
+then needs just one embedding call per query: the query itself.
+"""
+import json
+import math
+import os
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np # type: ignore
+
+from .config import DEFAULT_MAX_TOKENS
+from .optimizer import _embedding_fn, enforce_budget
+from .policy import CompressionPolicy, DEFAULT_POLICY
+from .providers import ProviderSpec, default_provider_name
+from .quantize import QuantizedEmbeddings, l2_normalize
+from .relevance import _call_get_embeddings_batched
+from .selection import select_segments
+from .token_budget import estimate_tokens_many
+from .tokenizer_backends import TokenizerBackend, TokenizerSpec, get_tokenizer
+from .tracing import count, span
+
+INDEX_VERSION = 1
+# Below this many segments a single list (exact search) is used
+_MIN_IVF_SEGMENTS = 2048
+# Rows scored per block during k-means assignment
+_ASSIGN_BLOCK = 8192
+
+
+def _assign(embs: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(embs), dtype=np.int64)
+    for start in range(0, len(embs), _ASSIGN_BLOCK):
+        labels[start:start + _ASSIGN_BLOCK] = np.argmax(embs[start:start + _ASSIGN_BLOCK] @ centroids.T, axis=1)
+    return labels
+
+
+def _provider_name(provider: ProviderSpec) -> Optional[str]:
+    """Name to store for the provider an index is built with (``None`` if it has none)."""
+    if provider is None:
+        return default_provider_name()
+    return provider if isinstance(provider, str) else getattr(provider, "name", None)
+
+
+def spherical_kmeans(embs: np.ndarray, n_lists: int, *, iterations: int = 10, sample: int = 256, seed: int = 0) -> np.ndarray:
+    """Unit-norm centroids of ``n_lists`` clusters of normalized ``embs``, trained on at most
+    ``sample * n_lists`` rows. Empty clusters are re-seeded from random rows."""
+    rng = np.random.default_rng(seed)
+    n = len(embs)
+    train = embs if n <= sample * n_lists else embs[np.sort(rng.choice(n, sample * n_lists, replace=False))]
+    centroids = np.array(train[rng.choice(len(train), n_lists, replace=False)], dtype=np.float32)
+    for _ in range(iterations):
+        labels = _assign(train, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, train)
+        empty = np.flatnonzero(np.bincount(labels, minlength=n_lists) == 0)
+        sums[empty] = train[rng.choice(len(train), len(empty), replace=False)]
+        centroids = l2_normalize(sums)
+    return centroids
+
+
+class SegmentIndex:
+    """Segments, token counts and normalized embeddings grouped into IVF lists.
+
+    Rows are stored list by list; ``ids`` maps each row back to the segment's position in
+    the corpus given to ``build``, which is also the order ``preserve_order`` follows.
+    ``tokenizer`` is the name of the backend the counts were made with; ``tokenizer_spec``
+    is what resolves it (a registered name or a backend instance).
+    """
+
+    def __init__(
+        self,
+        embeddings: QuantizedEmbeddings,
+        tokens: np.ndarray,
+        ids: np.ndarray,
+        centroids: np.ndarray,
+        offsets: np.ndarray,
+        texts: Union[np.ndarray, bytes],
+        text_offsets: np.ndarray,
+        *,
+        provider: Optional[str] = None,
+        tokenizer: Optional[str] = None,
+        tokenizer_spec: TokenizerSpec = None,
+    ):
+        self.embeddings = embeddings
+        self.tokens = tokens
+        self.ids = ids
+        self.centroids = centroids
+        self.offsets = offsets
+        self._texts = texts
+        self._text_offsets = text_offsets
+        self.provider = provider
+        self.tokenizer = tokenizer
+        self.tokenizer_spec = tokenizer_spec
+        self._rows: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def tokenizer_backend(self) -> TokenizerBackend:
+        """The backend the stored counts were made with, checked against its recorded name."""
+        backend = get_tokenizer(self.tokenizer_spec)
+        if self.tokenizer is not None and backend.name != self.tokenizer:
+            raise ValueError(
+                f"the index was counted with {self.tokenizer!r} but its tokenizer resolves to {backend.name!r}; "
+                "pass the backend to SegmentIndex.load(..., tokenizer=...)"
+            )
+        return backend
+
+    @classmethod
+    def build(
+        cls,
+        segments: Sequence[str],
+        embedding_provider: ProviderSpec = None,
+        *,
+        tokenizer: TokenizerSpec = None,
+        n_lists: Optional[int] = None,
+        kind: str = "float32",
+        batch_size: int = 128,
+        seed: int = 0,
+    ) -> "SegmentIndex":
+        """Embed and count ``segments`` once. ``n_lists`` defaults to about ``sqrt(n)``
+        (one list, i.e. exact search, for small corpora); ``kind`` is "float32" or "int8"."""
+        if kind not in ("float32", "int8"):
+            raise ValueError("kind must be 'float32' or 'int8'")
+        segments = list(segments)
+        if not segments:
+            raise ValueError("cannot build an index of no segments")
+        with span("index.build", segments=len(segments)):
+            embs = _call_get_embeddings_batched(segments, _embedding_fn(embedding_provider), batch_size, normalize=True)
+            tokens = np.asarray(estimate_tokens_many(segments, tokenizer), dtype=np.int32)
+            if n_lists is None:
+                n_lists = 1 if len(segments) < _MIN_IVF_SEGMENTS else int(math.sqrt(len(segments)))
+            n_lists = max(1, min(n_lists, len(segments)))
+            if n_lists == 1:
+                centroids = l2_normalize(embs.mean(axis=0, keepdims=True))
+                labels = np.zeros(len(segments), dtype=np.int64)
+            else:
+                centroids = spherical_kmeans(embs, n_lists, seed=seed)
+                labels = _assign(embs, centroids)
+            ids = np.argsort(labels, kind="stable")
+            offsets = np.r_[0, np.cumsum(np.bincount(labels, minlength=n_lists))].astype(np.int64)
+            encoded = [s.encode("utf-8") for s in segments]
+            text_offsets = np.r_[0, np.cumsum([len(b) for b in encoded])].astype(np.int64)
+        return cls(
+            QuantizedEmbeddings.from_float(embs[ids], kind, normalized=True),
+            tokens,
+            ids.astype(np.int64),
+            centroids,
+            offsets,
+            b"".join(encoded),
+            text_offsets,
+            provider=_provider_name(embedding_provider),
+            tokenizer=get_tokenizer(tokenizer).name,
+            tokenizer_spec=tokenizer,
+        )
+
+    # ----- storage -----
+
+    def save(self, path: str) -> None:
+        """Write the index to directory ``path`` (created if needed)."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "codes.npy"), self.embeddings.codes)
+        if self.embeddings.scales is not None:
+            np.save(os.path.join(path, "scales.npy"), self.embeddings.scales)
+        for name in ("tokens", "ids", "centroids", "offsets"):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(path, "text_offsets.npy"), self._text_offsets)
+        with open(os.path.join(path, "texts.bin"), "wb") as f:
+            f.write(bytes(self._texts))
+        meta = {
+            "version": INDEX_VERSION,
+            "segments": len(self),
+            "dim": self.embeddings.dim,
+            "kind": self.embeddings.kind,
+            "n_lists": self.n_lists,
+            "provider": self.provider,
+            "tokenizer": self.tokenizer,
+            # Registry key to resolve the backend with on load (instances can't be stored)
+            "tokenizer_key": self.tokenizer_spec if isinstance(self.tokenizer_spec, str) else None,
+        }
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str, *, mmap: bool = True, tokenizer: TokenizerSpec = None) -> "SegmentIndex":
+        """Open an index written by ``save``; with ``mmap`` arrays and texts are memory-mapped.
+
+        The tokenizer is resolved from the registry key it was built with; an index built with
+        an unregistered backend instance needs that backend passed again as ``tokenizer``.
+        """
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version {meta.get('version')!r}")
+        mode = "r" if mmap else None
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+
+        scales = load("scales") if meta["kind"] == "int8" else None
+        text_path = os.path.join(path, "texts.bin")
+        if mmap and os.path.getsize(text_path):
+            texts: Union[np.ndarray, bytes] = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            with open(text_path, "rb") as f:
+                texts = f.read()
+        index = cls(
+            QuantizedEmbeddings(meta["kind"], load("codes"), meta["dim"], scales),
+            load("tokens"),
+            load("ids"),
+            np.asarray(load("centroids")),
+            np.asarray(load("offsets")),
+            texts,
+            load("text_offsets"),
+            provider=meta.get("provider"),
+            tokenizer=meta.get("tokenizer"),
+            tokenizer_spec=tokenizer if tokenizer is not None else meta.get("tokenizer_key"),
+        )
+        if tokenizer is not None:
+            index.tokenizer_backend()
+        return index
+
+    # ----- lookup -----
+
+    def segment(self, i: int) -> str:
+        """Text of corpus segment ``i``."""
+        start, end = int(self._text_offsets[i]), int(self._text_offsets[i + 1])
+        return bytes(self._texts[start:end]).decode("utf-8")
+
+    def _row_of(self) -> np.ndarray:
+        if self._rows is None:
+            rows = np.empty(len(self.ids), dtype=np.int64)
+            rows[self.ids] = np.arange(len(self.ids))
+            self._rows = rows
+        return self._rows
+
+    def embedding(self, ids) -> np.ndarray:
+        """Normalized (dequantized) embeddings of corpus segments ``ids``."""
+        return self.embeddings.take(self._row_of()[np.asarray(ids)]).dequantize()
+
+    def search(self, query_emb, k: int = 10, *, n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Best ``k`` segments for one query embedding, best first, as (ids, cosine scores).
+
+        Only the ``n_probe`` lists whose centroids are closest to the query are scored
+        (default: a tenth of the lists, at least 8); ``n_probe >= n_lists`` is exact search.
+        """
+        q = l2_normalize(np.asarray(query_emb, dtype=np.float32).reshape(-1))
+        if n_probe is None:
+            n_probe = max(8, math.ceil(self.n_lists / 10))
+        n_probe = min(n_probe, self.n_lists)
+        lists = np.sort(np.argsort(-(self.centroids @ q), kind="stable")[:n_probe])
+        # Lists are contiguous row ranges: score them as views, no gather copy
+        emb = self.embeddings
+        rows_parts, score_parts = [], []
+        for l in lists:
+            start, end = int(self.offsets[l]), int(self.offsets[l + 1])
+            if end > start:
+                view = QuantizedEmbeddings(emb.kind, emb.codes[start:end], emb.dim, None if emb.scales is None else emb.scales[start:end])
+                rows_parts.append(np.arange(start, end))
+                score_parts.append(view.scores(q))
+        if not rows_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate(rows_parts)
+        scores = np.concatenate(score_parts)
+        count("index.rows_scored", len(rows))
+        k = min(k, len(rows))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        best = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return np.asarray(self.ids[rows[best]]), scores[best]
+
+
+def optimize_from_index(
+    index: SegmentIndex,
+    query: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    *,
+    candidates: Optional[int] = None,
+    n_probe: Optional[int] = None,
+    selector: str = "greedy",
+    preserve_order: bool = False,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+    embedding_provider: ProviderSpec = None,
+) -> str:
+    """
+    Build a prompt for ``query`` from a prebuilt index:
+    1. Embed the query (the only embedding call), with ``embedding_provider`` or the
+       provider the index was built with (required if that one had no ``name``)
+    2. Retrieve the ``candidates`` best segments (default: enough to hold about 4x the
+       budget) from the ``n_probe`` nearest IVF lists
+    3. Pack them with the stored token counts (``selector``, ``preserve_order`` as in
+       ``optimize_prompt``; order is corpus order)
+    4. Compress as ``policy`` allows, counting with the index's tokenizer
+    """
+    if embedding_provider is None:
+        if index.provider is None:
+            raise ValueError("the index was built with an unnamed embedding provider; pass it as embedding_provider")
+        embedding_provider = index.provider
+    embed_fn = _embedding_fn(embedding_provider)
+    with span("rank", segments=len(index)):
+        q = _call_get_embeddings_batched([query], embed_fn, 1, normalize=True)[0]
+        if candidates is None:
+            mean_tokens = max(1.0, float(np.mean(index.tokens)))
+            candidates = max(16, math.ceil(4 * max_tokens / mean_tokens))
+        ids, scores = index.search(q, candidates, n_probe=n_probe)
+    if not len(ids):
+        return ""
+    sorted_sections = [index.segment(i) for i in ids]
+    # select_segments takes candidates in original (corpus) order
+    order = np.argsort(ids, kind="stable")
+    ids, scores = ids[order], scores[order]
+    with span("pack", method=selector, candidates=len(ids)) as s:
+        selection = select_segments(
+            scores,
+            index.tokens[ids],
+            max_tokens,
+            method=selector,
+            preserve_order=preserve_order,
+            embeddings=index.embedding(ids) if selector == "mmr" else None,
+        )
+        s.set(selected=len(selection.indices))
+    pruned = [index.segment(ids[k]) for k in selection.indices]
+    with span("compress", mode=policy.mode):
+        return enforce_budget(" ".join(index.segment(i) for i in ids), sorted_sections, pruned, max_tokens, policy, query,
+                              tokenizer=index.tokenizer_backend())
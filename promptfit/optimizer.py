@@ -1,75 +1,492 @@
-from .token_budget import estimate_tokens, estimate_tokens_per_section, estimate_total_tokens
-from .embedder import get_embeddings
-from .relevance import rank_segments_by_relevance
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np # type: ignore
+
+from .token_budget import estimate_joined_tokens, estimate_tokens, estimate_tokens_many, estimate_tokens_per_section, estimate_total_tokens
+from .embedder import get_embeddings_array
+from .relevance import rank_segments_by_relevance, similarity_matrix, _call_get_embeddings_batched
 from .paraphraser import paraphrase_prompt
+from .compressor import extractive_compress
+from .trim import trim_to_tokens
+from .selection import select_segments, select_segments_multi
+from .policy import CompressionPolicy, DEFAULT_POLICY
+from .providers import ProviderSpec, default_provider_name, get_provider
+from .tokenizer_backends import TokenizerSpec, get_tokenizer
+from .tracing import SpanRecord, recording, span
 from .utils import split_sentences
-from .config import DEFAULT_MAX_TOKENS
+from .dedup import dedup_segments
+from .config import DEDUP_THRESHOLD, DEFAULT_MAX_TOKENS, MODEL_BUDGETS, TOKENIZER_JSON_ENV
+
+# Upper bound on query x segment scores materialized at once by optimize_prompts
+_SCORE_BLOCK_ENTRIES = 1 << 22
 
-def optimize_prompt(prompt: str, query: str, max_tokens: int = DEFAULT_MAX_TOKENS) -> str:
+def enforce_budget(
+    prompt: str,
+    sorted_sections: List[str],
+    pruned_sections: List[str],
+    max_tokens: int,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+    query: Optional[str] = None,
+    pruned_tokens: Optional[int] = None,
+    tokenizer: TokenizerSpec = None,
+) -> str:
+    """Step 5: paraphrase the pruned prompt (or the original, if nothing fit) as ``policy`` allows.
+
+    For callers that pack sections themselves: ``sorted_sections`` are all sections, most
+    relevant first, and ``pruned_sections`` the packed ones. ``pruned_tokens`` is the pruned
+    prompt's count if the caller already knows it. Fit checks and compression count with
+    ``tokenizer``, the backend the sections were packed with.
     """
-    Optimize a prompt to fit within a token budget:
-    1. Split into sentences/sections
-    2. Estimate tokens per section
-    3. Rank by relevance to query
-    4. Prune/trim low-salience sections
-    5. Paraphrase trimmed content (or full prompt) to enforce budget
+    pruned_prompt = " ".join(pruned_sections)
+    if policy.mode == "prune_only":
+        return pruned_prompt
+    if pruned_tokens is None:
+        pruned_tokens = estimate_tokens(pruned_prompt, tokenizer)
+    if policy.mode == "paraphrase_if_over_budget" and pruned_sections and pruned_tokens <= max_tokens:
+        return pruned_prompt
+    if policy.strategy == "extractive":
+        # Local and exact: one pass fits the budget, nothing to retry
+        return extractive_compress(pruned_prompt if pruned_sections else prompt, max_tokens, query=query, tokenizer=tokenizer)
+
+    end = None if policy.deadline is None else time.monotonic() + policy.deadline
+
+    def paraphrase(text, instructions):
+        remaining = None if end is None else max(0.0, end - time.monotonic())
+        return paraphrase_prompt(
+            text,
+            instructions=instructions,
+            max_tokens=max_tokens,
+            hyde=policy.hyde,
+            deadline=remaining,
+            use_cache=policy.cache,
+            tokenizer=tokenizer,
+        )
+
+    if not pruned_sections:
+        # No section fits: paraphrase original prompt
+        try:
+            pruned_prompt = paraphrase(prompt, "Compress as much as possible.")
+        except Exception:
+            # Fallback: paraphrase top section
+            pruned_prompt = paraphrase(sorted_sections[0], "Compress as much as possible.")
+    else:
+        # Paraphrase the pruned prompt to fit budget (paraphrase_prompt runs its own rounds)
+        pruned_prompt = paraphrase(pruned_prompt, "Preserve all key instructions and meaning.")
+    return pruned_prompt
+
+def _ranked_positions(sections: List[str], ranked: List[Tuple[str, float]]) -> Tuple[List[int], List[float]]:
+    """Map (segment, score) pairs from rank_segments_by_relevance back onto section positions.
+
+    Returns the ranked positions in original order with their scores; sections the ranker
+    left out (e.g. not shortlisted by the pre-ranker) are not candidates.
     """
+    positions: Dict[str, List[int]] = {}
+    for i, section in enumerate(sections):
+        positions.setdefault(section, []).append(i)
+    scores: Dict[int, float] = {}
+    for section, score in ranked:
+        scores[positions[section].pop(0)] = score
+    candidates = sorted(scores)
+    return candidates, [scores[i] for i in candidates]
+
+@dataclass
+class OptimizationResult:
+    """Everything ``optimize_prompt_detailed`` knows about one optimization.
+
+    ``selected`` indexes ``segments`` in output order; ``scores`` has the relevance of each
+    segment (``None`` if it wasn't ranked). ``timings`` are seconds per stage (spans nest:
+    ``rank`` includes ``embed``) and ``counters`` are the pipeline counters from ``promptfit.tracing``.
+    With ``dedup``, ``segments`` are the cluster representatives and ``clusters[i]`` maps
+    sentence ``i`` of the prompt to its representative. With ``policy.trim``, ``trimmed`` is
+    the selected segment that was cut short to fill the budget.
+    """
+    text: str
+    original_tokens: int
+    tokens: int
+    max_tokens: int
+    segments: List[str]
+    selected: List[int]
+    scores: List[Optional[float]]
+    selector: str
+    paraphrased: bool = False
+    clusters: Optional[List[int]] = None
+    trimmed: Optional[int] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    counters: Dict[str, float] = field(default_factory=dict)
+    spans: List[SpanRecord] = field(default_factory=list)
+
+def _embedding_fn(provider: ProviderSpec) -> Callable[[List[str]], List[List[float]]]:
+    if provider is None and default_provider_name() == "cohere":
+        return get_embeddings_array
+    return get_provider(provider)
+
+def _optimize(
+    prompt: str,
+    query: str,
+    max_tokens: int,
+    selector: str,
+    preserve_order: bool,
+    prerank_top_n: Optional[int],
+    policy: CompressionPolicy,
+    embedding_provider: ProviderSpec,
+    tokenizer: TokenizerSpec = None,
+    dedup: Union[bool, float] = False,
+) -> OptimizationResult:
     # 1. Split
-    sections = split_sentences(prompt)
+    with span("split") as s:
+        sections = split_sentences(prompt)
+        s.set(segments=len(sections))
 
     # 2. Estimate tokens
-    tokens_per_section = estimate_tokens_per_section(sections)
+    with span("tokens"):
+        tokens_per_section = estimate_tokens_per_section(sections, tokenizer)
     total_tokens= sum(tokens_per_section)
     # If already within budget
     if total_tokens <= max_tokens:
-        return prompt
+        return OptimizationResult(
+            prompt, total_tokens, total_tokens, max_tokens, sections, list(range(len(sections))), [None] * len(sections), selector
+        )
+    clusters = None
+    if dedup:
+        # Keep one sentence per duplicate cluster before anything is embedded
+        deduped = dedup_segments(sections, threshold=DEDUP_THRESHOLD if dedup is True else float(dedup))
+        if deduped.removed:
+            clusters = deduped.clusters
+            tokens_per_section = [tokens_per_section[i] for i in deduped.representatives]
+            sections = deduped.segments
 
     # 3. Rank by relevance
-    ranked_sections = rank_segments_by_relevance(sections, query, get_embeddings)
+    embed_fn = _embedding_fn(embedding_provider)
+    with span("rank", segments=len(sections)):
+        ranked_sections = rank_segments_by_relevance(sections, query, embed_fn, prerank_top_n=prerank_top_n)
     sorted_sections = [s for s, _ in ranked_sections]
+    candidates, scores = _ranked_positions(sections, ranked_sections)
 
     # 4. Prune/trim
-    pruned_sections = []
-    running_total = 0
-    for section in sorted_sections:
-        sec_tokens = estimate_tokens(section)
-        if running_total + sec_tokens > max_tokens:
-            continue
-        pruned_sections.append(section)
-        running_total += sec_tokens
-    pruned_prompt = " ".join(pruned_sections)
-
-    # 5. Always paraphrase to enforce budget
-    if not pruned_sections:
-        # No section fits: paraphrase original prompt
-        try:
-            pruned_prompt = paraphrase_prompt(
-                prompt,
-                instructions="Compress as much as possible.",
-                max_tokens=max_tokens
-            )
-        except Exception:
-            # Fallback: paraphrase top section
-            pruned_prompt = paraphrase_prompt(
-                sorted_sections[0],
-                instructions="Compress as much as possible.",
-                max_tokens=max_tokens
-            )
-    else:
-        # Paraphrase the pruned prompt to fit budget
-        paraphrased = paraphrase_prompt(
-            pruned_prompt,
-            instructions="Preserve all key instructions and meaning.",
-            max_tokens=max_tokens
+    with span("pack", method=selector, candidates=len(candidates)) as s:
+        embeddings = None
+        if selector == "mmr":
+            # Served from the embedding cache filled by step 3 (or cheap for local providers)
+            embeddings = _call_get_embeddings_batched([sections[i] for i in candidates], embed_fn, 128)
+        selection = select_segments(
+            scores,
+            [tokens_per_section[i] for i in candidates],
+            max_tokens,
+            method=selector,
+            preserve_order=preserve_order,
+            embeddings=embeddings,
         )
-        retries = 0
-        while estimate_tokens(paraphrased) > max_tokens and retries < 2:
-            paraphrased = paraphrase_prompt(
-                paraphrased,
-                instructions="Further compress while keeping meaning.",
-                max_tokens=max_tokens
+        s.set(selected=len(selection.indices), approximate=selection.approximate)
+    selected = [candidates[k] for k in selection.indices]
+    pruned_sections = [sections[i] for i in selected]
+    section_scores: List[Optional[float]] = [None] * len(sections)
+    for i, score in zip(candidates, scores):
+        section_scores[i] = float(score)
+    # Count the joined prompt from its parts rather than re-tokenizing it
+    pruned_tokens = estimate_joined_tokens(pruned_sections, tokenizer)
+    trimmed = None
+    if policy.trim and pruned_tokens < max_tokens:
+        with span("trim"):
+            selected, pruned_sections, pruned_tokens, trimmed = _trim_leftover(
+                sections, section_scores, selected, pruned_tokens, max_tokens, preserve_order, policy.trim_boundary, tokenizer
             )
-            retries += 1
-        pruned_prompt = paraphrased
 
-    return pruned_prompt
\ No newline at end of file
+    # 5. Compress to enforce budget
+    with span("compress", mode=policy.mode):
+        text = enforce_budget(prompt, sorted_sections, pruned_sections, max_tokens, policy, query, pruned_tokens, tokenizer)
+    return OptimizationResult(
+        text,
+        total_tokens,
+        selection.tokens if trimmed is None else pruned_tokens,
+        max_tokens,
+        sections,
+        selected,
+        section_scores,
+        selector,
+        paraphrased=text != " ".join(pruned_sections),
+        clusters=clusters,
+        trimmed=trimmed,
+    )
+
+def _trim_leftover(
+    sections: List[str],
+    section_scores: List[Optional[float]],
+    selected: List[int],
+    used: int,
+    max_tokens: int,
+    preserve_order: bool,
+    boundary: str,
+    tokenizer: TokenizerSpec,
+) -> Tuple[List[int], List[str], int, Optional[int]]:
+    """Step 4b: fill the unused budget with a prefix of the best-ranked segment left out.
+
+    Returns the new (selected, pruned sections, token count, trimmed segment or None).
+    """
+    taken = set(selected)
+    left_out = [i for i, score in enumerate(section_scores) if score is not None and i not in taken]
+    pruned_sections = [sections[i] for i in selected]
+    if not left_out:
+        return selected, pruned_sections, used, None
+    best = min(left_out, key=lambda i: (-section_scores[i], i))
+    # The separator can merge into the piece's first token, so re-check the joined count
+    room = max_tokens - used
+    while room > 0:
+        piece = trim_to_tokens(sections[best], room, tokenizer, boundary=boundary)
+        if not piece:
+            break
+        order = selected + [best]
+        if preserve_order:
+            order.sort()
+        else:
+            order.sort(key=lambda i: (-section_scores[i], i))
+        parts = [piece if i == best else sections[i] for i in order]
+        tokens = estimate_joined_tokens(parts, tokenizer)
+        if tokens <= max_tokens:
+            return order, parts, tokens, best
+        room -= tokens - max_tokens
+    return selected, pruned_sections, used, None
+
+def optimize_prompt(
+    prompt: str,
+    query: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    *,
+    selector: str = "greedy",
+    preserve_order: bool = False,
+    prerank_top_n: Optional[int] = None,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+    embedding_provider: ProviderSpec = None,
+    tokenizer: TokenizerSpec = None,
+    dedup: Union[bool, float] = False,
+) -> str:
+    """
+    Optimize a prompt to fit within a token budget:
+    1. Split into sentences/sections
+    2. Estimate tokens per section
+    3. Rank by relevance to query
+    4. Prune/trim low-salience sections (``selector``: "greedy", "knapsack" or "mmr";
+       ``preserve_order`` keeps kept sentences in their original order)
+       With ``prerank_top_n`` only that many lexical (BM25) matches are embedded and ranked.
+       ``embedding_provider`` picks the embedding backend: a name ("cohere", "hashing",
+       "onnx", "sentence-transformers"), an ``EmbeddingProvider`` or any ``get_embeddings_fn``.
+       ``tokenizer`` selects the backend used for per-section counts (default: the configured one).
+       ``dedup`` (True, or a Jaccard threshold) first collapses exact and near-duplicate
+       sentences to one representative each, so copies cost neither embeddings nor budget.
+    5. Paraphrase trimmed content (or full prompt) to enforce budget, as ``policy`` allows;
+       by default only when the pruned prompt still exceeds the budget
+       (``CompressionPolicy(strategy="extractive")`` compresses locally instead of with the LLM)
+    """
+    return _optimize(prompt, query, max_tokens, selector, preserve_order, prerank_top_n, policy, embedding_provider, tokenizer, dedup).text
+
+def optimize_prompt_detailed(
+    prompt: str,
+    query: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    *,
+    selector: str = "greedy",
+    preserve_order: bool = False,
+    prerank_top_n: Optional[int] = None,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+    embedding_provider: ProviderSpec = None,
+    tokenizer: TokenizerSpec = None,
+    dedup: Union[bool, float] = False,
+) -> OptimizationResult:
+    """Same as ``optimize_prompt`` but returns an ``OptimizationResult`` with the selected
+    segments, their scores, token counts and per-stage timings and counters."""
+    with recording() as recorder:
+        result = _optimize(prompt, query, max_tokens, selector, preserve_order, prerank_top_n, policy, embedding_provider, tokenizer, dedup)
+    if result.paraphrased:
+        result.tokens = estimate_tokens(result.text, tokenizer)
+    result.timings = recorder.timings()
+    result.counters = dict(recorder.counters)
+    result.spans = list(recorder.spans)
+    return result
+
+PromptItem = Union[Tuple[str, str], Tuple[str, str, Optional[int]]]
+
+def optimize_prompts(
+    items: Sequence[PromptItem],
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    *,
+    get_embeddings_fn: Callable[[List[str]], List[List[float]]] = get_embeddings_array,
+    batch_size: int = 128,
+    selector: str = "greedy",
+    preserve_order: bool = False,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+    tokenizer: TokenizerSpec = None,
+) -> List[str]:
+    """
+    Optimize many (prompt, query) pairs at once; an item may carry its own budget as a
+    third element. Same pipeline as optimize_prompt, but sentences are deduplicated across
+    the whole batch: each unique text is token-counted and embedded once, and every query
+    is scored against every segment with one matrix multiply per block of queries.
+    Results are returned in input order.
+    """
+    prompts: List[str] = []
+    queries: List[str] = []
+    budgets: List[int] = []
+    for item in items:
+        prompt, query, *rest = item
+        prompts.append(prompt)
+        queries.append(query)
+        budgets.append(rest[0] if rest and rest[0] is not None else max_tokens)
+
+    # 1-2. Split every prompt and count each unique sentence once
+    with span("split", prompts=len(prompts)):
+        sections = [split_sentences(p) for p in prompts]
+    unique_sections = list(dict.fromkeys(s for secs in sections for s in secs))
+    with span("tokens", segments=len(unique_sections)):
+        counts = dict(zip(unique_sections, estimate_tokens_many(unique_sections, tokenizer)))
+
+    results = list(prompts)
+    todo = [i for i, secs in enumerate(sections) if sum(counts[s] for s in secs) > budgets[i]]
+    if not todo:
+        return results
+
+    # 3. Embed unique queries and segments in one pass, then score block-wise
+    query_texts = list(dict.fromkeys(queries[i] for i in todo))
+    seg_texts = list(dict.fromkeys(s for i in todo for s in sections[i]))
+    all_texts = list(dict.fromkeys(query_texts + seg_texts))
+    with span("rank", queries=len(query_texts), segments=len(seg_texts)):
+        embs = _call_get_embeddings_batched(all_texts, get_embeddings_fn, batch_size, normalize=True)
+    row = {t: k for k, t in enumerate(all_texts)}
+    seg_embs = embs[[row[s] for s in seg_texts]]
+    seg_col = {s: j for j, s in enumerate(seg_texts)}
+
+    items_by_query: Dict[str, List[int]] = {}
+    for i in todo:
+        items_by_query.setdefault(queries[i], []).append(i)
+
+    block = max(1, _SCORE_BLOCK_ENTRIES // max(1, len(seg_texts)))
+    for start in range(0, len(query_texts), block):
+        chunk = query_texts[start:start + block]
+        with span("rank", queries=len(chunk)):
+            scores = similarity_matrix(embs[[row[q] for q in chunk]], seg_embs, normalized=True)
+        for qi, q in enumerate(chunk):
+            for i in items_by_query[q]:
+                secs = sections[i]
+                sims = scores[qi, [seg_col[s] for s in secs]]
+                order = np.argsort(-sims, kind="stable")
+                sorted_sections = [secs[k] for k in order]
+
+                # 4. Prune/trim with the precomputed counts
+                selection = select_segments(
+                    sims,
+                    [counts[s] for s in secs],
+                    budgets[i],
+                    method=selector,
+                    preserve_order=preserve_order,
+                    embeddings=seg_embs[[seg_col[s] for s in secs]] if selector == "mmr" else None,
+                )
+                pruned_sections = [secs[k] for k in selection.indices]
+                pruned_tokens = estimate_joined_tokens(pruned_sections, tokenizer)
+                if policy.trim and pruned_tokens < budgets[i]:
+                    with span("trim"):
+                        _, pruned_sections, pruned_tokens, _ = _trim_leftover(
+                            secs, [float(x) for x in sims], list(selection.indices), pruned_tokens, budgets[i],
+                            preserve_order, policy.trim_boundary, tokenizer,
+                        )
+
+                # 5. Enforce budget
+                with span("compress", mode=policy.mode):
+                    results[i] = enforce_budget(prompts[i], sorted_sections, pruned_sections, budgets[i], policy, queries[i],
+                                                pruned_tokens, tokenizer)
+    return results
+
+BudgetSpec = Union[int, str, Tuple[int, TokenizerSpec]]
+
+def _resolve_budget(budget: BudgetSpec, tokenizer: TokenizerSpec) -> Tuple[int, TokenizerSpec]:
+    if isinstance(budget, str):
+        if budget not in MODEL_BUDGETS:
+            raise KeyError(f"Unknown model {budget!r}. Available: {sorted(MODEL_BUDGETS)}")
+        max_tokens, spec = MODEL_BUDGETS[budget]
+        if spec == "local-bpe" and not os.getenv(TOKENIZER_JSON_ENV):
+            spec = "heuristic"
+        return max_tokens, spec
+    if isinstance(budget, tuple):
+        return int(budget[0]), budget[1]
+    return int(budget), tokenizer
+
+def optimize_for_budgets(
+    prompt: str,
+    query: str,
+    budgets: Sequence[BudgetSpec],
+    *,
+    selector: str = "greedy",
+    preserve_order: bool = False,
+    prerank_top_n: Optional[int] = None,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+    embedding_provider: ProviderSpec = None,
+    tokenizer: TokenizerSpec = None,
+) -> List[str]:
+    """
+    Optimize one prompt for several budgets at once, e.g. the context windows of the models
+    a request may be routed to. Returns one text per budget, in order.
+
+    A budget is a token count (counted with ``tokenizer``), a ``(max_tokens, tokenizer)``
+    pair, or a model name from ``config.MODEL_BUDGETS``. The prompt is split, embedded and
+    ranked once; sections are counted once per distinct tokenizer, and the budgets sharing
+    a tokenizer are packed together (one knapsack DP serves all of them).
+    """
+    resolved = [_resolve_budget(b, tokenizer) for b in budgets]
+    results = [prompt] * len(resolved)
+    if not resolved:
+        return results
+    with span("split") as s:
+        sections = split_sentences(prompt)
+        s.set(segments=len(sections))
+
+    # Group budgets by tokenizer and count each group's sections once
+    groups: Dict[str, Tuple[TokenizerSpec, List[int]]] = {}
+    for k, (_, spec) in enumerate(resolved):
+        groups.setdefault(get_tokenizer(spec).name, (spec, []))[1].append(k)
+    counts: Dict[str, List[int]] = {}
+    todo: Dict[str, List[int]] = {}
+    with span("tokens", tokenizers=len(groups)):
+        for name, (spec, members) in groups.items():
+            counts[name] = estimate_tokens_many(sections, spec)
+            total = sum(counts[name])
+            over = [k for k in members if total > resolved[k][0]]
+            if over:
+                todo[name] = over
+    if not todo:
+        return results
+
+    embed_fn = _embedding_fn(embedding_provider)
+    with span("rank", segments=len(sections)):
+        ranked_sections = rank_segments_by_relevance(sections, query, embed_fn, prerank_top_n=prerank_top_n)
+    sorted_sections = [s for s, _ in ranked_sections]
+    candidates, scores = _ranked_positions(sections, ranked_sections)
+    section_scores: List[Optional[float]] = [None] * len(sections)
+    for i, score in zip(candidates, scores):
+        section_scores[i] = float(score)
+    embeddings = None
+    if selector == "mmr":
+        embeddings = _call_get_embeddings_batched([sections[i] for i in candidates], embed_fn, 128)
+
+    for name, members in todo.items():
+        with span("pack", method=selector, candidates=len(candidates), budgets=len(members)):
+            selections = select_segments_multi(
+                scores,
+                [counts[name][i] for i in candidates],
+                [resolved[k][0] for k in members],
+                method=selector,
+                preserve_order=preserve_order,
+                embeddings=embeddings,
+            )
+        for k, selection in zip(members, selections):
+            budget, spec = resolved[k]
+            selected = [candidates[j] for j in selection.indices]
+            pruned_sections = [sections[i] for i in selected]
+            pruned_tokens = estimate_joined_tokens(pruned_sections, spec)
+            if policy.trim and pruned_tokens < budget:
+                with span("trim"):
+                    _, pruned_sections, pruned_tokens, _ = _trim_leftover(
+                        sections, section_scores, selected, pruned_tokens, budget, preserve_order, policy.trim_boundary, spec
+                    )
+            with span("compress", mode=policy.mode):
+                results[k] = enforce_budget(prompt, sorted_sections, pruned_sections, budget, policy, query, pruned_tokens, spec)
+    return results
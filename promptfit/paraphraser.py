@@ -1,40 +1,167 @@
 import time
-from typing import Optional
-
-try:
-    import cohere # type: ignore
-except ImportError:
-    cohere = None
-
-from .utils import get_cohere_api_key
-from .config import COHERE_LLM_MODEL
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from .utils import LazyModule, get_cohere_api_key
+from .concurrency import CircuitBreaker, CircuitOpen, first_accepted
+from .config import (
+    COHERE_LLM_MODEL,
+    PARAPHRASE_BREAKER_FAILURES,
+    PARAPHRASE_BREAKER_RESET,
+    PARAPHRASE_CACHE_SIZE,
+    PARAPHRASE_CANDIDATES,
+    PARAPHRASE_MAX_WORKERS,
+    PARAPHRASE_ROUNDS,
+)
 from .token_budget import estimate_tokens
-
-
-def paraphrase_prompt(prompt: str, instructions: Optional[str] = None, max_tokens: int = 2048) -> str:
-    if cohere is None:
-        raise ImportError("cohere package is required for paraphrasing.")
-
-    api_key = get_cohere_api_key()
-    co = cohere.Client(api_key)
-
-    def cohere_generate(prompt_text):
-        response = co.generate(
+from .tokenizer_backends import TokenizerSpec, get_tokenizer
+from .tracing import count, span
+
+# Imported on first use: cohere takes most of a second to import
+cohere = LazyModule("cohere")
+
+# Paraphrases that met their budget, keyed by (text, instructions, max_tokens, hyde, tokenizer name)
+_paraphrase_cache: "OrderedDict[Tuple[str, Optional[str], int, bool, str], str]" = OrderedDict()
+_paraphrase_cache_lock = threading.Lock()
+
+# One generation client per process
+_client = None
+_client_lock = threading.Lock()
+
+# Shared by every paraphrase call: candidate threads, and a breaker that stops calling a failing API
+_executor: Optional[ThreadPoolExecutor] = None
+_breaker = CircuitBreaker(PARAPHRASE_BREAKER_FAILURES, PARAPHRASE_BREAKER_RESET)
+# Rounds that only produced API errors before giving up (each backs off 1s, 2s, 4s)
+_MAX_ERROR_ROUNDS = 3
+
+
+def _cache_get(key) -> Optional[str]:
+    with _paraphrase_cache_lock:
+        text = _paraphrase_cache.get(key)
+        if text is not None:
+            _paraphrase_cache.move_to_end(key)
+        return text
+
+
+def _cache_put(key, text: str) -> None:
+    with _paraphrase_cache_lock:
+        _paraphrase_cache[key] = text
+        while len(_paraphrase_cache) > PARAPHRASE_CACHE_SIZE:
+            _paraphrase_cache.popitem(last=False)
+
+
+def clear_paraphrase_cache() -> None:
+    with _paraphrase_cache_lock:
+        _paraphrase_cache.clear()
+
+
+def get_llm_client():
+    """Return the pooled Cohere client used for generation, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not cohere:
+                    raise ImportError("cohere package is required for paraphrasing.")
+                _client = cohere.Client(get_cohere_api_key())
+    return _client
+
+
+def set_llm_client(client) -> None:
+    """Install the client used for generation (any object with a Cohere-compatible ``generate``). ``None`` resets it."""
+    global _client
+    _client = client
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _client_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(PARAPHRASE_MAX_WORKERS, thread_name_prefix="promptfit-paraphrase")
+    return _executor
+
+
+def paraphrase_prompt(
+    prompt: str,
+    instructions: Optional[str] = None,
+    max_tokens: int = 2048,
+    *,
+    hyde: bool = True,
+    deadline: Optional[float] = None,
+    use_cache: bool = True,
+    candidates: int = PARAPHRASE_CANDIDATES,
+    rounds: int = PARAPHRASE_ROUNDS,
+    tokenizer: TokenizerSpec = None,
+) -> str:
+    """Compress ``prompt`` with the LLM until it fits ``max_tokens``.
+
+    Each round generates ``candidates`` compressions concurrently, aiming at progressively
+    shorter lengths with rising temperature. The first one that fits is returned and the
+    rest are cancelled. If none fits, the next round compresses the shortest one further,
+    with no pause in between. Only API errors back off, and repeated errors open a circuit
+    breaker that skips generation for a while.
+
+    ``hyde=False`` skips the expansion call. ``deadline`` caps the total seconds spent; when
+    it runs out (or ``rounds`` are used up) the best attempt so far is returned.
+    Candidates are measured with ``tokenizer`` (default: the configured backend).
+    Results that fit the budget are cached by (prompt, instructions, max_tokens, hyde, tokenizer).
+    """
+    backend = get_tokenizer(tokenizer)
+    key = (prompt, instructions, max_tokens, hyde, backend.name)
+    count("paraphrase.calls")
+    if use_cache:
+        cached = _cache_get(key)
+        if cached is not None:
+            count("paraphrase.cache_hits")
+            return cached
+
+    end = None if deadline is None else time.monotonic() + deadline
+
+    def remaining() -> Optional[float]:
+        return None if end is None else max(0.0, end - time.monotonic())
+
+    def expired() -> bool:
+        return end is not None and time.monotonic() >= end
+
+    def backoff(wait: float) -> None:
+        wait = wait if end is None else min(wait, remaining())
+        count("paraphrase.retries")
+        count("paraphrase.backoff_seconds", wait)
+        with span("paraphrase.backoff", seconds=wait):
+            time.sleep(wait)
+
+    if expired():
+        return prompt
+
+    co = get_llm_client()
+
+    def cohere_generate(prompt_text, temperature=0.2):
+        response = _breaker.call(
+            co.generate,
             model=COHERE_LLM_MODEL,
             prompt=prompt_text,
             max_tokens=max_tokens,
-            temperature=0.2,
+            temperature=temperature,
             stop_sequences=["\n\n"]
         )
         return response.generations[0].text.strip()
 
     # HyDE phase — create semantically complete version
-    hyde_prompt = (
-        "Rewrite the following prompt into a clear, complete, and unambiguous version, "
-        "adding any implied but important details so that it fully represents the intended meaning:\n\n"
-        f"{prompt}"
-    )
-    expanded_prompt = cohere_generate(hyde_prompt)
+    expanded_prompt = prompt
+    if hyde:
+        hyde_prompt = (
+            "Rewrite the following prompt into a clear, complete, and unambiguous version, "
+            "adding any implied but important details so that it fully represents the intended meaning:\n\n"
+            f"{prompt}"
+        )
+        try:
+            with span("paraphrase.hyde"):
+                expanded_prompt = cohere_generate(hyde_prompt)
+        except Exception as e:
+            print(f"[ERROR] Cohere API error during expansion: {e}. Compressing the original prompt.")
 
     # Compression phase
     base_system_prompt = (
@@ -44,39 +171,60 @@ def paraphrase_prompt(prompt: str, instructions: Optional[str] = None, max_token
     if instructions:
         base_system_prompt += f"\nAdditional instructions: {instructions}"
 
-    retries = 0
-    max_retries = 5
-    backoff_base = 1
     current_prompt = expanded_prompt
-
     best_attempt = expanded_prompt
-    best_attempt_tokens = estimate_tokens(expanded_prompt)
-
-    while retries <= max_retries:
-        try:
-            text = cohere_generate(f"{base_system_prompt}\n\nPROMPT:\n{current_prompt}")
-            token_count = estimate_tokens(text)
-
-            if token_count < best_attempt_tokens:
-                best_attempt = text
-                best_attempt_tokens = token_count
-
-            if token_count <= max_tokens:
-                return text
-
-            retries += 1
-            wait_time = backoff_base * (2 ** (retries - 1))
-            print(f"[WARN] Output exceeded {max_tokens} tokens. Retrying in {wait_time}s...")
-            time.sleep(wait_time)
-
-            current_prompt = text
+    best_attempt_tokens = estimate_tokens(expanded_prompt, backend)
+    n = max(1, candidates)
+    failed_rounds = 0
+    round_no = 0
+
+    def attempt(text: str, target: int, temperature: float, number: int):
+        def run() -> Tuple[str, int]:
+            with span("paraphrase.attempt", attempt=number, target=target) as s:
+                out = cohere_generate(text, temperature)
+                tokens = estimate_tokens(out, backend)
+                s.set(tokens=tokens)
+            return out, tokens
+        return run
+
+    while round_no < rounds and not expired():
+        if _breaker.state == "open":
+            count("paraphrase.circuit_open")
+            break
+        calls = []
+        for k in range(n):
+            # Spread targets from the full budget down to about half of it
+            target = max(1, int(max_tokens * (1.0 - 0.5 * k / max(1, n - 1))))
+            request = f"{base_system_prompt}\nTarget length: about {target} tokens.\n\nPROMPT:\n{current_prompt}"
+            calls.append(attempt(request, target, 0.2 + 0.2 * k, round_no * n + k + 1))
+        count("paraphrase.attempts", len(calls))
+        fitted, outputs, errors = first_accepted(_get_executor(), calls, lambda r: r[1] <= max_tokens, timeout=remaining())
+        if fitted is not None:
+            if use_cache:
+                _cache_put(key, fitted[0])
+            return fitted[0]
+
+        for text, tokens in outputs:
+            if tokens < best_attempt_tokens:
+                best_attempt, best_attempt_tokens = text, tokens
+        if outputs:
+            # Too long is not an error: compress the shortest candidate again right away
+            round_no += 1
+            failed_rounds = 0
+            current_prompt = min(outputs, key=lambda r: r[1])[0]
             base_system_prompt += f"\nEnsure output under {max_tokens} tokens. Further compress."
-
-        except Exception as e:
-            retries += 1
-            wait_time = backoff_base * (2 ** (retries - 1))
-            print(f"[ERROR] Cohere API error: {e}. Retrying in {wait_time}s...")
-            time.sleep(wait_time)
+        elif errors:
+            if all(isinstance(e, CircuitOpen) for e in errors) or _breaker.state == "open":
+                count("paraphrase.circuit_open")
+                break
+            failed_rounds += 1
+            if failed_rounds > _MAX_ERROR_ROUNDS:
+                break
+            wait = 2 ** (failed_rounds - 1)
+            print(f"[ERROR] Cohere API error: {errors[0]}. Retrying in {wait}s...")
+            backoff(wait)
+        else:
+            break  # deadline reached with nothing back
 
     print("[INFO] Returning best attempt despite exceeding token limit.")
     return best_attempt
@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+from typing import Optional
+
+COMPRESSION_MODES = ("prune_only", "paraphrase_if_over_budget", "always")
+COMPRESSION_STRATEGIES = ("paraphrase", "extractive")
+TRIM_BOUNDARIES = ("word", "clause")
+
+
+@dataclass(frozen=True)
+class CompressionPolicy:
+    """How ``optimize_prompt`` compresses once pruning is done.
+
+    mode:
+        ``"prune_only"`` never calls the LLM; ``"paraphrase_if_over_budget"`` (default)
+        paraphrases only when the pruned prompt still doesn't fit; ``"always"`` paraphrases
+        every over-budget prompt, as earlier releases did.
+    hyde:
+        Run the HyDE expansion call before compressing. Off saves one generation per call.
+    deadline:
+        Seconds allowed for the whole compression step. When it runs out the best attempt
+        so far is returned instead of retrying or sleeping further.
+    cache:
+        Reuse paraphrases keyed by (text, instructions, budget, hyde, tokenizer).
+    strategy:
+        ``"paraphrase"`` (default) rewrites with the LLM; ``"extractive"`` drops
+        low-information words locally (``promptfit.compressor``): no API calls, milliseconds,
+        and the result always fits the budget. ``hyde``, ``deadline`` and ``cache`` only
+        apply to paraphrasing.
+    trim:
+        Before compressing, spend the budget pruning left unused on the longest prefix of the
+        best segment that didn't fit, cut at a ``trim_boundary`` (``promptfit.trim``). The
+        pruned prompt then fits exactly, so it rarely needs compressing at all.
+    trim_boundary:
+        ``"word"`` (default) or ``"clause"``.
+    """
+    mode: str = "paraphrase_if_over_budget"
+    hyde: bool = True
+    deadline: Optional[float] = None
+    cache: bool = True
+    strategy: str = "paraphrase"
+    trim: bool = False
+    trim_boundary: str = "word"
+
+    def __post_init__(self):
+        if self.mode not in COMPRESSION_MODES:
+            raise ValueError(f"Unknown compression mode {self.mode!r}. Available: {list(COMPRESSION_MODES)}")
+        if self.strategy not in COMPRESSION_STRATEGIES:
+            raise ValueError(f"Unknown compression strategy {self.strategy!r}. Available: {list(COMPRESSION_STRATEGIES)}")
+        if self.trim_boundary not in TRIM_BOUNDARIES:
+            raise ValueError(f"Unknown trim boundary {self.trim_boundary!r}. Available: {list(TRIM_BOUNDARIES)}")
+        if self.deadline is not None and self.deadline < 0:
+            raise ValueError("deadline must be >= 0")
+
+
+DEFAULT_POLICY = CompressionPolicy()
@@ -0,0 +1,104 @@
+import re
+import zlib
+from collections import Counter
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np # type: ignore
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def query_terms(query: str) -> List[str]:
+    return list(dict.fromkeys(_words(query)))
+
+
+def term_counts(segments: Sequence[str], terms: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Occurrences of each of ``terms`` per segment, shape (n, len(terms)), and segment lengths in words."""
+    col = {t: j for j, t in enumerate(terms)}
+    tf = np.zeros((len(segments), len(terms)))
+    lengths = np.empty(len(segments))
+    for i, segment in enumerate(segments):
+        words = _words(segment)
+        lengths[i] = len(words)
+        for word in words:
+            j = col.get(word)
+            if j is not None:
+                tf[i, j] += 1
+    return tf, lengths
+
+
+def bm25_from_counts(tf: np.ndarray, lengths: np.ndarray, *, k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """BM25 from ``term_counts`` output; lets callers accumulate counts over a stream first."""
+    n = len(tf)
+    if n == 0 or tf.shape[1] == 0:
+        return np.zeros(n)
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    avgdl = lengths.mean() or 1.0
+    denom = tf + k1 * (1 - b + b * lengths[:, None] / avgdl)
+    return (tf * (k1 + 1) / denom) @ idf
+
+
+def bm25_scores(segments: Sequence[str], query: str, *, k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """Okapi BM25 score of every segment for ``query``, computed only over the query's terms."""
+    terms = query_terms(query)
+    if not segments or not terms:
+        return np.zeros(len(segments))
+    return bm25_from_counts(*term_counts(segments, terms), k1=k1, b=b)
+
+
+def _char_ngrams(text: str, n_min: int, n_max: int, n_features: int) -> Counter:
+    text = f" {' '.join(_words(text))} "
+    return Counter(
+        zlib.crc32(text[i:i + n].encode("utf-8")) % n_features
+        for n in range(n_min, n_max + 1)
+        for i in range(len(text) - n + 1)
+    )
+
+
+def ngram_scores(segments: Sequence[str], query: str, *, ngram_range: Tuple[int, int] = (3, 5), n_features: int = 1 << 20) -> np.ndarray:
+    """Cosine similarity of hashed character n-gram counts; robust to inflection and typos."""
+    q = _char_ngrams(query, ngram_range[0], ngram_range[1], n_features)
+    q_norm = np.sqrt(sum(v * v for v in q.values())) or 1.0
+    scores = np.zeros(len(segments))
+    for i, segment in enumerate(segments):
+        s = _char_ngrams(segment, ngram_range[0], ngram_range[1], n_features)
+        dot = sum(v * s[h] for h, v in q.items() if h in s)
+        if dot:
+            scores[i] = dot / (q_norm * np.sqrt(sum(v * v for v in s.values())))
+    return scores
+
+
+PRERANKERS: Dict[str, Callable[..., np.ndarray]] = {
+    "bm25": bm25_scores,
+    "ngram": ngram_scores,
+}
+
+
+def shortlist(segments: Sequence[str], query: str, top_n: int, *, method: str = "bm25") -> Tuple[np.ndarray, np.ndarray]:
+    """Return ``(indices, scores)`` of the ``top_n`` best lexical matches, best first.
+
+    Ties keep their original order, so with no lexical overlap at all the shortlist is
+    simply the first ``top_n`` segments.
+    """
+    if method not in PRERANKERS:
+        raise ValueError(f"Unknown prerank method {method!r}. Available: {sorted(PRERANKERS)}")
+    scores = PRERANKERS[method](segments, query)
+    if top_n >= len(segments):
+        idx = np.argsort(-scores, kind="stable")
+    else:
+        # argpartition picks the candidates in O(n); only those get sorted
+        part = np.argpartition(-scores, top_n - 1)[:top_n]
+        idx = part[np.lexsort((part, -scores[part]))]
+    return idx, scores[idx]
+
+
+def fuse_scores(dense: np.ndarray, lexical: np.ndarray, weight: float) -> np.ndarray:
+    """Blend cosine scores with min-max normalized lexical scores: ``(1 - weight) * dense + weight * lexical``."""
+    lo, hi = float(lexical.min()), float(lexical.max())
+    lex = (lexical - lo) / (hi - lo) if hi > lo else np.zeros_like(lexical)
+    return (1.0 - weight) * dense + weight * lex
@@ -0,0 +1,286 @@
+"""Embedding providers: where relevance vectors come from.
+
+``get_provider`` resolves a provider instance, a registered name or ``None`` (the default,
+``PROMPTFIT_EMBEDDINGS`` or ``"cohere"``). Providers are callable like a
+``get_embeddings_fn``, so they plug into ``rank_segments_by_relevance`` and friends.
+
+Local providers need no network round-trip:
+
+- ``"hashing"``: signed feature hashing of words and word bigrams (optionally followed by a
+  random projection), pure NumPy, lexical rather than semantic similarity.
+- ``"onnx"``: a locally stored ONNX encoder plus its ``tokenizer.json``, run on CPU with
+  ``onnxruntime``; batches are spread over a thread pool.
+- ``"sentence-transformers"``: local sentence-transformers weights on CPU.
+
+The ONNX and sentence-transformers providers read their model path from
+``PROMPTFIT_EMBED_MODEL`` when created by name.
+"""
+import os
+import re
+import math
+import zlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np # type: ignore
+
+from .config import (
+    COHERE_EMBED_MODEL,
+    DEFAULT_EMBEDDING_PROVIDER,
+    EMBED_MAX_CONCURRENCY,
+    EMBEDDING_PROVIDER_ENV,
+    HASHING_EMBED_DIM,
+    LOCAL_EMBED_MODEL_ENV,
+)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class EmbeddingProvider:
+    """Base class for embedding backends. Subclasses implement ``encode``.
+
+    ``embed`` returns a float32 array of shape (n_texts, dim). When ``cache_model`` is set,
+    vectors go through the shared embedding cache under that model name.
+    """
+
+    name = "base"
+    cache_model: Optional[str] = None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed(self, texts: Sequence[str], input_type: str = "search_document") -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self.cache_model is None:
+            return np.asarray(self.encode(texts), dtype=np.float32)
+
+        from .embedder import get_embedding_cache
+        cache = get_embedding_cache()
+        found = cache.get_many(self.cache_model, input_type, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, found) if v is None))
+        fresh: Dict[str, np.ndarray] = {}
+        if missing:
+            vectors = np.asarray(self.encode(missing), dtype=np.float32)
+            cache.put_many(self.cache_model, input_type, missing, vectors)
+            fresh = dict(zip(missing, vectors))
+        return np.stack([fresh[t] if v is None else v for t, v in zip(texts, found)]).astype(np.float32, copy=False)
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        return self.embed(texts)
+
+
+class CohereProvider(EmbeddingProvider):
+    """Remote Cohere embeddings via ``embedder.get_embeddings_array`` (pooled client, shared cache)."""
+
+    name = "cohere"
+
+    def __init__(self, model: str = COHERE_EMBED_MODEL, input_type: str = "search_document", *, max_concurrency: int = 1):
+        self.model = model
+        self.input_type = input_type
+        self.max_concurrency = max_concurrency
+
+    def embed(self, texts, input_type=None):
+        from .embedder import get_embeddings_array
+        return get_embeddings_array(list(texts), input_type or self.input_type, self.model, max_concurrency=self.max_concurrency)
+
+
+class HashingProvider(EmbeddingProvider):
+    """Feature-hashed bag of words and bigrams with sublinear term frequency.
+
+    Each n-gram lands in one of ``dim`` buckets with a hash-derived sign, so collisions
+    cancel out on average. ``projection_dim`` adds a seeded sparse random projection
+    (Achlioptas) to shrink the vectors. Rows are L2-normalized.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = HASHING_EMBED_DIM, *, ngram_range: Tuple[int, int] = (1, 2),
+                 projection_dim: Optional[int] = None, seed: int = 0):
+        if dim <= 0:
+            raise ValueError("dim must be > 0")
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self._projection = None
+        if projection_dim:
+            rng = np.random.default_rng(seed)
+            signs = rng.choice(np.array([-1.0, 0.0, 1.0], dtype=np.float32), size=(dim, projection_dim), p=[1 / 6, 2 / 3, 1 / 6])
+            self._projection = signs * np.float32(np.sqrt(3.0 / projection_dim))
+
+    def _features(self, text: str) -> Counter:
+        words = _WORD_RE.findall(text.lower())
+        lo, hi = self.ngram_range
+        grams: Counter = Counter()
+        for n in range(lo, hi + 1):
+            for i in range(len(words) - n + 1):
+                grams[zlib.crc32(" ".join(words[i:i + n]).encode("utf-8"))] += 1
+        return grams
+
+    def encode(self, texts):
+        rows: List[int] = []
+        cols: List[int] = []
+        vals: List[float] = []
+        for r, text in enumerate(texts):
+            for h, tf in self._features(text).items():
+                rows.append(r)
+                cols.append(h % self.dim)
+                vals.append((1.0 + math.log(tf)) * (1.0 if h >> 31 else -1.0))
+        flat = np.asarray(rows, dtype=np.int64) * self.dim + np.asarray(cols, dtype=np.int64)
+        out = np.bincount(flat, weights=vals, minlength=len(texts) * self.dim).astype(np.float32).reshape(len(texts), self.dim)
+        if self._projection is not None:
+            out = out @ self._projection
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+def _map_batches(fn: Callable[[List[str]], np.ndarray], texts: List[str], batch_size: int, threads: int) -> np.ndarray:
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if threads <= 1 or len(batches) <= 1:
+        return np.concatenate([fn(b) for b in batches])
+    with ThreadPoolExecutor(max_workers=min(threads, len(batches))) as pool:
+        return np.concatenate(list(pool.map(fn, batches)))
+
+
+class ONNXProvider(EmbeddingProvider):
+    """Transformer encoder exported to ONNX, run on CPU with ``onnxruntime``.
+
+    Texts are tokenized with the ``tokenizers`` library (``tokenizer.json`` next to the
+    model by default), truncated to ``max_length``, padded per batch, and the token
+    outputs are mean-pooled over the attention mask (``pooling="cls"`` takes the first
+    token). Models whose first output is already 2D are used as-is. ``threads`` batches
+    run in parallel; onnxruntime releases the GIL while running.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, tokenizer_path: Optional[str] = None, *, max_length: int = 256,
+                 batch_size: int = 32, threads: int = EMBED_MAX_CONCURRENCY, pooling: str = "mean",
+                 normalize: bool = True, cache: bool = True):
+        try:
+            import onnxruntime as ort # type: ignore
+            from tokenizers import Tokenizer # type: ignore
+        except ImportError as e:
+            raise ImportError("onnxruntime and tokenizers are required for ONNXProvider.") from e
+        if pooling not in ("mean", "cls"):
+            raise ValueError("pooling must be 'mean' or 'cls'")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1 if threads > 1 else 0  # parallelism comes from the batch threads
+        self._session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(tokenizer_path or os.path.join(os.path.dirname(model_path), "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length)
+        if self._tokenizer.padding is None:
+            self._tokenizer.enable_padding()
+        self.batch_size = batch_size
+        self.threads = threads
+        self.pooling = pooling
+        self.normalize = normalize
+        self.cache_model = f"onnx:{os.path.abspath(model_path)}" if cache else None
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {"input_ids": ids, "attention_mask": mask, "token_type_ids": np.zeros_like(ids)}
+        out = self._session.run(None, {k: v for k, v in feed.items() if k in self._input_names})[0]
+        if out.ndim == 3:
+            if self.pooling == "cls":
+                out = out[:, 0]
+            else:
+                m = mask[:, :, None].astype(np.float32)
+                out = (out * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1.0)
+        out = out.astype(np.float32, copy=False)
+        if self.normalize:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            out = out / norms
+        return out
+
+    def encode(self, texts):
+        return _map_batches(self._encode_batch, texts, self.batch_size, self.threads)
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """Local sentence-transformers model on CPU (pass a directory to stay offline)."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name_or_path: str, *, batch_size: int = 32, device: str = "cpu",
+                 normalize: bool = True, cache: bool = True, **model_kwargs):
+        try:
+            from sentence_transformers import SentenceTransformer # type: ignore
+        except ImportError as e:
+            raise ImportError("sentence-transformers is required for SentenceTransformerProvider.") from e
+        self._model = SentenceTransformer(model_name_or_path, device=device, **model_kwargs)
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.cache_model = f"st:{model_name_or_path}" if cache else None
+
+    def encode(self, texts):
+        return self._model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize,
+            show_progress_bar=False,
+        )
+
+
+# ----- registry -----
+
+ProviderSpec = Union[None, str, EmbeddingProvider, Callable[[List[str]], List[List[float]]]]
+
+_registry: Dict[str, Callable[[], EmbeddingProvider]] = {}
+_instances: Dict[str, EmbeddingProvider] = {}
+_registry_lock = threading.Lock()
+_default_name: Optional[str] = None
+
+
+def register_provider(name: str, factory: Callable[[], EmbeddingProvider]) -> None:
+    """Register a provider factory under ``name``. The factory is called once, on first use."""
+    with _registry_lock:
+        _registry[name] = factory
+        _instances.pop(name, None)
+
+
+def available_providers() -> List[str]:
+    return sorted(_registry)
+
+
+def set_default_provider(name: Optional[str]) -> None:
+    """Select the provider used when none is passed. ``None`` restores the configured default."""
+    global _default_name
+    if name is not None and name not in _registry:
+        raise KeyError(f"Unknown embedding provider {name!r}. Available: {available_providers()}")
+    _default_name = name
+
+
+def default_provider_name() -> str:
+    return _default_name or os.getenv(EMBEDDING_PROVIDER_ENV) or DEFAULT_EMBEDDING_PROVIDER
+
+
+def get_provider(provider: ProviderSpec = None) -> Callable[[List[str]], List[List[float]]]:
+    """Resolve a provider instance (or any ``get_embeddings_fn``), a registered name, or ``None``."""
+    if provider is not None and not isinstance(provider, str):
+        return provider
+    name = provider or default_provider_name()
+    instance = _instances.get(name)
+    if instance is None:
+        with _registry_lock:
+            instance = _instances.get(name)
+            if instance is None:
+                if name not in _registry:
+                    raise KeyError(f"Unknown embedding provider {name!r}. Available: {available_providers()}")
+                instance = _registry[name]()
+                _instances[name] = instance
+    return instance
+
+
+register_provider("cohere", CohereProvider)
+register_provider("hashing", HashingProvider)
+register_provider("onnx", lambda: ONNXProvider(os.environ[LOCAL_EMBED_MODEL_ENV]))
+register_provider("sentence-transformers", lambda: SentenceTransformerProvider(os.environ[LOCAL_EMBED_MODEL_ENV]))
@@ -0,0 +1,191 @@
+"""Compact embedding matrices with vectorized scoring.
+
+``QuantizedEmbeddings.from_float`` L2-normalizes rows once and stores them as:
+
+- ``"float32"``: 4 bytes per dimension, exact cosine scores;
+- ``"int8"``: 1 byte per dimension plus one float32 scale per row (4x smaller). The query
+  stays float32, so each score is off by at most ``scale / 2 * ||query||_1``; see
+  ``error_bound`` and ``certified_top_k``;
+- ``"binary"``: 1 bit per dimension (32x smaller), scored by Hamming distance as
+  ``1 - 2 * hamming / dim``. Use it as a first pass and rerank the shortlist
+  (``top_k(..., rerank=...)``); ``recall_at_k`` measures what the first pass loses.
+"""
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple, Union
+
+import numpy as np # type: ignore
+
+KINDS = ("float32", "int8", "binary")
+
+# int8 codes are widened to float32 a cache-sized block at a time when scoring
+_BLOCK_BYTES = 1 << 21
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def l2_normalize(arr, *, inplace: bool = False) -> np.ndarray:
+    """Return ``arr`` as float32 with unit-length rows (zero rows stay zero)."""
+    arr = np.asarray(arr, dtype=np.float32)
+    norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    if inplace and arr.flags.writeable:
+        arr /= norms
+        return arr
+    return arr / norms
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT[x]
+
+
+def hamming_distances(query_bits: np.ndarray, bits: np.ndarray) -> np.ndarray:
+    """Hamming distance between packed bit rows: (n,) for one query, (q, n) for several."""
+    query_bits = np.asarray(query_bits, dtype=np.uint8)
+    if query_bits.ndim == 1:
+        return _popcount(np.bitwise_xor(bits, query_bits)).sum(axis=1, dtype=np.int32)
+    out = np.empty((len(query_bits), len(bits)), dtype=np.int32)
+    for i, q in enumerate(query_bits):
+        out[i] = _popcount(np.bitwise_xor(bits, q)).sum(axis=1, dtype=np.int32)
+    return out
+
+
+@dataclass
+class QuantizedEmbeddings:
+    """A matrix of normalized embeddings in one of ``KINDS``."""
+
+    kind: str
+    codes: np.ndarray
+    dim: int
+    scales: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_float(cls, embs, kind: str = "int8", *, normalized: bool = False) -> "QuantizedEmbeddings":
+        if kind not in KINDS:
+            raise ValueError(f"Unknown quantization {kind!r}. Available: {list(KINDS)}")
+        embs = np.asarray(embs, dtype=np.float32)
+        if embs.ndim != 2:
+            raise ValueError("Embeddings must be 2D (n_texts, dim)")
+        if not normalized:
+            embs = l2_normalize(embs)
+        dim = embs.shape[1]
+        if kind == "float32":
+            return cls(kind, np.ascontiguousarray(embs), dim)
+        if kind == "int8":
+            scales = np.abs(embs).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.rint(embs / scales[:, None]).astype(np.int8)
+            return cls(kind, codes, dim, scales.astype(np.float32))
+        return cls(kind, np.packbits(embs > 0, axis=1), dim)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def take(self, indices) -> "QuantizedEmbeddings":
+        return QuantizedEmbeddings(self.kind, self.codes[indices], self.dim, None if self.scales is None else self.scales[indices])
+
+    def dequantize(self) -> np.ndarray:
+        """Approximate float32 rows (binary codes become +-1/sqrt(dim))."""
+        if self.kind == "float32":
+            return self.codes
+        if self.kind == "int8":
+            return self.codes.astype(np.float32) * self.scales[:, None]
+        bits = np.unpackbits(self.codes, axis=1, count=self.dim).astype(np.float32)
+        return (2.0 * bits - 1.0) / np.float32(np.sqrt(self.dim))
+
+    def scores(self, query) -> np.ndarray:
+        """Cosine scores of one query (shape (n,)) or several (shape (q, n))."""
+        q = l2_normalize(query)
+        if q.shape[-1] != self.dim:
+            raise ValueError(f"Dimension mismatch: query dim {q.shape[-1]} vs segment dim {self.dim}")
+        if self.kind == "float32":
+            return q @ self.codes.T
+        if self.kind == "int8":
+            rows = max(64, _BLOCK_BYTES // (4 * self.dim))
+            buf = np.empty((min(rows, len(self)), self.dim), dtype=np.float32)
+            out = np.empty(q.shape[:-1] + (len(self),), dtype=np.float32)
+            for start in range(0, len(self), rows):
+                codes = self.codes[start:start + rows]
+                block = buf[:len(codes)]
+                np.copyto(block, codes)
+                out[..., start:start + len(codes)] = q @ block.T
+            out *= self.scales
+            return out
+        hamming = hamming_distances(np.packbits(q > 0, axis=-1), self.codes)
+        return 1.0 - 2.0 * hamming.astype(np.float32) / self.dim
+
+    def error_bound(self, query) -> np.ndarray:
+        """Per-row bound on ``|scores(query) - exact cosine|`` (int8 and float32 only)."""
+        if self.kind == "binary":
+            raise ValueError("binary codes have no deterministic error bound; rerank and measure recall_at_k")
+        if self.kind == "float32":
+            return np.zeros(len(self), dtype=np.float32)
+        q1 = float(np.abs(l2_normalize(query)).sum())
+        return self.scales * np.float32(0.5 * q1)
+
+    def certified_top_k(self, query, k: int) -> np.ndarray:
+        """Indices that provably contain the exact top ``k``: every row whose upper bound
+        reaches the ``k``-th best lower bound. Rerank these with exact vectors for zero loss."""
+        scores = self.scores(query)
+        if k >= len(scores):
+            return np.arange(len(scores))
+        err = self.error_bound(query)
+        kth_lower = np.partition(scores - err, -k)[-k]
+        return np.flatnonzero(scores + err >= kth_lower)
+
+    def top_k(
+        self,
+        query,
+        k: int,
+        *,
+        oversample: int = 4,
+        rerank: Optional[Union["QuantizedEmbeddings", np.ndarray, Callable[[np.ndarray], np.ndarray]]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Best ``k`` rows for one query, best first, as (indices, scores).
+
+        With ``rerank`` (exact float rows, another ``QuantizedEmbeddings`` or a function
+        mapping indices to float rows) the ``k * oversample`` approximate best are rescored.
+        """
+        scores = self.scores(query)
+        n = len(scores)
+        k = min(k, n)
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        m = n if rerank is None else min(n, k * max(1, oversample))
+        cand = np.argpartition(-scores, m - 1)[:m] if m < n else np.arange(n)
+        if rerank is not None:
+            if isinstance(rerank, QuantizedEmbeddings):
+                cand_scores = rerank.take(cand).scores(query)
+            else:
+                rows = rerank(cand) if callable(rerank) else np.asarray(rerank)[cand]
+                cand_scores = l2_normalize(rows) @ l2_normalize(query)
+        else:
+            cand_scores = scores[cand]
+        order = np.argsort(-cand_scores, kind="stable")[:k]
+        return cand[order], cand_scores[order]
+
+
+def recall_at_k(exact_scores, approx_scores, k: int) -> float:
+    """Fraction of the exact top ``k`` that the approximate scores also rank in their top ``k``."""
+    exact_scores = np.asarray(exact_scores)
+    approx_scores = np.asarray(approx_scores)
+    k = min(k, exact_scores.shape[-1])
+    if k <= 0:
+        return 1.0
+    exact = np.argpartition(-exact_scores, k - 1, axis=-1)[..., :k]
+    approx = np.argpartition(-approx_scores, k - 1, axis=-1)[..., :k]
+    if exact.ndim == 1:
+        return len(np.intersect1d(exact, approx)) / k
+    return float(np.mean([len(np.intersect1d(e, a)) / k for e, a in zip(exact, approx)]))
+
+
+def estimate_recall(embs, queries, kind: str, k: int = 10) -> float:
+    """Mean recall@k of ``kind`` scores against exact float32 cosine over ``queries``."""
+    exact = QuantizedEmbeddings.from_float(embs, "float32")
+    approx = QuantizedEmbeddings.from_float(embs, kind)
+    return recall_at_k(exact.scores(queries), approx.scores(queries), k)
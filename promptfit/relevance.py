@@ -1,36 +1,83 @@
-from typing import List, Tuple, Callable, Optional, Sequence
+import os
+from typing import List, Tuple, Callable, Optional, Sequence, Union
 import numpy as np # type: ignore
-from sklearn.metrics.pairwise import cosine_similarity
 
-def _l2_normalize(arr: np.ndarray) -> np.ndarray:
-    norms = np.linalg.norm(arr, axis=1, keepdims=True)
-    norms[norms == 0] = 1.0
-    return arr / norms
+from .config import RANK_PARALLEL_MIN_SEGMENTS, RANK_WORKERS_ENV
+from .prerank import fuse_scores, shortlist
+from .quantize import QuantizedEmbeddings, l2_normalize
+from .shared_rank import SharedArray, parallel_top_k, top_k_indices
 
-def _call_get_embeddings_batched(texts: Sequence[str], get_embeddings_fn: Callable[[List[str]], List[List[float]]], batch_size: int) -> np.ndarray:
+def _l2_normalize(arr: np.ndarray, inplace: bool = False) -> np.ndarray:
+    return l2_normalize(arr, inplace=inplace)
+
+def _call_get_embeddings_batched(
+    texts: Sequence[str],
+    get_embeddings_fn: Callable[[List[str]], List[List[float]]],
+    batch_size: int,
+    *,
+    normalize: bool = False,
+    allocate: Optional[Callable[[Tuple[int, int]], np.ndarray]] = None,
+) -> np.ndarray:
+    """Embed ``texts`` in batches into one contiguous float32 (n_texts, dim) array.
+
+    Batches may come back as lists or arrays; each is copied once into the preallocated
+    result (made by ``allocate(shape)`` if given, e.g. in shared memory).
+    ``normalize=True`` L2-normalizes the rows in place.
+    """
     if batch_size <= 0:
         raise ValueError("batch_size must be > 0")
-    all_embs = []
+    out: Optional[np.ndarray] = None
     for i in range(0, len(texts), batch_size):
         batch = texts[i : i + batch_size]
         batch_embs = get_embeddings_fn(list(batch))
         if batch_embs is None:
             raise ValueError("get_embeddings_fn returned None for batch")
-        all_embs.extend(batch_embs)
-    arr = np.array(all_embs)
-    if arr.ndim != 2:
+        arr = np.asarray(batch_embs, dtype=np.float32)
+        if arr.ndim != 2:
+            raise ValueError("Embeddings must be 2D (n_texts, dim)")
+        if arr.shape[0] != len(batch):
+            raise ValueError("Number of embeddings does not match number of texts")
+        if out is None:
+            shape = (len(texts), arr.shape[1])
+            out = np.empty(shape, dtype=np.float32) if allocate is None else allocate(shape)
+        elif arr.shape[1] != out.shape[1]:
+            raise ValueError("Embeddings must be 2D (n_texts, dim)")
+        out[i : i + len(batch)] = arr
+    if out is None:
         raise ValueError("Embeddings must be 2D (n_texts, dim)")
-    return arr
+    return _l2_normalize(out, inplace=True) if normalize else out
 
 def compute_cosine_similarities(reference_emb: Sequence[float], segment_embs: Sequence[Sequence[float]]) -> List[float]:
-    ref = np.array(reference_emb).reshape(1, -1)
-    segs = np.array(segment_embs)
+    ref = np.asarray(reference_emb, dtype=np.float32).reshape(1, -1)
+    segs = np.asarray(segment_embs, dtype=np.float32)
     if ref.shape[1] != segs.shape[1]:
         raise ValueError(f"Dimension mismatch: reference dim {ref.shape[1]} vs segment dim {segs.shape[1]}")
-    ref_n = _l2_normalize(ref)
-    segs_n = _l2_normalize(segs)
-    sims = float(ref_n.dot(segs_n.T)) if segs_n.shape[0] == 1 else (ref_n @ segs_n.T)[0]
-    return sims.tolist() if isinstance(sims, np.ndarray) else [sims] # type: ignore
+    return (_l2_normalize(segs) @ _l2_normalize(ref)[0]).tolist()
+
+def similarity_matrix(
+    query_embs: Sequence[Sequence[float]],
+    segment_embs: Union[Sequence[Sequence[float]], QuantizedEmbeddings],
+    *,
+    normalized: bool = False,
+) -> np.ndarray:
+    """Cosine similarity of every query against every segment in one matmul: shape (n_queries, n_segments).
+
+    ``segment_embs`` may be a ``QuantizedEmbeddings`` (int8/binary codes are scored directly);
+    ``normalized=True`` skips re-normalizing inputs whose rows are already unit length.
+    """
+    q = np.asarray(query_embs, dtype=np.float32)
+    if isinstance(segment_embs, QuantizedEmbeddings):
+        if q.ndim != 2:
+            raise ValueError("Embeddings must be 2D (n_texts, dim)")
+        return segment_embs.scores(q)
+    s = np.asarray(segment_embs, dtype=np.float32)
+    if q.ndim != 2 or s.ndim != 2:
+        raise ValueError("Embeddings must be 2D (n_texts, dim)")
+    if q.shape[1] != s.shape[1]:
+        raise ValueError(f"Dimension mismatch: query dim {q.shape[1]} vs segment dim {s.shape[1]}")
+    if normalized:
+        return q @ s.T
+    return _l2_normalize(q) @ _l2_normalize(s).T
 
 def rank_segments_by_relevance(
     segments: List[str],
@@ -40,8 +87,24 @@ def rank_segments_by_relevance(
     top_k: Optional[int] = None,
     batch_size: int = 128,
     hyde: bool = False,
-    llm_expand_fn: Optional[Callable[[str], str]] = None
+    llm_expand_fn: Optional[Callable[[str], str]] = None,
+    prerank_top_n: Optional[int] = None,
+    prerank_method: str = "bm25",
+    fusion_weight: float = 0.3,
+    workers: Optional[int] = None,
 ) -> List[Tuple[str, float]]:
+    """Rank segments by cosine similarity to ``reference``, best first.
+
+    With ``prerank_top_n`` a local lexical ranker (``prerank_method``: "bm25" or "ngram")
+    first shortlists that many segments; only the shortlist is embedded and returned, scored
+    by ``(1 - fusion_weight) * cosine + fusion_weight * normalized lexical score``.
+
+    With ``workers`` (default: ``PROMPTFIT_RANK_WORKERS``) greater than one and at least
+    ``RANK_PARALLEL_MIN_SEGMENTS`` segments, embeddings are written straight into shared
+    memory and scored by that many processes (``promptfit.shared_rank``), which return every
+    score when lexical scores are to be fused in. Either way only the returned ``top_k`` are
+    sorted and turned into tuples.
+    """
     if not isinstance(segments, list):
         raise TypeError("segments must be a list of strings")
     if reference is None:
@@ -56,22 +119,48 @@ def rank_segments_by_relevance(
     if hyde:
         reference_for_embedding = llm_expand_fn(reference_for_embedding) # type: ignore
 
-    texts = [reference_for_embedding] + segments
-    embs = _call_get_embeddings_batched(texts, get_embeddings_fn, batch_size)
-    ref_emb = embs[0]
-    seg_embs = embs[1:]
+    lexical = None
+    if prerank_top_n is not None and prerank_top_n < len(segments):
+        if prerank_top_n <= 0:
+            raise ValueError("prerank_top_n must be > 0")
+        idx, lexical = shortlist(segments, reference, prerank_top_n, method=prerank_method)
+        segments = [segments[i] for i in idx]
 
-    if seg_embs.shape[0] != len(segments):
-        raise ValueError("Number of segment embeddings does not match number of segments")
+    texts = [reference_for_embedding] + segments
+    if workers is None:
+        workers = int(os.getenv(RANK_WORKERS_ENV) or 1)
+    if workers > 1 and len(segments) >= RANK_PARALLEL_MIN_SEGMENTS:
+        shared: List[SharedArray] = []
 
-    # normalize and compute similarities efficiently
-    ref_n = _l2_normalize(ref_emb.reshape(1, -1))
-    segs_n = _l2_normalize(seg_embs)
-    sims = (ref_n @ segs_n.T)[0]
+        def allocate(shape):
+            shared.append(SharedArray(shape, np.float32))
+            return shared[0].array
 
-    pairs = list(zip(segments, sims.tolist()))
-    pairs.sort(key=lambda x: x[1], reverse=True)
+        embs = None
+        try:
+            embs = _call_get_embeddings_batched(texts, get_embeddings_fn, batch_size, normalize=True, allocate=allocate)
+            # Row 0 is the reference itself: ask for one extra row and drop it. Fusion needs
+            # every cosine score, so then all rows come back.
+            k = None if top_k is None or lexical is not None else top_k + 1
+            order, scores = parallel_top_k(shared[0], embs[0], k, workers=workers)
+        finally:
+            del embs  # release the view before unmapping the block
+            for block in shared:
+                block.close()
+        keep = order != 0
+        order, scores = order[keep] - 1, scores[keep]
+        if lexical is not None:
+            sims = np.empty(len(segments), dtype=np.float32)
+            sims[order] = scores
+            sims = fuse_scores(sims, lexical, fusion_weight)
+            order = top_k_indices(sims, top_k)
+            scores = sims[order]
+        return list(zip([segments[i] for i in order], scores.tolist()))[:top_k]
 
-    if top_k is not None:
-        return pairs[:top_k]
-    return pairs
+    # One float32 array, normalized once in place
+    embs = _call_get_embeddings_batched(texts, get_embeddings_fn, batch_size, normalize=True)
+    sims = embs[1:] @ embs[0]
+    if lexical is not None:
+        sims = fuse_scores(sims, lexical, fusion_weight)
+    order = top_k_indices(sims, top_k)
+    return list(zip([segments[i] for i in order], sims[order].tolist()))
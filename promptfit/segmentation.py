@@ -0,0 +1,171 @@
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+# ----- punkt (loaded once, never downloaded) -----
+
+_punkt: Dict[str, object] = {}
+_punkt_lock = threading.Lock()
+
+
+def load_punkt(language: str = "english"):
+    """Return a cached punkt tokenizer, or ``None`` if its data isn't installed locally.
+
+    The lookup happens once per language; install the data ahead of time with
+    ``python -m nltk.downloader punkt_tab`` (segmentation never downloads it).
+    """
+    if language not in _punkt:
+        with _punkt_lock:
+            if language not in _punkt:
+                tokenizer = None
+                try:
+                    from nltk.tokenize import PunktTokenizer  # type: ignore
+                    tokenizer = PunktTokenizer(language)
+                except (ImportError, LookupError, OSError):
+                    try:
+                        import nltk  # type: ignore
+                        tokenizer = nltk.data.load(f"tokenizers/punkt/{language}.pickle")
+                    except (ImportError, LookupError, OSError, ValueError):
+                        tokenizer = None
+                _punkt[language] = tokenizer
+    return _punkt[language]
+
+
+def split_punkt(text: str) -> List[str]:
+    tokenizer = load_punkt()
+    if tokenizer is None:
+        raise LookupError("punkt data not found; install it with `python -m nltk.downloader punkt_tab`")
+    return tokenizer.tokenize(text)  # type: ignore
+
+
+# ----- rule-based sentence splitter -----
+
+_ABBREVIATIONS = frozenset(
+    "mr mrs ms dr prof sr jr st vs etc e.g i.e cf al inc ltd co corp fig no nos vol approx dept est "
+    "jan feb mar apr jun jul aug sep sept oct nov dec mon tue wed thu fri sat sun u.s u.k".split()
+)
+# Sentence-final punctuation, optional closing quotes/brackets, whitespace, then a plausible sentence start;
+# blank lines always separate.
+_BOUNDARY_RE = re.compile(r"""(?<=[.!?])(["')\]”’]*)\s+(?=["'(\[“‘]?[A-Z0-9])|\n[ \t]*\n\s*""")
+
+
+def split_regex(text: str) -> List[str]:
+    """Split prose into sentences with compiled rules (abbreviation- and initial-aware)."""
+    sentences = []
+    start = 0
+    for m in _BOUNDARY_RE.finditer(text):
+        punct = m.start()
+        end = m.end(1) if m.group(1) is not None else punct  # keep closing quotes with the sentence
+        if text[punct - 1:punct] == ".":
+            word_start = max(text.rfind(" ", start, punct), text.rfind("\n", start, punct), start - 1) + 1
+            word = text[word_start:punct - 1].lstrip("\"'([")
+            # "Dr. Smith", "e.g. Foo", "J. Doe": not a boundary
+            if word.lower() in _ABBREVIATIONS or (len(word) == 1 and word.isupper()):
+                continue
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = m.end()
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+# ----- structure-aware splitter -----
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_HEADING_RE = re.compile(r"^\s{0,3}#{1,6}\s")
+_BULLET_RE = re.compile(r"^\s*(?:[-*+•]|\d{1,3}[.)])\s+")
+_EXAMPLE_RE = re.compile(r"^\s*(?:#+\s*)?(?:example|sample|shot)\s*#?\d*\s*[:.)-]", re.IGNORECASE)
+_ROLE_RE = re.compile(r"^\s*(?:q|a|question|answer|input|output|user|assistant|human|ai|system)\s*:", re.IGNORECASE)
+
+
+def split_structured(text: str, sentence_splitter: Optional[Callable[[str], List[str]]] = None) -> List[str]:
+    """Split markdown-ish prompts along their structure.
+
+    Fenced code blocks, headings, list items and few-shot examples (an ``Example N:`` line
+    plus the lines up to the next blank line or example) each stay whole; ``Q:``/``User:``
+    style turns start new segments; remaining prose is split into sentences.
+    """
+    split_prose = sentence_splitter or split_sentences
+    segments: List[str] = []
+    block: List[str] = []
+    kind = None  # None (prose), "code", "item", "example"
+
+    def flush():
+        nonlocal block, kind
+        if block:
+            if kind is None:
+                segments.extend(split_prose("\n".join(block)))
+            else:
+                segment = "\n".join(block).strip("\n")
+                if segment.strip():
+                    segments.append(segment if kind == "code" else segment.strip())
+        block, kind = [], None
+
+    for line in text.splitlines():
+        if kind == "code":
+            block.append(line)
+            if _FENCE_RE.match(line):
+                flush()
+            continue
+        if _FENCE_RE.match(line):
+            flush()
+            block, kind = [line], "code"
+        elif not line.strip():
+            flush()
+        elif _HEADING_RE.match(line) and not _EXAMPLE_RE.match(line):
+            flush()
+            segments.append(line.strip())
+        elif _EXAMPLE_RE.match(line):
+            flush()
+            block, kind = [line], "example"
+        elif kind == "example":
+            block.append(line)
+        elif _BULLET_RE.match(line) or _ROLE_RE.match(line):
+            flush()
+            block, kind = [line], "item"
+        elif kind == "item" and line[:1].isspace():
+            block.append(line)  # continuation of a list item
+        else:
+            if kind is not None:
+                flush()
+            block.append(line)
+    flush()
+    return segments
+
+
+# ----- entry points -----
+
+def _split_auto(text: str) -> List[str]:
+    return split_punkt(text) if load_punkt() is not None else split_regex(text)
+
+
+SPLITTERS: Dict[str, Callable[[str], List[str]]] = {
+    "auto": _split_auto,
+    "punkt": split_punkt,
+    "regex": split_regex,
+    "structured": lambda text: split_structured(text, _split_auto),
+}
+
+
+def split_sentences(text: str, method: str = "auto") -> List[str]:
+    """Split ``text`` into segments without touching the network.
+
+    ``method``: ``"auto"`` (punkt when its data is installed, otherwise the rule-based
+    splitter), ``"punkt"``, ``"regex"`` or ``"structured"`` (markdown/list/code/few-shot aware).
+    """
+    if method not in SPLITTERS:
+        raise ValueError(f"Unknown segmentation method {method!r}. Available: {sorted(SPLITTERS)}")
+    return SPLITTERS[method](text)
+
+
+def split_many(texts: Iterable[str], method: str = "auto") -> List[List[str]]:
+    """Split many texts with one splitter lookup; returns one segment list per text."""
+    if method not in SPLITTERS:
+        raise ValueError(f"Unknown segmentation method {method!r}. Available: {sorted(SPLITTERS)}")
+    splitter = SPLITTERS[method]
+    if method == "auto":
+        splitter = split_punkt if load_punkt() is not None else split_regex
+    return [splitter(t) for t in texts]
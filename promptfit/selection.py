@@ -0,0 +1,210 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np # type: ignore
+
+# Knapsack DP tables larger than this (items x capacity cells) switch to scaled token weights
+DEFAULT_MAX_DP_CELLS = 4_000_000
+
+
+@dataclass
+class Selection:
+    """Segments chosen for a budget. ``indices`` refer to the input order and are listed in output order."""
+    indices: List[int]
+    scores: List[float]
+    tokens: int
+    method: str = "greedy"
+    approximate: bool = False
+    token_counts: List[int] = field(default_factory=list)
+
+
+def _by_relevance(scores: np.ndarray) -> np.ndarray:
+    # Stable, so ties keep their original order (as rank_segments_by_relevance does)
+    return np.argsort(-scores, kind="stable")
+
+
+def _fill(chosen: List[int], scores: np.ndarray, tokens: np.ndarray, budget: int, order: Optional[np.ndarray] = None) -> List[int]:
+    """Top up a selection with any remaining segments that still fit, most relevant first."""
+    used = int(tokens[chosen].sum()) if chosen else 0
+    taken = set(chosen)
+    for i in _by_relevance(scores) if order is None else order:
+        i = int(i)
+        if i not in taken and used + tokens[i] <= budget:
+            chosen.append(i)
+            taken.add(i)
+            used += int(tokens[i])
+    return chosen
+
+
+def select_greedy(scores: np.ndarray, tokens: np.ndarray, budget: int, **_) -> List[int]:
+    """Walk segments by descending relevance, skipping any that would overflow the budget."""
+    return _fill([], scores, tokens, budget)
+
+
+def _knapsack_table(scores: np.ndarray, tokens: np.ndarray, budget: int, max_cells: int):
+    """DP over capacities ``0..budget // scale``; returns (keep table, scaled weights, scale).
+
+    ``keep[i, c]`` records whether item ``i`` is taken in the best solution of capacity ``c``
+    over items ``0..i``, so one table answers every capacity up to ``budget``.
+    """
+    n = len(scores)
+    scale = max(1, int(np.ceil(n * (budget + 1) / max_cells)))
+    weights = -(-tokens // scale)  # ceil division
+    capacity = budget // scale
+    values = np.maximum(scores, 0.0)
+
+    dp = np.zeros(capacity + 1)
+    keep = np.zeros((n, capacity + 1), dtype=bool)
+    for i in range(n):
+        w = int(weights[i])
+        if values[i] <= 0 or w > capacity:
+            continue
+        cand = np.full(capacity + 1, -np.inf)
+        cand[w:] = dp[:capacity + 1 - w] + values[i]
+        take = cand > dp
+        keep[i] = take
+        dp = np.where(take, cand, dp)
+    return keep, weights, scale
+
+
+def _knapsack_backtrack(keep: np.ndarray, weights: np.ndarray, capacity: int, scores: np.ndarray) -> List[int]:
+    chosen = []
+    c = capacity
+    for i in range(len(keep) - 1, -1, -1):
+        if keep[i, c]:
+            chosen.append(i)
+            c -= int(weights[i])
+    chosen.sort(key=lambda i: (-scores[i], i))
+    return chosen
+
+
+def select_knapsack(scores: np.ndarray, tokens: np.ndarray, budget: int, *, max_cells: int = DEFAULT_MAX_DP_CELLS, **_) -> List[int]:
+    """0/1 knapsack maximizing total relevance within the budget (DP over token counts).
+
+    When ``n_segments * budget`` exceeds ``max_cells`` the token weights are divided by a
+    common factor and rounded up, which keeps every solution feasible at a small loss of
+    optimality. Leftover budget is then filled greedily.
+    """
+    if len(scores) == 0 or budget <= 0:
+        return _fill([], scores, tokens, budget)
+    keep, weights, scale = _knapsack_table(scores, tokens, budget, max_cells)
+    return _fill(_knapsack_backtrack(keep, weights, budget // scale, scores), scores, tokens, budget)
+
+
+def select_mmr(scores: np.ndarray, tokens: np.ndarray, budget: int, *, embeddings=None, diversity: float = 0.3, **_) -> List[int]:
+    """Maximal marginal relevance: trade relevance against similarity to already chosen segments.
+
+    Each step takes the fitting segment maximizing
+    ``(1 - diversity) * score - diversity * max_similarity_to_selected``.
+    """
+    if embeddings is None:
+        raise ValueError("selector='mmr' requires segment embeddings")
+    embs = np.asarray(embeddings, dtype=float)
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embs = embs / norms
+
+    n = len(scores)
+    remaining = np.ones(n, dtype=bool)
+    max_sim = np.zeros(n)
+    chosen: List[int] = []
+    used = 0
+    while True:
+        fits = remaining & (tokens <= budget - used)
+        if not fits.any():
+            break
+        mmr = (1.0 - diversity) * scores - diversity * max_sim
+        mmr[~fits] = -np.inf
+        i = int(np.argmax(mmr))
+        chosen.append(i)
+        remaining[i] = False
+        used += int(tokens[i])
+        max_sim = np.maximum(max_sim, embs @ embs[i])
+    return chosen
+
+
+SELECTORS: Dict[str, Callable[..., List[int]]] = {
+    "greedy": select_greedy,
+    "knapsack": select_knapsack,
+    "mmr": select_mmr,
+}
+
+
+def select_segments(
+    scores: Sequence[float],
+    token_counts: Sequence[int],
+    budget: int,
+    *,
+    method: str = "greedy",
+    preserve_order: bool = False,
+    embeddings=None,
+    **options,
+) -> Selection:
+    """Choose segments (given in original order) whose token counts fit ``budget``.
+
+    ``method`` is one of ``SELECTORS``: ``"greedy"`` (fast path), ``"knapsack"`` (fits the most
+    total relevance) or ``"mmr"`` (avoids redundant segments; needs ``embeddings``). With
+    ``preserve_order`` the chosen segments keep their original order instead of relevance order.
+    """
+    if method not in SELECTORS:
+        raise ValueError(f"Unknown selector {method!r}. Available: {sorted(SELECTORS)}")
+    if len(scores) != len(token_counts):
+        raise ValueError("scores and token_counts must have the same length")
+    s = np.asarray(scores, dtype=float)
+    t = np.asarray(token_counts, dtype=np.int64)
+    chosen = SELECTORS[method](s, t, budget, embeddings=embeddings, **options)
+    approximate = method == "knapsack" and len(s) * (budget + 1) > options.get("max_cells", DEFAULT_MAX_DP_CELLS)
+    return _selection(chosen, s, t, method, approximate, preserve_order)
+
+
+def _selection(chosen: List[int], s: np.ndarray, t: np.ndarray, method: str, approximate: bool, preserve_order: bool) -> Selection:
+    if preserve_order:
+        chosen = sorted(chosen)
+    return Selection(
+        indices=chosen,
+        scores=[float(s[i]) for i in chosen],
+        tokens=int(t[chosen].sum()) if chosen else 0,
+        method=method,
+        approximate=approximate,
+        token_counts=[int(t[i]) for i in chosen],
+    )
+
+
+def select_segments_multi(
+    scores: Sequence[float],
+    token_counts: Sequence[int],
+    budgets: Sequence[int],
+    *,
+    method: str = "greedy",
+    preserve_order: bool = False,
+    embeddings=None,
+    **options,
+) -> List[Selection]:
+    """``select_segments`` for several budgets at once, one ``Selection`` per budget.
+
+    With ``"knapsack"`` a single DP table sized for the largest budget is built and every
+    budget is read back from it, so nested budgets cost one DP instead of one each. Greedy
+    shares the relevance sort; MMR is run per budget.
+    """
+    if method not in SELECTORS:
+        raise ValueError(f"Unknown selector {method!r}. Available: {sorted(SELECTORS)}")
+    if len(scores) != len(token_counts):
+        raise ValueError("scores and token_counts must have the same length")
+    s = np.asarray(scores, dtype=float)
+    t = np.asarray(token_counts, dtype=np.int64)
+    budgets = [int(b) for b in budgets]
+    if not budgets:
+        return []
+    if method == "knapsack" and len(s) and max(budgets) > 0:
+        max_cells = options.get("max_cells", DEFAULT_MAX_DP_CELLS)
+        keep, weights, scale = _knapsack_table(s, t, max(budgets), max_cells)
+        approximate = scale > 1
+        out = []
+        for b in budgets:
+            chosen = _knapsack_backtrack(keep, weights, b // scale, s) if b > 0 else []
+            out.append(_selection(_fill(chosen, s, t, b), s, t, method, approximate, preserve_order))
+        return out
+    if method == "greedy":
+        order = _by_relevance(s)
+        return [_selection(_fill([], s, t, b, order), s, t, method, False, preserve_order) for b in budgets]
+    return [select_segments(s, t, b, method=method, preserve_order=preserve_order, embeddings=embeddings, **options) for b in budgets]
@@ -0,0 +1,253 @@
+"""Long-lived optimization server (``promptfit serve``).
+
+One process keeps the embedding/token caches and pooled clients warm, and funnels the
+embedding and token-count work of concurrent requests through ``MicroBatcher``s, so many
+small requests become a few large backend calls. JSON over HTTP, on TCP or a Unix socket:
+
+- ``POST /optimize`` ``{"prompt", "query", "max_tokens"?, "selector"?, "preserve_order"?, "mode"?, "strategy"?}``
+- ``GET /metrics`` request counts, latency, in-flight requests and per-batcher queue depth
+- ``GET /healthz``
+
+When ``max_inflight`` requests are already running, or a batch queue is full, requests get
+``503`` with ``Retry-After`` instead of queueing without bound.
+"""
+import os
+import json
+import time
+import dataclasses
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np # type: ignore
+
+from .concurrency import MicroBatcher, Overloaded
+from .config import DEFAULT_MAX_TOKENS
+from .optimizer import optimize_prompt_detailed
+from .policy import CompressionPolicy, DEFAULT_POLICY
+from .providers import ProviderSpec, get_provider
+from .selection import SELECTORS
+from .tokenizer_backends import TokenizerBackend, TokenizerSpec, get_tokenizer
+from .utils import split_sentences
+
+
+class BatchingTokenizer(TokenizerBackend):
+    """Routes ``count_many`` through a ``MicroBatcher`` in front of ``backend``.
+
+    Keeps the backend's name, so counts share the token cache with direct callers.
+    """
+
+    def __init__(self, backend: TokenizerBackend, batcher: MicroBatcher):
+        self.backend = backend
+        self.batcher = batcher
+        self.name = backend.name
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def count_many(self, texts):
+        return list(self.batcher(texts))
+
+
+class OptimizerService:
+    """Request handling shared by every connection: batchers, limits and metrics."""
+
+    def __init__(
+        self,
+        embedding_provider: ProviderSpec = None,
+        tokenizer: TokenizerSpec = None,
+        *,
+        policy: CompressionPolicy = DEFAULT_POLICY,
+        window: float = 0.005,
+        max_batch: int = 1024,
+        max_pending: int = 16384,
+        max_inflight: int = 256,
+    ):
+        self.provider = get_provider(embedding_provider)
+        self.backend = get_tokenizer(tokenizer)
+        self.policy = policy
+        self.embed_batcher = MicroBatcher(self._embed_unique, window=window, max_batch=max_batch, max_pending=max_pending, name="embed")
+        self.token_batcher = MicroBatcher(self.backend.count_many, window=window, max_batch=max_batch, max_pending=max_pending, name="tokens")
+        self.tokenizer = BatchingTokenizer(self.backend, self.token_batcher)
+        self.max_inflight = max_inflight
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._stats = {"requests": 0, "rejected": 0, "errors": 0, "inflight": 0, "latency_seconds": 0.0}
+
+    def _embed_unique(self, texts: List[str]) -> np.ndarray:
+        # Concurrent requests often share the query and boilerplate sentences
+        unique = list(dict.fromkeys(texts))
+        embs = np.asarray(self.provider(unique), dtype=np.float32)
+        if len(unique) == len(texts):
+            return embs
+        row = {t: i for i, t in enumerate(unique)}
+        return embs[[row[t] for t in texts]]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.embed_batcher(texts))
+
+    def warm(self) -> None:
+        """Load the sentence splitter and tokenizer data before the first request."""
+        split_sentences("Warm up. Twice.")
+        self.backend.count_many(["warm up"])
+
+    def optimize(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = request["prompt"]
+        query = request["query"]
+        if not isinstance(prompt, str) or not isinstance(query, str):
+            raise ValueError("prompt and query must be strings")
+        max_tokens = int(request.get("max_tokens", DEFAULT_MAX_TOKENS))
+        selector = request.get("selector", "greedy")
+        if selector not in SELECTORS:
+            raise ValueError(f"Unknown selector {selector!r}. Available: {sorted(SELECTORS)}")
+        policy = self.policy
+        if "mode" in request or "strategy" in request:
+            # CompressionPolicy validates both
+            policy = dataclasses.replace(policy, mode=request.get("mode", policy.mode), strategy=request.get("strategy", policy.strategy))
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise Overloaded(f"{self.max_inflight} requests already in flight")
+        start = time.perf_counter()
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["inflight"] += 1
+        try:
+            result = optimize_prompt_detailed(
+                prompt,
+                query,
+                max_tokens,
+                selector=selector,
+                preserve_order=bool(request.get("preserve_order", False)),
+                policy=policy,
+                embedding_provider=self.embed,
+                tokenizer=self.tokenizer,
+            )
+        except Overloaded:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._stats["inflight"] -= 1
+                self._stats["latency_seconds"] += time.perf_counter() - start
+        return {
+            "text": result.text,
+            "tokens": result.tokens,
+            "original_tokens": result.original_tokens,
+            "selected": result.selected,
+            "paraphrased": result.paraphrased,
+            "timings_ms": {k: v * 1000.0 for k, v in result.timings.items()},
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        done = stats["requests"] - stats["inflight"]
+        stats["mean_latency_ms"] = 1000.0 * stats.pop("latency_seconds") / done if done else 0.0
+        stats["uptime_seconds"] = time.monotonic() - self._started
+        stats["embed"] = self.embed_batcher.stats()
+        stats["tokens"] = self.token_batcher.stats()
+        return stats
+
+    def close(self) -> None:
+        self.embed_batcher.close()
+        self.token_batcher.close()
+
+
+# ----- HTTP transport -----
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "promptfit"
+
+    def _send(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send(200, self.server.service.metrics())
+        else:
+            self._send(404, {"error": f"no route for GET {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.path != "/optimize":
+            self._send(404, {"error": f"no route for POST {self.path}"})
+            return
+        try:
+            request = json.loads(body or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("request body must be a JSON object")
+            self._send(200, self.server.service.optimize(request))
+        except Overloaded as e:
+            self._send(503, {"error": str(e)}, {"Retry-After": "1"})
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, {"error": f"bad request: {e}"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        conn, _ = super().get_request()
+        return conn, ("unix", 0)  # BaseHTTPRequestHandler expects a (host, port) address
+
+
+def make_server(service: OptimizerService, host: str = "127.0.0.1", port: int = 8765,
+                socket_path: Optional[str] = None, verbose: bool = False):
+    """Bind an HTTP server for ``service`` on TCP, or on ``socket_path`` when given. Call ``serve_forever``."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = _UnixServer(socket_path, _Handler)
+    else:
+        server = _TCPServer((host, port), _Handler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, socket_path: Optional[str] = None, *,
+          verbose: bool = False, **service_options) -> None:
+    """Run the server until interrupted."""
+    service = OptimizerService(**service_options)
+    service.warm()
+    server = make_server(service, host, port, socket_path, verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
@@ -0,0 +1,195 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np # type: ignore
+
+from .config import DEFAULT_MAX_TOKENS
+from .embedder import get_embeddings_array
+from .optimizer import _trim_leftover, enforce_budget
+from .policy import CompressionPolicy, DEFAULT_POLICY
+from .relevance import _call_get_embeddings_batched
+from .selection import Selection, select_segments
+from .token_budget import estimate_joined_tokens, estimate_tokens_many
+from .tokenizer_backends import TokenizerSpec
+from .utils import split_sentences
+
+# Query embeddings kept per session; agent loops usually alternate between a few queries
+_QUERY_CACHE_SIZE = 16
+
+
+class PromptFitSession:
+    """
+    Stateful optimizer for contexts that grow a few sentences at a time (chat and agent loops).
+
+    Each appended text is split and token-counted once; segment embeddings are computed
+    lazily, only for segments added since the last ranking, and the query embedding is
+    cached per query. ``optimize`` then re-scores with one matrix-vector product over the
+    stored (normalized) embeddings, so per-turn backend work is proportional to the new
+    text rather than the whole history.
+
+    Kept segments are emitted in conversation order by default (``preserve_order=True``).
+    """
+
+    def __init__(
+        self,
+        query: Optional[str] = None,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        *,
+        get_embeddings_fn: Callable[[List[str]], List[List[float]]] = get_embeddings_array,
+        tokenizer: TokenizerSpec = None,
+        selector: str = "greedy",
+        preserve_order: bool = True,
+        policy: CompressionPolicy = DEFAULT_POLICY,
+        batch_size: int = 128,
+    ):
+        self.query = query
+        self.max_tokens = max_tokens
+        self.get_embeddings_fn = get_embeddings_fn
+        self.tokenizer = tokenizer
+        self.selector = selector
+        self.preserve_order = preserve_order
+        self.policy = policy
+        self.batch_size = batch_size
+
+        self._next_id = 0
+        self._ids: List[int] = []  # live segment ids, in order
+        self._text: Dict[int, str] = {}
+        self._tokens: Dict[int, int] = {}
+        self._row: Dict[int, int] = {}  # segment id -> row in self._embs
+        self._embs: Optional[np.ndarray] = None
+        self._n_rows = 0
+        self._query_emb: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.last_selection: Optional[Selection] = None
+
+    # ----- mutation -----
+
+    def append(self, text: str) -> List[int]:
+        """Split ``text`` into segments, count their tokens, and return the new segment ids."""
+        return self.extend(split_sentences(text))
+
+    def extend(self, segments: Iterable[str]) -> List[int]:
+        """Add already-split segments and return their ids."""
+        segments = [s for s in segments if s]
+        counts = estimate_tokens_many(segments, self.tokenizer)
+        ids = []
+        for segment, n in zip(segments, counts):
+            sid = self._next_id
+            self._next_id += 1
+            self._text[sid] = segment
+            self._tokens[sid] = n
+            self._ids.append(sid)
+            ids.append(sid)
+        return ids
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """Drop segments by id. Their embedding rows are reclaimed on the next compaction."""
+        doomed = set(ids)
+        self._ids = [i for i in self._ids if i not in doomed]
+        for sid in doomed:
+            self._text.pop(sid, None)
+            self._tokens.pop(sid, None)
+            self._row.pop(sid, None)
+        if self._embs is not None and self._n_rows > 2 * max(1, len(self._row)):
+            self._compact()
+
+    def clear(self) -> None:
+        self.remove(list(self._ids))
+
+    # ----- introspection -----
+
+    @property
+    def segments(self) -> List[str]:
+        return [self._text[i] for i in self._ids]
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self._tokens[i] for i in self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ----- embeddings -----
+
+    def _store(self, ids: List[int], embs: np.ndarray) -> None:
+        if self._embs is None:
+            self._embs = np.empty((max(16, len(ids)), embs.shape[1]), dtype=np.float32)
+        needed = self._n_rows + len(ids)
+        if needed > self._embs.shape[0]:
+            grown = np.empty((max(needed, 2 * self._embs.shape[0]), self._embs.shape[1]), dtype=np.float32)
+            grown[:self._n_rows] = self._embs[:self._n_rows]
+            self._embs = grown
+        self._embs[self._n_rows:needed] = embs
+        for k, sid in enumerate(ids):
+            self._row[sid] = self._n_rows + k
+        self._n_rows = needed
+
+    def _compact(self) -> None:
+        live = [sid for sid in self._ids if sid in self._row]
+        rows = [self._row[sid] for sid in live]
+        self._embs = self._embs[rows].copy() if rows else None
+        self._row = {sid: k for k, sid in enumerate(live)}
+        self._n_rows = len(live)
+
+    def _embed_pending(self, query: str) -> None:
+        pending = [sid for sid in self._ids if sid not in self._row]
+        texts = [self._text[sid] for sid in pending]
+        need_query = query not in self._query_emb
+        if not need_query:
+            self._query_emb.move_to_end(query)
+        else:
+            texts = [query] + texts
+        if not texts:
+            return
+        embs = _call_get_embeddings_batched(texts, self.get_embeddings_fn, self.batch_size, normalize=True)
+        if need_query:
+            self._query_emb[query] = embs[0].copy()
+            while len(self._query_emb) > _QUERY_CACHE_SIZE:
+                self._query_emb.popitem(last=False)
+            embs = embs[1:]
+        if pending:
+            self._store(pending, embs)
+
+    # ----- optimization -----
+
+    def scores(self, query: Optional[str] = None) -> List[float]:
+        """Cosine relevance of every live segment to ``query`` (default: the session query)."""
+        query = query if query is not None else self.query
+        if query is None:
+            raise ValueError("a query is required to score segments")
+        self._embed_pending(query)
+        if not self._ids:
+            return []
+        rows = [self._row[sid] for sid in self._ids]
+        return (self._embs[rows] @ self._query_emb[query]).tolist()
+
+    def optimize(self, query: Optional[str] = None, max_tokens: Optional[int] = None) -> str:
+        """Return the current context fitted to ``max_tokens`` (default: the session budget)."""
+        max_tokens = max_tokens if max_tokens is not None else self.max_tokens
+        sections = self.segments
+        tokens = [self._tokens[sid] for sid in self._ids]
+        if sum(tokens) <= max_tokens:
+            self.last_selection = None
+            return " ".join(sections)
+
+        scores = self.scores(query)
+        embeddings = None
+        if self.selector == "mmr":
+            embeddings = self._embs[[self._row[sid] for sid in self._ids]]
+        self.last_selection = select_segments(
+            scores,
+            tokens,
+            max_tokens,
+            method=self.selector,
+            preserve_order=self.preserve_order,
+            embeddings=embeddings,
+        )
+        pruned = [sections[i] for i in self.last_selection.indices]
+        pruned_tokens = estimate_joined_tokens(pruned, self.tokenizer)
+        if self.policy.trim and pruned_tokens < max_tokens:
+            _, pruned, pruned_tokens, _ = _trim_leftover(
+                sections, scores, list(self.last_selection.indices), pruned_tokens, max_tokens, self.preserve_order,
+                self.policy.trim_boundary, self.tokenizer,
+            )
+        ranked = [sections[i] for i in np.argsort(-np.asarray(scores), kind="stable")]
+        return enforce_budget(" ".join(sections), ranked, pruned, max_tokens, self.policy, query if query is not None else self.query,
+                              pruned_tokens, self.tokenizer)
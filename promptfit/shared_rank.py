@@ -0,0 +1,179 @@
+"""Multi-process top-k scoring of large embedding matrices through shared memory.
+
+``SharedArray`` keeps a float32 matrix in a ``multiprocessing.shared_memory`` block, and
+only the block's name is sent to worker processes. ``parallel_top_k`` splits the rows into
+one contiguous shard per worker. Each worker attaches to the block, scores its shard with
+one float32 matrix-vector product on a view (no copy), keeps its best ``k`` with
+``argpartition`` and returns only those. The parent merges ``workers * k`` candidates. With
+``k=None`` the workers write every score into a shared output block instead.
+
+Memory stays at one copy of the matrix plus one float32 score per row, however many workers
+there are. ``top_k_indices`` gives the same order as a stable descending sort (ties keep
+input order), so callers see identical rankings in-process and across processes.
+"""
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np # type: ignore
+
+
+def top_k_indices(scores: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """Indices of the ``k`` highest ``scores`` (all if ``None``), best first, ties in index order.
+
+    Only the top ``k`` are sorted; the rest are split off with ``argpartition``.
+    """
+    scores = np.asarray(scores)
+    n = len(scores)
+    if k is None or k >= n:
+        return np.argsort(-scores, kind="stable")
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    kth = np.partition(scores, n - k)[n - k]
+    above = np.flatnonzero(scores > kth)
+    ties = np.flatnonzero(scores == kth)[:k - len(above)]
+    idx = np.concatenate([above, ties])
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+
+class SharedArray:
+    """A numpy array backed by a shared memory block that worker processes attach to by name.
+
+    The creating process owns the block: ``close()`` (or leaving the ``with`` block) unmaps
+    and unlinks it.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype=np.float32, *, name: Optional[str] = None):
+        self.shape = tuple(int(d) for d in shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        if self.owner:
+            size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @classmethod
+    def copy_of(cls, arr) -> "SharedArray":
+        arr = np.asarray(arr)
+        shared = cls(arr.shape, arr.dtype)
+        shared.array[...] = arr
+        return shared
+
+    def close(self) -> None:
+        if self._shm is None:
+            return
+        self.array = None  # the buffer can't be released while a view exports it
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self) -> "SharedArray":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _score_shard(
+    name: str,
+    shape: Tuple[int, int],
+    out_name: Optional[str],
+    start: int,
+    stop: int,
+    query: np.ndarray,
+    k: Optional[int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Worker: score rows ``start:stop`` of the shared matrix; return the shard's top ``k``."""
+    embs = SharedArray(shape, name=name)
+    try:
+        scores = embs.array[start:stop] @ query
+    finally:
+        embs.close()
+    if out_name:
+        out = SharedArray((shape[0],), name=out_name)
+        try:
+            out.array[start:stop] = scores
+        finally:
+            out.close()
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+    idx = top_k_indices(scores, k)
+    return idx + start, scores[idx]
+
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # Workers must report shared blocks to the parent's resource tracker, not one of
+            # their own that would unlink the blocks when the worker exits
+            resource_tracker.ensure_running()
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+
+def shutdown_pools() -> None:
+    """Stop the worker processes started by ``parallel_top_k``."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+def _shards(n: int, parts: int) -> List[Tuple[int, int]]:
+    bounds = np.linspace(0, n, parts + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def parallel_top_k(
+    embs: SharedArray,
+    query: Sequence[float],
+    k: Optional[int] = None,
+    *,
+    workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Best ``k`` rows of ``embs`` by dot product with ``query``, as (indices, scores), best first.
+
+    Rows and query should already be L2-normalized for cosine scores. ``workers`` defaults to
+    one per CPU; ``executor`` overrides the shared process pool.
+    """
+    shape = embs.shape
+    if len(shape) != 2:
+        raise ValueError("Embeddings must be 2D (n_texts, dim)")
+    q = np.asarray(query, dtype=np.float32)
+    if q.shape != (shape[1],):
+        raise ValueError(f"Dimension mismatch: query dim {q.shape[-1]} vs segment dim {shape[1]}")
+    n = shape[0]
+    workers = workers or os.cpu_count() or 1
+    pool = executor or _get_pool(workers)
+    shards = _shards(n, workers)
+    if k is None:
+        with SharedArray((n,), np.float32) as out:
+            futures = [pool.submit(_score_shard, embs.name, shape, out.name, a, b, q, None) for a, b in shards]
+            for fut in futures:
+                fut.result()
+            order = top_k_indices(out.array)
+            return order, out.array[order]
+    futures = [pool.submit(_score_shard, embs.name, shape, None, a, b, q, k) for a, b in shards]
+    parts = [fut.result() for fut in futures]
+    if not parts:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+    idx = np.concatenate([p[0] for p in parts])
+    scores = np.concatenate([p[1] for p in parts])
+    # Each shard kept its best k with ties by index, so the merged best k are among them
+    best = np.lexsort((idx, -scores))[:k]
+    return idx[best], scores[best]
@@ -0,0 +1,185 @@
+"""Prompt templates with precompiled static parts and budgeted slots.
+
+A template is text with ``{name}`` placeholders (``{{`` and ``}}`` are literal braces).
+The static text around the placeholders (system instructions, few-shot examples) is
+token-counted once per tokenizer and kept on the template, so a request only counts and
+optimizes the values it fills in.
+
+Each slot can have a ``Slot`` spec: ``max_tokens`` caps it, ``priority`` weights its share
+of the budget left after the static parts, and ``required`` slots (e.g. the user's
+question) are inserted verbatim and paid for first. When the values don't fit, the free
+budget is divided by priority (slots that need less than their share give the rest back)
+and each over-allocation slot goes through ``optimize_prompt`` with its own budget.
+
+Token counts of the parts are summed, as ``optimize_prompt`` sums sentence counts; with a
+BPE tokenizer a joined prompt can differ from the sum by a token at each boundary.
+"""
+import string
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from .config import DEFAULT_MAX_TOKENS
+from .optimizer import optimize_prompt
+from .policy import CompressionPolicy, DEFAULT_POLICY
+from .providers import ProviderSpec
+from .token_budget import estimate_tokens_many
+from .tokenizer_backends import TokenizerSpec, get_tokenizer
+from .tracing import span
+
+
+@dataclass(frozen=True)
+class Slot:
+    """Budgeting rules for one placeholder."""
+    max_tokens: Optional[int] = None
+    priority: float = 1.0
+    required: bool = False
+
+    def __post_init__(self):
+        if self.priority <= 0:
+            raise ValueError("priority must be > 0")
+        if self.max_tokens is not None and self.max_tokens < 0:
+            raise ValueError("max_tokens must be >= 0")
+
+
+DEFAULT_SLOT = Slot()
+
+
+def _parse(template: str) -> Tuple[List[str], List[str]]:
+    """Split ``template`` into static parts and slot names: ``parts[i]`` precedes ``names[i]``."""
+    parts, names = [], []
+    literal = ""
+    for text, field, spec, conversion in string.Formatter().parse(template):
+        literal += text
+        if field is None:
+            continue
+        if not field.isidentifier() or spec or conversion:
+            raise ValueError(f"Unsupported placeholder {{{field}{'!' + conversion if conversion else ''}{':' + spec if spec else ''}}}: use plain {{name}}")
+        parts.append(literal)
+        names.append(field)
+        literal = ""
+    parts.append(literal)
+    return parts, names
+
+
+def allocate(demands: Mapping[str, int], budget: int, slots: Mapping[str, Slot]) -> Dict[str, int]:
+    """Share ``budget`` tokens between slots needing ``demands`` tokens.
+
+    Required slots get their full demand first; the rest is water-filled by priority, with
+    each slot capped at ``min(demand, max_tokens)``.
+    """
+    alloc: Dict[str, int] = {}
+    open_: Dict[str, int] = {}
+    for name, need in demands.items():
+        slot = slots.get(name, DEFAULT_SLOT)
+        if slot.required:
+            alloc[name] = need
+        else:
+            open_[name] = need if slot.max_tokens is None else min(need, slot.max_tokens)
+    free = budget - sum(alloc.values())
+    if free < 0:
+        raise ValueError(f"required slots need {sum(alloc.values())} tokens but only {budget} are left after the static text")
+    while open_:
+        total_priority = sum(slots.get(n, DEFAULT_SLOT).priority for n in open_)
+        shares = {n: free * slots.get(n, DEFAULT_SLOT).priority / total_priority for n in open_}
+        satisfied = [n for n, need in open_.items() if need <= shares[n]]
+        if not satisfied:
+            for n in open_:
+                alloc[n] = int(shares[n])
+            break
+        for n in satisfied:
+            alloc[n] = open_.pop(n)
+            free -= alloc[n]
+    return alloc
+
+
+class PromptTemplate:
+    """A template whose static text is counted once and whose slots are budgeted per request.
+
+    ``PromptTemplate(text, {"question": Slot(required=True), "docs": Slot(priority=3.0)})``
+    compiles ``text`` once; ``fill(values, query, max_tokens)`` then renders each request.
+    """
+
+    def __init__(self, template: str, slots: Optional[Mapping[str, Slot]] = None, *, tokenizer: TokenizerSpec = None):
+        self.template = template
+        self.parts, self.names = _parse(template)
+        self.slots = dict(slots or {})
+        unknown = set(self.slots) - set(self.names)
+        if unknown:
+            raise ValueError(f"Slot specs for names not in the template: {sorted(unknown)}")
+        self.tokenizer = tokenizer
+        self._static: Dict[str, int] = {}
+        self.compile()
+
+    def compile(self, tokenizer: TokenizerSpec = None) -> int:
+        """Count the static text with ``tokenizer`` (default: the template's) once; returns the count."""
+        backend = get_tokenizer(tokenizer if tokenizer is not None else self.tokenizer)
+        if backend.name not in self._static:
+            self._static[backend.name] = sum(estimate_tokens_many([p for p in self.parts if p], backend))
+        return self._static[backend.name]
+
+    @property
+    def static_tokens(self) -> int:
+        return self.compile()
+
+    def _check(self, values: Mapping[str, str]) -> None:
+        missing = [n for n in self.names if n not in values]
+        if missing:
+            raise KeyError(f"Missing values for slots: {missing}")
+
+    def format(self, values: Mapping[str, str]) -> str:
+        """Fill the slots with ``values`` as given."""
+        self._check(values)
+        out = [self.parts[0]]
+        for name, part in zip(self.names, self.parts[1:]):
+            out.append(values[name])
+            out.append(part)
+        return "".join(out)
+
+    def _allocate(self, values: Mapping[str, str], max_tokens: int) -> Tuple[Dict[str, int], Dict[str, int]]:
+        self._check(values)
+        backend = get_tokenizer(self.tokenizer)
+        names = list(dict.fromkeys(self.names))
+        counts = dict(zip(names, estimate_tokens_many([values[n] for n in names], backend)))
+        # A name used twice in the template is paid for twice
+        uses = {n: self.names.count(n) for n in names}
+        static = self.compile(backend)
+        if static > max_tokens:
+            raise ValueError(f"the template's static text alone needs {static} tokens, over the budget of {max_tokens}")
+        alloc = allocate({n: counts[n] * uses[n] for n in names}, max_tokens - static, self.slots)
+        return {n: alloc[n] // uses[n] for n in names}, counts
+
+    def budget(self, values: Mapping[str, str], max_tokens: int = DEFAULT_MAX_TOKENS) -> Dict[str, int]:
+        """Tokens each slot may use for these ``values`` (only the values are counted)."""
+        return self._allocate(values, max_tokens)[0]
+
+    def fill(
+        self,
+        values: Mapping[str, str],
+        query: str,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        *,
+        selector: str = "greedy",
+        preserve_order: bool = True,
+        policy: CompressionPolicy = DEFAULT_POLICY,
+        embedding_provider: ProviderSpec = None,
+    ) -> str:
+        """Render the template within ``max_tokens``, optimizing slots that exceed their share.
+
+        Each over-budget slot is passed to ``optimize_prompt`` with ``query`` and its allocation.
+        """
+        with span("template", slots=len(self.names)):
+            alloc, counts = self._allocate(values, max_tokens)
+            filled = dict(values)
+            for name, tokens in alloc.items():
+                if counts[name] > tokens:
+                    filled[name] = optimize_prompt(
+                        values[name],
+                        query,
+                        tokens,
+                        selector=selector,
+                        preserve_order=preserve_order,
+                        policy=policy,
+                        embedding_provider=embedding_provider,
+                        tokenizer=self.tokenizer,
+                    ) if tokens > 0 else ""
+            return self.format(filled)
@@ -0,0 +1,62 @@
+# test_batch.py
+# Tests for the streaming JSONL batch mode (hashing embeddings, no network)
+
+import json
+
+from promptfit.batch import BatchConfig, run_batch
+from promptfit.cli import run
+from promptfit.optimizer import optimize_prompt
+from promptfit.policy import CompressionPolicy
+
+PROMPTS = [
+    ("Paris is the capital of France. Bananas are yellow. The Eiffel Tower is in Paris. Cats sleep a lot.", "Paris"),
+    ("Python is a language. It rains in Seattle. Python has dynamic typing. Pizza is tasty.", "Python typing"),
+    ("The sun is a star. Dogs bark loudly. Stars emit light. Trains run on rails.", "stars"),
+]
+CONFIG = BatchConfig(max_tokens=12, embedding_provider="hashing", mode="prune_only")
+
+def _lines():
+    lines = [json.dumps({"id": f"r{i}", "prompt": p, "query": q}) for i, (p, q) in enumerate(PROMPTS * 3)]
+    lines.insert(4, "{not json")
+    lines.insert(6, "")
+    return lines
+
+def _expected(record):
+    return optimize_prompt(record["prompt"], record["query"], 12, embedding_provider="hashing",
+                           policy=CompressionPolicy(mode="prune_only"))
+
+def test_inline_batch_matches_optimize_prompt():
+    out = []
+    stats = run_batch(_lines(), out.append, CONFIG, workers=0, chunk_size=4)
+    results = [json.loads(line) for line in out]
+    assert stats["records"] == 10 and stats["errors"] == 1 and stats["chunks"] == 3
+    assert [r["index"] for r in results] == list(range(10))
+    assert "error" in results[4] and "id" not in results[4]
+    records = [json.loads(line) for line in _lines() if line and not line.startswith("{not")]
+    good = [r for r in results if "error" not in r]
+    assert [r["id"] for r in good] == [rec["id"] for rec in records]
+    assert [r["optimized"] for r in good] == [_expected(rec) for rec in records]
+
+def test_process_pool_ordered_and_unordered(tmp_path):
+    config = BatchConfig(max_tokens=12, embedding_provider="hashing", mode="prune_only",
+                         cache_path=str(tmp_path / "cache.sqlite"))
+    inline, ordered, unordered = [], [], []
+    run_batch(_lines(), inline.append, CONFIG, workers=0, chunk_size=2)
+    stats = run_batch(_lines(), ordered.append, config, workers=2, chunk_size=2, max_inflight=2)
+    run_batch(_lines(), unordered.append, config, workers=2, chunk_size=2, ordered=False)
+    assert ordered == inline
+    assert sorted(unordered) == sorted(inline)
+    assert stats["records"] == 10 and stats["errors"] == 1
+
+def test_cli_batch(tmp_path):
+    src = tmp_path / "in.jsonl"
+    dst = tmp_path / "out.jsonl"
+    src.write_text("\n".join(_lines()) + "\n")
+    try:
+        run(["batch", str(src), "--output", str(dst), "--max-tokens", "12", "--embeddings", "hashing",
+             "--mode", "prune_only", "--workers", "0"])
+    except SystemExit as e:
+        assert e.code == 0
+    results = [json.loads(line) for line in dst.read_text().splitlines()]
+    assert len(results) == 10
+    assert results[0]["optimized"] == _expected(json.loads(_lines()[0]))
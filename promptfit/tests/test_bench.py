@@ -0,0 +1,28 @@
+# test_bench.py
+# Smoke tests for the offline benchmark suite
+
+import json
+from promptfit import bench, embedder, paraphraser, tokenizer_backends
+
+def test_run_benchmarks_small_corpus():
+    before = (embedder._client, tokenizer_backends.get_tokenizer().name)
+    config = bench.BenchConfig(sizes=[20], repeats=2, budget_ratio=0.2)
+    report = bench.run_benchmarks(config)
+    json.dumps(report)  # serializable
+    rows = {r["stage"]: r for r in report["results"]}
+    assert set(rows) == set(bench.STAGES)
+    assert all(r["segments"] == 20 and r["latency_ms"]["p50"] >= 0 for r in rows.values())
+    assert rows["embed"]["backend_calls"]["embed"] == 1
+    assert rows["split"]["backend_calls"] == {"embed": 0, "llm": 0, "tokenizer": 0}
+    # HyDE expansion plus one round of candidates; the pruned prompt already fits, so no LLM
+    assert rows["paraphrase"]["backend_calls"]["llm"] == 1 + paraphraser.PARAPHRASE_CANDIDATES
+    assert rows["optimize"]["backend_calls"] == {"embed": 1, "llm": 0, "tokenizer": 1}
+    # Stubs are uninstalled afterwards
+    assert (embedder._client, tokenizer_backends.get_tokenizer().name) == before
+    assert "bench-stub" not in tokenizer_backends.available_tokenizers()
+
+def test_corpus_is_deterministic_and_compare():
+    assert bench.make_corpus(5, seed=1) == bench.make_corpus(5, seed=1)
+    base = {"results": [{"stage": "split", "segments": 10, "latency_ms": {"p50": 2.0}}]}
+    cur = {"results": [{"stage": "split", "segments": 10, "latency_ms": {"p50": 3.0}}]}
+    assert bench.compare(base, cur)[0]["ratio"] == 1.5
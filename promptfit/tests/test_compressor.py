@@ -0,0 +1,61 @@
+# test_compressor.py
+# Tests for the local extractive compressor and the "extractive" compression strategy
+
+import pytest # type: ignore
+from promptfit import optimizer
+from promptfit.compressor import UnigramModel, extractive_compress, information_scores
+from promptfit.policy import CompressionPolicy
+from promptfit.token_budget import estimate_tokens
+
+TEXT = ("Please note that the quarterly report (which was prepared by the finance team in March) shows that "
+        "revenue basically grew by 12% in order to meet targets. The finance team did not include the Berlin office.\n\n"
+        "Next steps: the board will vote on the budget.")
+
+def test_extractive_compress_fits_budget_exactly():
+    full = estimate_tokens(TEXT)
+    assert extractive_compress(TEXT, full) == TEXT
+    for budget in (full - 1, 40, 25, 12):
+        out = extractive_compress(TEXT, budget, query="revenue growth")
+        assert estimate_tokens(out) <= budget
+        # Fewest removals: dropping one word less would not fit
+        assert estimate_tokens(out) >= budget - 2
+    out = extractive_compress(TEXT, 25, query="revenue")
+    # Query terms, numbers and negations survive; filler goes first
+    for word in ("revenue", "12%", "not"):
+        assert word in out
+    for word in ("Please", "basically", "order"):
+        assert word not in out
+    assert out.endswith(".")
+
+def test_information_scores_and_background_model():
+    scores = dict(information_scores("the Zanzibar treaty and the treaty", model=UnigramModel()))
+    assert scores["the"] < scores["Zanzibar"]
+    model = UnigramModel.from_texts(["zanzibar zanzibar zanzibar treaty"])
+    assert dict(information_scores("Zanzibar treaty", model=model))["Zanzibar"] < dict(information_scores("Zanzibar treaty"))["Zanzibar"]
+
+def test_extractive_strategy_skips_llm(monkeypatch):
+    def no_llm(*args, **kwargs):
+        raise AssertionError("paraphraser must not be called")
+    monkeypatch.setattr(optimizer, "paraphrase_prompt", no_llm)
+    policy = CompressionPolicy(mode="always", strategy="extractive")
+    prompt = TEXT + " Cats sleep a lot. Bananas are yellow."
+    out = optimizer.optimize_prompt(prompt, "revenue", 20, embedding_provider="hashing", policy=policy)
+    assert 0 < estimate_tokens(out) <= 20
+    # Nothing fits as whole sentences: compress the original instead
+    out = optimizer.optimize_prompt(prompt, "revenue", 5, embedding_provider="hashing",
+                                    policy=CompressionPolicy(strategy="extractive"))
+    assert 0 < estimate_tokens(out) <= 5
+    with pytest.raises(ValueError):
+        CompressionPolicy(strategy="summarize")
+
+def test_extractive_strategy_counts_with_given_tokenizer(monkeypatch):
+    from promptfit.tokenizer_backends import HeuristicTokenizer
+    monkeypatch.setattr(optimizer, "paraphrase_prompt", lambda *a, **k: pytest.fail("paraphraser must not be called"))
+    doubled = HeuristicTokenizer(0.5)
+    policy = CompressionPolicy(mode="always", strategy="extractive")
+    prompt = TEXT + " Cats sleep a lot. Bananas are yellow."
+    result = optimizer.optimize_prompt_detailed(prompt, "revenue", 40, embedding_provider="hashing", tokenizer=doubled, policy=policy)
+    tokens = estimate_tokens(result.text, doubled)
+    # Compressed to the budget by the caller's tokenizer, not the default heuristic
+    assert 36 <= tokens <= 40
+    assert result.tokens == tokens
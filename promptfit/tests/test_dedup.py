@@ -0,0 +1,74 @@
+# test_dedup.py
+# Tests for exact and near-duplicate segment elimination
+
+import random
+
+import numpy as np # type: ignore
+from promptfit.dedup import dedup_segments, lsh_params, minhash_signatures
+from promptfit.optimizer import optimize_prompt_detailed
+from promptfit.policy import CompressionPolicy
+from promptfit.providers import HashingProvider
+
+PASSAGE = "The Eiffel Tower is in Paris and was completed in 1889 for the World's Fair."
+
+def test_exact_and_near_duplicates_cluster():
+    segments = [
+        "Paris is the capital of France.",
+        PASSAGE,
+        "paris is the capital of  france!",
+        "Bananas are yellow.",
+        PASSAGE.replace("1889", "1889,") + " Really.",
+        PASSAGE,
+    ]
+    result = dedup_segments(segments)
+    assert result.segments == [segments[0], PASSAGE, "Bananas are yellow."]
+    assert result.representatives == [0, 1, 3]
+    assert result.clusters == [0, 1, 0, 2, 1, 1]
+    assert result.members() == [[0, 2], [1, 4, 5], [3]]
+    assert result.removed == 3
+    # Exact-only mode keeps the near duplicate
+    assert dedup_segments(segments, near=False).clusters == [0, 1, 0, 2, 3, 1]
+
+def test_minhash_estimates_jaccard():
+    assert lsh_params(0.8, 64) == (12, 5)
+    random.seed(0)
+    words = [f"w{i}" for i in range(1000)]
+    a = [random.choice(words) for _ in range(200)]
+    b = a[:150] + [random.choice(words) for _ in range(50)]
+    sigs = minhash_signatures([" ".join(a), " ".join(b), " ".join(a)], num_perm=256)
+    shingles = [set(zip(x, x[1:], x[2:])) for x in (a, b)]
+    jaccard = len(shingles[0] & shingles[1]) / len(shingles[0] | shingles[1])
+    assert abs(np.mean(sigs[0] == sigs[1]) - jaccard) < 0.1
+    assert (sigs[0] == sigs[2]).all()
+
+def test_scales_and_finds_planted_duplicates():
+    random.seed(1)
+    words = [f"w{i}" for i in range(5000)]
+    base = [" ".join(random.choice(words) for _ in range(20)) for _ in range(5000)]
+    segments = list(base)
+    for s in base[::5]:
+        w = s.split()
+        w[-1] = "changed"
+        segments.append(" ".join(w))
+    result = dedup_segments(segments)
+    # No unrelated segments merge; MinHash estimates miss at most a few planted pairs
+    assert result.clusters[:len(base)] == list(range(len(base)))
+    found = sum(result.clusters[len(base) + k] == 5 * k for k in range(len(base) // 5))
+    assert found >= 0.98 * (len(base) // 5)
+
+def test_optimize_prompt_dedup_saves_embeddings_and_budget():
+    class CountingProvider(HashingProvider):
+        def __init__(self):
+            super().__init__(dim=256)
+            self.texts = []
+        def encode(self, texts):
+            self.texts.extend(texts)
+            return super().encode(texts)
+    prompt = " ".join([PASSAGE, "Cats sleep a lot.", PASSAGE, "The Louvre is a museum in Paris.", PASSAGE])
+    provider = CountingProvider()
+    result = optimize_prompt_detailed(prompt, "Paris landmarks", 30, embedding_provider=provider,
+                                      policy=CompressionPolicy(mode="prune_only"), dedup=True)
+    assert result.clusters == [0, 1, 0, 2, 0]
+    assert result.segments == [PASSAGE, "Cats sleep a lot.", "The Louvre is a museum in Paris."]
+    assert result.text.count("Eiffel") == 1 and "Louvre" in result.text
+    assert provider.texts.count(PASSAGE) <= 1
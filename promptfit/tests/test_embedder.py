@@ -0,0 +1,69 @@
+# test_embedder.py
+# Unit tests for embedder module (stub client, no network)
+
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from promptfit import concurrency, embedder, embedding_cache
+
+class StubEmbedClient:
+    """Stand-in for cohere.Client: embeds text as [len(text), 1.0] and records each request."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+    def embed(self, texts, **kwargs):
+        with self._lock:
+            self.calls.append(list(texts))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return type("Resp", (), {"embeddings": [[float(len(t)), 1.0] for t in texts]})()
+
+@pytest.fixture
+def stub_client(monkeypatch):
+    client = StubEmbedClient(delay=0.05)
+    monkeypatch.setattr(embedder, "_client", client)
+    monkeypatch.setattr(embedder, "_cache", embedding_cache.MemoryEmbeddingCache())
+    return client
+
+def test_get_embeddings_only_embeds_uncached(stub_client):
+    first = embedder.get_embeddings(["aa", "b", "aa"])
+    second = embedder.get_embeddings(["b", "ccc"])
+    assert first == [[2.0, 1.0], [1.0, 1.0], [2.0, 1.0]]
+    assert second == [[1.0, 1.0], [3.0, 1.0]]
+    assert stub_client.calls == [["aa", "b"], ["ccc"]]
+
+def test_get_embeddings_concurrent_runs_batches_in_parallel(stub_client):
+    texts = [f"text {i}" for i in range(8)]
+    result = embedder.get_embeddings_concurrent(texts, batch_size=2, max_concurrency=4)
+    assert result == [[float(len(t)), 1.0] for t in texts]
+    assert len(stub_client.calls) == 4
+    assert stub_client.max_active > 1
+
+def test_aget_embeddings(stub_client):
+    texts = [f"text {i}" for i in range(6)]
+    result = asyncio.run(embedder.aget_embeddings(texts, batch_size=2, max_concurrency=3))
+    assert result == [[float(len(t)), 1.0] for t in texts]
+    assert stub_client.max_active > 1
+
+def test_inflight_requests_are_shared(stub_client):
+    stub_client.delay = 0.2
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: embedder.get_embeddings(["shared text"]), range(4)))
+    assert all(r == [[11.0, 1.0]] for r in results)
+    assert stub_client.calls == [["shared text"]]
+
+def test_token_bucket_paces_requests():
+    bucket = concurrency.TokenBucket(rate=100, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.04
@@ -0,0 +1,35 @@
+# test_embedding_cache.py
+# Unit tests for embedding_cache module
+
+import numpy as np
+from promptfit import embedding_cache
+
+def test_memory_cache_lru_eviction():
+    cache = embedding_cache.MemoryEmbeddingCache(max_entries=2)
+    cache.put_many("m", "doc", ["a", "b"], [[1.0, 0.0], [0.0, 1.0]])
+    cache.get_many("m", "doc", ["a"])  # touch "a" so "b" is least recent
+    cache.put_many("m", "doc", ["c"], [[1.0, 1.0]])
+    found = cache.get_many("m", "doc", ["a", "b", "c"])
+    assert found[0] is not None and found[1] is None and found[2] is not None
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+def test_sqlite_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "emb.sqlite")
+    cache = embedding_cache.SQLiteEmbeddingCache(path)
+    cache.put_many("m", "doc", ["hello"], [[0.5, -0.25, 1.0]])
+    cache.close()
+    warm = embedding_cache.SQLiteEmbeddingCache(path)
+    (vec,) = warm.get_many("m", "doc", ["hello"])
+    assert np.allclose(vec, [0.5, -0.25, 1.0])
+    # Keyed by model and input_type too
+    assert warm.get_many("m", "query", ["hello"]) == [None]
+    assert warm.get_many("other", "doc", ["hello"]) == [None]
+
+def test_sqlite_cache_int8_and_size_cap(tmp_path):
+    cache = embedding_cache.SQLiteEmbeddingCache(str(tmp_path / "emb.sqlite"), dtype="int8", max_bytes=8)
+    cache.put_many("m", "doc", ["a"], [[0.1, -0.2, 0.3, 0.4]])
+    (vec,) = cache.get_many("m", "doc", ["a"])
+    assert np.allclose(vec, [0.1, -0.2, 0.3, 0.4], atol=0.01)
+    cache.put_many("m", "doc", ["b", "c"], [[1, 2, 3, 4], [4, 3, 2, 1]])
+    assert len(cache) == 2
+    assert cache.get_many("m", "doc", ["a"]) == [None]
@@ -0,0 +1,54 @@
+# test_hierarchical.py
+# Tests for chunk-then-sentence optimization of long documents (hashing embeddings, no network)
+
+import pytest # type: ignore
+from promptfit.hierarchical import chunk_spans, optimize_document, optimize_file
+from promptfit.policy import CompressionPolicy
+from promptfit.providers import HashingProvider
+
+PRUNE = CompressionPolicy(mode="prune_only")
+FILLER = ["Rivers carry water to the sea.", "Bread is baked in an oven.", "Trains run on steel rails.",
+          "Owls hunt at night.", "Glass is made from sand."]
+NEEDLE = "The launch code is stored in the Geneva vault."
+
+def _document(n=300, at=217):
+    paras = [" ".join(FILLER[(i + k) % len(FILLER)] for k in range(4)) for i in range(n)]
+    paras[at] = NEEDLE + " " + paras[at]
+    return "\n\n".join(paras)
+
+class CountingProvider(HashingProvider):
+    def __init__(self):
+        super().__init__(dim=256)
+        self.texts = []
+    def encode(self, texts):
+        self.texts.extend(texts)
+        return super().encode(texts)
+
+def test_chunk_spans_merge_and_split():
+    text = "a" * 50 + " " + "b" * 30 + "\n\nshort\n\n\n" + "c" * 20 + " " + "d" * 20
+    spans = list(chunk_spans(text, 40))
+    assert [text[s:e].strip() for s, e in spans] == ["a" * 50, "b" * 30 + "\n\nshort", "c" * 20, "d" * 20]
+    assert list(chunk_spans(text.encode(), 40)) == spans
+    assert list(chunk_spans("\n\n  \n\n", 40)) == []
+
+@pytest.mark.parametrize("coarse", ["embed", "bm25"])
+def test_optimize_document_keeps_relevant_chunk(coarse):
+    provider = CountingProvider()
+    out = optimize_document(_document(), "where is the launch code vault", 40, chunk_tokens=32, expand=2.0,
+                            coarse=coarse, embedding_provider=provider, policy=PRUNE, preserve_order=True)
+    assert NEEDLE in out
+    # Sentence-level work is limited to the kept chunks, not the 1200 sentences of the document
+    sentences = [t for t in provider.texts if t in FILLER or t == NEEDLE]
+    assert len(sentences) < 40
+
+def test_optimize_file_matches_document(tmp_path):
+    doc = _document()
+    path = tmp_path / "doc.txt"
+    path.write_text(doc, encoding="utf-8")
+    options = dict(chunk_tokens=32, embedding_provider="hashing", policy=PRUNE)
+    assert optimize_file(path, "launch code vault", 40, **options) == optimize_document(doc, "launch code vault", 40, **options)
+    empty = tmp_path / "empty.txt"
+    empty.write_text("")
+    assert optimize_file(empty, "anything", 40) == ""
+    with pytest.raises(ValueError):
+        optimize_document(doc, "q", 40, coarse="nope")
@@ -0,0 +1,35 @@
+# test_imports.py
+# Import-time guard: `import promptfit` must stay cheap and must not pull in heavy dependencies
+
+import json
+import subprocess
+import sys
+
+HEAVY = ["cohere", "numpy", "sklearn", "nltk", "dotenv", "tiktoken"]
+
+def _probe(statement):
+    code = (
+        "import sys, time, json\n"
+        "start = time.perf_counter()\n"
+        f"{statement}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'elapsed': elapsed, 'loaded': [m for m in {HEAVY!r} if m in sys.modules]}}))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def test_import_promptfit_is_lazy():
+    result = _probe("import promptfit")
+    assert result["loaded"] == []
+    # Target is a few milliseconds; leave headroom for slow CI machines
+    assert result["elapsed"] < 0.05
+
+def test_pipeline_import_skips_cohere_and_sklearn():
+    result = _probe("import promptfit.optimizer, promptfit.cli")
+    assert "cohere" not in result["loaded"]
+    assert "sklearn" not in result["loaded"]
+
+def test_lazy_exports_resolve():
+    import promptfit
+    from promptfit import optimizer
+    assert promptfit.optimize_prompt is optimizer.optimize_prompt
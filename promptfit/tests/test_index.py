@@ -0,0 +1,109 @@
+# test_index.py
+# Tests for the prebuilt, memory-mapped segment index (no network)
+
+import numpy as np # type: ignore
+import pytest # type: ignore
+from promptfit.index import SegmentIndex, optimize_from_index
+from promptfit.policy import CompressionPolicy
+from promptfit.providers import HashingProvider
+from promptfit.quantize import l2_normalize
+from promptfit.token_budget import estimate_tokens
+from promptfit.tokenizer_backends import HeuristicTokenizer, register_tokenizer, unregister_tokenizer
+
+CORPUS = [
+    "Refunds are issued within 14 days of a return.",
+    "Our office is closed on public holidays.",
+    "Returned items must be unused and in original packaging.",
+    "Support is available by chat from 9am to 5pm.",
+    "Refund requests need the original receipt.",
+    "Shipping is free for orders over 50 euros.",
+]
+
+class CountingProvider(HashingProvider):
+    def __init__(self):
+        super().__init__(dim=256)
+        self.texts = []
+    def encode(self, texts):
+        self.texts.extend(texts)
+        return super().encode(texts)
+
+@pytest.mark.parametrize("kind", ["float32", "int8"])
+def test_build_save_load_roundtrip(tmp_path, kind):
+    index = SegmentIndex.build(CORPUS, HashingProvider(dim=256), kind=kind)
+    assert len(index) == len(CORPUS) and index.n_lists == 1
+    index.save(str(tmp_path / "idx"))
+    loaded = SegmentIndex.load(str(tmp_path / "idx"))
+    assert isinstance(loaded.embeddings.codes, np.memmap)
+    assert [loaded.segment(i) for i in range(len(CORPUS))] == CORPUS
+    assert list(loaded.tokens) == [estimate_tokens(s) for s in CORPUS]
+    q = HashingProvider(dim=256)(["how do refunds work"])[0]
+    ids, scores = loaded.search(q, 3)
+    exact = l2_normalize(HashingProvider(dim=256)(CORPUS)) @ l2_normalize(q)
+    assert list(ids) == list(np.argsort(-exact, kind="stable")[:3])
+    assert np.allclose(scores, exact[ids], atol=0.02 if kind == "int8" else 1e-5)
+
+def test_ivf_search_recall():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(50, 64)).astype(np.float32)
+    X = centers[rng.integers(0, 50, 5000)] + 0.5 * rng.normal(size=(5000, 64)).astype(np.float32)
+    texts = [f"s{i}" for i in range(len(X))]
+    rows = dict(zip(texts, X))
+    index = SegmentIndex.build(texts, lambda batch: np.stack([rows[t] for t in batch]), n_lists=40)
+    assert index.n_lists == 40 and index.offsets[-1] == len(X)
+    Xn = l2_normalize(X)
+    recalls = []
+    for q in centers[:20] + 0.5 * rng.normal(size=(20, 64)).astype(np.float32):
+        ids, _ = index.search(q, 10, n_probe=8)
+        recalls.append(len(set(ids) & set(np.argsort(-(Xn @ l2_normalize(q)))[:10])) / 10)
+    assert np.mean(recalls) >= 0.9
+    # Probing every list is exact
+    ids, _ = index.search(centers[0], 10, n_probe=40)
+    assert set(ids) == set(np.argsort(-(Xn @ l2_normalize(centers[0])))[:10])
+
+def test_optimize_from_index_embeds_only_the_query(tmp_path):
+    SegmentIndex.build(CORPUS, HashingProvider(dim=256)).save(str(tmp_path / "idx"))
+    index = SegmentIndex.load(str(tmp_path / "idx"))
+    provider = CountingProvider()
+    out = optimize_from_index(index, "refund receipt", 20, embedding_provider=provider,
+                              preserve_order=True, policy=CompressionPolicy(mode="prune_only"))
+    assert provider.texts == ["refund receipt"]
+    assert estimate_tokens(out) <= 20
+    assert "Refund requests need the original receipt." in out
+    # Corpus order is kept
+    kept = [s for s in CORPUS if s in out]
+    assert out == " ".join(kept)
+
+def test_optimize_from_index_needs_unnamed_provider_again():
+    index = SegmentIndex.build(CORPUS, lambda batch: HashingProvider(dim=256)(batch))
+    assert index.provider is None
+    with pytest.raises(ValueError, match="unnamed"):
+        optimize_from_index(index, "refund receipt", 20)
+    assert optimize_from_index(index, "refund receipt", 20, embedding_provider=HashingProvider(dim=256),
+                               policy=CompressionPolicy(mode="prune_only"))
+
+def test_optimize_from_index_compresses_with_index_tokenizer(tmp_path):
+    dense = HeuristicTokenizer(0.5)
+    provider = HashingProvider(dim=256)
+    # Below every segment's count, so the extractive fallback has to cut
+    policy = CompressionPolicy(strategy="extractive")
+    register_tokenizer("dense", lambda: HeuristicTokenizer(0.5))
+    try:
+        # Registered under a key that differs from the backend's name
+        SegmentIndex.build(CORPUS, provider, tokenizer="dense").save(str(tmp_path / "keyed"))
+        index = SegmentIndex.load(str(tmp_path / "keyed"))
+        assert index.tokenizer == dense.name and index.tokenizer_spec == "dense"
+        out = optimize_from_index(index, "refund receipt", 8, embedding_provider=provider, policy=policy)
+        assert out and estimate_tokens(out, dense) <= 8
+    finally:
+        unregister_tokenizer("dense")
+    # An unregistered instance works in memory but has to be passed again on load
+    index = SegmentIndex.build(CORPUS, provider, tokenizer=dense)
+    assert estimate_tokens(optimize_from_index(index, "refund receipt", 8, embedding_provider=provider, policy=policy), dense) <= 8
+    index.save(str(tmp_path / "instance"))
+    with pytest.raises(ValueError, match="tokenizer="):
+        optimize_from_index(SegmentIndex.load(str(tmp_path / "instance")), "refund receipt", 8,
+                            embedding_provider=provider, policy=policy)
+    with pytest.raises(ValueError):
+        SegmentIndex.load(str(tmp_path / "instance"), tokenizer="heuristic")
+    index = SegmentIndex.load(str(tmp_path / "instance"), tokenizer=HeuristicTokenizer(0.5))
+    assert estimate_tokens(optimize_from_index(index, "refund receipt", 8, embedding_provider=provider, policy=policy), dense) <= 8
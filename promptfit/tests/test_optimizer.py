@@ -2,23 +2,96 @@
 # Unit tests for optimizer module
 
 from promptfit import optimizer
+from promptfit.policy import CompressionPolicy
 
 def test_optimize_prompt_basic(monkeypatch):
     # Mock all dependencies
     monkeypatch.setattr(optimizer, "split_sentences", lambda text: ["A", "B", "C"])
-    monkeypatch.setattr(optimizer, "estimate_tokens_per_section", lambda sections: [10, 20, 30])
-    monkeypatch.setattr(optimizer, "estimate_tokens", lambda s: 10 if s == "A" else 20 if s == "B" else 30)
-    monkeypatch.setattr(optimizer, "rank_segments_by_relevance", lambda sections, query, get_emb: [(s, 1.0) for s in sections[::-1]])
-    monkeypatch.setattr(optimizer, "paraphrase_prompt", lambda prompt, instructions, max_tokens: "PARAPHRASED")
+    monkeypatch.setattr(optimizer, "estimate_tokens_per_section", lambda sections, tokenizer=None: [10, 20, 30])
+    monkeypatch.setattr(optimizer, "estimate_tokens", lambda s, tokenizer=None: 10 if s == "A" else 20 if s == "B" else 30)
+    monkeypatch.setattr(optimizer, "rank_segments_by_relevance", lambda sections, query, get_emb, prerank_top_n=None: [(s, 1.0) for s in sections[::-1]])
+    monkeypatch.setattr(optimizer, "paraphrase_prompt", lambda prompt, instructions, max_tokens, **kwargs: "PARAPHRASED")
     # Case 1: Under budget
     result = optimizer.optimize_prompt("irrelevant", "query", max_tokens=100)
     # All sections: 10+20+30=60 < 100, so should return original prompt
     assert result == "irrelevant"
-    # Case 2: Over budget, triggers pruning and paraphrasing
-    def fake_estimate_tokens(s):
+    # Case 2: Over budget, triggers pruning
+    def fake_estimate_tokens(s, tokenizer=None):
         return 50 if s == "A" else 60
     monkeypatch.setattr(optimizer, "estimate_tokens", fake_estimate_tokens)
-    monkeypatch.setattr(optimizer, "estimate_tokens_per_section", lambda sections: [50, 60, 60])
+    monkeypatch.setattr(optimizer, "estimate_tokens_per_section", lambda sections, tokenizer=None: [50, 60, 60])
     result = optimizer.optimize_prompt("irrelevant", "query", max_tokens=50)
-    # Only "A" fits, but estimate_tokens("A") == 50, so paraphrasing is triggered
-    assert result == "PARAPHRASED" 
\ No newline at end of file
+    # Only "A" fits and the pruned prompt is within budget, so no paraphrase call is made
+    assert result == "A"
+    # The "always" policy keeps the old behaviour of paraphrasing every over-budget prompt
+    result = optimizer.optimize_prompt("irrelevant", "query", max_tokens=50, policy=CompressionPolicy(mode="always"))
+    assert result == "PARAPHRASED"
+    # Nothing fits: paraphrase the original unless the policy is prune-only
+    assert optimizer.optimize_prompt("irrelevant", "query", max_tokens=40) == "PARAPHRASED"
+    assert optimizer.optimize_prompt("irrelevant", "query", max_tokens=40, policy=CompressionPolicy(mode="prune_only")) == "" 
+
+def test_optimize_prompts_batch(monkeypatch):
+    monkeypatch.setattr(optimizer, "split_sentences", lambda text: text.split("|"))
+    monkeypatch.setattr(optimizer, "estimate_tokens_many", lambda texts, tokenizer=None: [10] * len(texts))
+    monkeypatch.setattr(optimizer, "paraphrase_prompt", lambda prompt, instructions, max_tokens, **kwargs: prompt)
+    vectors = {"q1": [1, 0], "q2": [0, 1], "A": [1, 0], "B": [0, 1], "C": [1, 1]}
+    calls = []
+    def fake_get_embeddings(texts):
+        calls.append(list(texts))
+        return [vectors[t] for t in texts]
+    items = [("A|B|C", "q1"), ("A|B|C", "q2"), ("A|B", "q1", 100), ("B|C|A", "q2", 10)]
+    results = optimizer.optimize_prompts(items, max_tokens=20, get_embeddings_fn=fake_get_embeddings)
+    # One embedding pass over the unique queries and sentences of the over-budget items
+    assert calls == [["q1", "q2", "A", "B", "C"]]
+    assert results == ["A C", "B C", "A|B", "B"]
+
+def test_optimize_for_budgets_ranks_once(monkeypatch):
+    from promptfit.tokenizer_backends import HeuristicTokenizer
+    monkeypatch.setattr(optimizer, "paraphrase_prompt", lambda prompt, instructions, max_tokens, **kwargs: prompt)
+    calls = []
+    def fake_rank(sections, query, get_emb, prerank_top_n=None):
+        calls.append(list(sections))
+        return [(s, 1.0 / (i + 1)) for i, s in enumerate(sections)]
+    monkeypatch.setattr(optimizer, "rank_segments_by_relevance", fake_rank)
+    prompt = "First point here. Second point here. Third point here."
+    results = optimizer.optimize_for_budgets(prompt, "query", [100, 9, (3, HeuristicTokenizer(0.5)), 5], selector="knapsack", preserve_order=True,
+                                          policy=CompressionPolicy(mode="prune_only"))
+    assert len(calls) == 1
+    # 4 tokens per sentence with the default heuristic, 6 with words_per_token=0.5
+    assert results == [prompt, "First point here. Second point here.", "", "First point here."]
+
+def test_optimize_for_budgets_compresses_with_each_budgets_tokenizer(monkeypatch):
+    from promptfit.tokenizer_backends import HeuristicTokenizer
+    doubled = HeuristicTokenizer(0.5)
+    seen = []
+    def fake_paraphrase(prompt, instructions, max_tokens, **kwargs):
+        seen.append((max_tokens, kwargs["tokenizer"]))
+        return prompt
+    monkeypatch.setattr(optimizer, "paraphrase_prompt", fake_paraphrase)
+    prompt = "First point here. Second point here. Third point here."
+    optimizer.optimize_for_budgets(prompt, "query", [9, (13, doubled)], embedding_provider="hashing",
+                                   policy=CompressionPolicy(mode="always"))
+    assert seen == [(9, None), (13, doubled)]
+
+def test_model_budgets_count_locally(monkeypatch):
+    from promptfit.config import TOKENIZER_JSON_ENV
+    monkeypatch.delenv(TOKENIZER_JSON_ENV, raising=False)
+    assert optimizer._resolve_budget("command-r-plus", None)[1] == "heuristic"
+    monkeypatch.setenv(TOKENIZER_JSON_ENV, "tokenizer.json")
+    assert optimizer._resolve_budget("command-r-plus", None)[1] == "local-bpe"
+    assert all(spec != "cohere" for _, spec in optimizer.MODEL_BUDGETS.values())
+
+def test_detailed_counts_with_given_tokenizer(monkeypatch):
+    from promptfit.tokenizer_backends import HeuristicTokenizer
+    doubled = HeuristicTokenizer(0.5)
+    seen = []
+    def fake_paraphrase(prompt, instructions, max_tokens, **kwargs):
+        seen.append(kwargs["tokenizer"])
+        return "three short words"
+    monkeypatch.setattr(optimizer, "paraphrase_prompt", fake_paraphrase)
+    prompt = "First point here. Second point here. Third point here."
+    result = optimizer.optimize_prompt_detailed(prompt, "query", 8, embedding_provider="hashing", tokenizer=doubled,
+                                                policy=CompressionPolicy(mode="always"))
+    assert seen == [doubled]
+    assert result.text == "three short words"
+    assert result.tokens == 6
@@ -1,7 +1,12 @@
+import re
+import time
+import threading
+
 import pytest # type: ignore
 from promptfit import paraphraser
+from promptfit.concurrency import CircuitBreaker, CircuitOpen
 
-@pytest.mark.skipif(paraphraser.cohere is None, reason="cohere not installed")
+@pytest.mark.skipif(not paraphraser.cohere, reason="cohere not installed")
 def test_paraphrase_prompt(monkeypatch):
     class DummyGen:
         def __init__(self, text):
@@ -19,6 +24,132 @@ def test_paraphrase_prompt(monkeypatch):
 
     monkeypatch.setattr(paraphraser, "cohere", type("cohere", (), {"Client": DummyCohere}))
     monkeypatch.setattr(paraphraser, "get_cohere_api_key", lambda: "dummy")
+    monkeypatch.setattr(paraphraser, "_client", None)
 
     result = paraphraser.paraphrase_prompt("long prompt", instructions="shorten", max_tokens=10)
     assert result == "compressed prompt"
+
+
+class ScriptedCohere:
+    """Stand-in for cohere.Client returning queued generations and recording prompts."""
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+        self.prompts = []
+    def __call__(self, key):
+        return self
+    def generate(self, **kwargs):
+        self.prompts.append(kwargs["prompt"])
+        text = self.outputs.pop(0) if len(self.outputs) > 1 else self.outputs[0]
+        return type("Resp", (), {"generations": [type("Gen", (), {"text": text})()]})()
+
+@pytest.fixture
+def scripted(monkeypatch):
+    def install(outputs):
+        client = ScriptedCohere(outputs)
+        monkeypatch.setattr(paraphraser, "cohere", type("cohere", (), {"Client": client}))
+        monkeypatch.setattr(paraphraser, "get_cohere_api_key", lambda: "dummy")
+        monkeypatch.setattr(paraphraser, "_client", None)
+        monkeypatch.setattr(paraphraser, "_breaker", CircuitBreaker(5, 30.0))
+        paraphraser.clear_paraphrase_cache()
+        return client
+    return install
+
+def test_paraphrase_skip_hyde_and_cache(scripted):
+    client = scripted(["short"])
+    assert paraphraser.paraphrase_prompt("long prompt", "shorten", 10, hyde=False) == "short"
+    # One round of up to three concurrent candidates, no HyDE call
+    calls = len(client.prompts)
+    assert 1 <= calls <= 3 and all("PROMPT:\nlong prompt" in p for p in client.prompts)
+    # Same (text, instructions, budget): served from the cache without generating
+    assert paraphraser.paraphrase_prompt("long prompt", "shorten", 10, hyde=False) == "short"
+    assert len(client.prompts) == calls
+
+def test_paraphrase_measures_with_given_tokenizer(scripted):
+    from promptfit.tokenizer_backends import HeuristicTokenizer
+    # 6 words: 8 heuristic tokens, 12 with two tokens per word
+    scripted(["one two three four five six"])
+    doubled = HeuristicTokenizer(0.5)
+    assert paraphraser.paraphrase_prompt("long prompt", max_tokens=10, hyde=False) == "one two three four five six"
+    # Too long by the caller's tokenizer: every round misses and the best attempt comes back
+    assert paraphraser.paraphrase_prompt("long prompt", max_tokens=10, hyde=False, tokenizer=doubled) == "long prompt"
+
+def test_paraphrase_deadline_returns_best_attempt(scripted):
+    client = scripted(["x y z w v"])
+    prompt = "a b c d e f g h"
+    # An already-expired deadline makes no calls at all
+    assert paraphraser.paraphrase_prompt(prompt, max_tokens=2, hyde=False, deadline=0.0) == prompt
+    assert client.prompts == []
+    # Backoff sleeps are cut short by the deadline instead of running 1s, 2s, 4s...
+    start = time.monotonic()
+    result = paraphraser.paraphrase_prompt(prompt, max_tokens=2, hyde=False, deadline=0.3)
+    assert time.monotonic() - start < 1.0
+    assert result == "x y z w v"
+
+class StubLLM:
+    """Answers after ``latency`` seconds with (target + extra) words, or raises ``error``."""
+    def __init__(self, latency=0.0, extra=3, error=None):
+        self.latency = latency
+        self.extra = extra
+        self.error = error
+        self.calls = 0
+        self.lock = threading.Lock()
+    def generate(self, prompt, **kwargs):
+        with self.lock:
+            self.calls += 1
+        threading.Event().wait(self.latency)  # not time.sleep, which the tests patch
+        if self.error:
+            raise self.error
+        target = int(re.search(r"about (\d+) tokens", prompt).group(1))
+        text = " ".join(["w"] * (target + self.extra))
+        return type("Resp", (), {"generations": [type("Gen", (), {"text": text})()]})()
+
+@pytest.fixture
+def stub(monkeypatch):
+    def install(llm):
+        monkeypatch.setattr(paraphraser, "_client", llm)
+        monkeypatch.setattr(paraphraser, "_breaker", CircuitBreaker(5, 30.0))
+        paraphraser.clear_paraphrase_cache()
+        return llm
+    return install
+
+def test_hedged_candidates_take_one_round_trip(stub, monkeypatch):
+    llm = stub(StubLLM(latency=0.2))
+    sleeps = []
+    monkeypatch.setattr(paraphraser.time, "sleep", sleeps.append)
+    start = time.monotonic()
+    # Targets 10, 7, 5: only the shortest candidate (8 words, 10 tokens) fits
+    result = paraphraser.paraphrase_prompt("a long prompt " * 20, max_tokens=10, hyde=False)
+    elapsed = time.monotonic() - start
+    assert result == " ".join(["w"] * 8)
+    assert elapsed < 0.5 and sleeps == [] and llm.calls == 3
+
+def test_api_errors_back_off_and_open_the_circuit(stub, monkeypatch):
+    llm = stub(StubLLM(error=RuntimeError("503 from API")))
+    sleeps = []
+    monkeypatch.setattr(paraphraser.time, "sleep", sleeps.append)
+    prompt = "a b c d e f g h"
+    assert paraphraser.paraphrase_prompt(prompt, max_tokens=2, hyde=False) == prompt
+    # Round one backs off 1s; round two trips the breaker at the fifth failure and stops
+    assert sleeps == [1] and 5 <= llm.calls <= 6
+    assert paraphraser._breaker.state == "open"
+    # While open, nothing is sent
+    calls = llm.calls
+    assert paraphraser.paraphrase_prompt(prompt, max_tokens=2, hyde=False) == prompt
+    assert llm.calls == calls
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    def fail():
+        raise RuntimeError("down")
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.call(lambda: "ok")
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    # One trial call at a time; success closes the circuit
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.call(lambda: "ok") == "ok" and breaker.state == "closed"
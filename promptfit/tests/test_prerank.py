@@ -0,0 +1,39 @@
+# test_prerank.py
+# Unit tests for prerank module and pre-ranked relevance scoring
+
+import pytest # type: ignore
+import numpy as np
+from promptfit import prerank, relevance
+
+SEGMENTS = [
+    "The weather was pleasant all week.",
+    "The battery drains within two hours.",
+    "Our office is closed on Sundays.",
+    "Battery life is worse in cold weather.",
+]
+
+def test_bm25_prefers_matching_segments():
+    scores = prerank.bm25_scores(SEGMENTS, "battery drains")
+    assert int(np.argmax(scores)) == 1
+    assert scores[2] == 0.0
+
+def test_ngram_scores_match_inflections():
+    scores = prerank.ngram_scores(SEGMENTS, "draining batteries")
+    assert set(np.argsort(-scores)[:2]) == {1, 3}
+
+def test_shortlist_returns_best_first():
+    idx, scores = prerank.shortlist(SEGMENTS, "battery cold weather", 2)
+    # Segments 0 and 1 tie on one matching term; ties keep their original order
+    assert list(idx) == [3, 0]
+    assert scores[0] > scores[1]
+
+def test_rank_segments_only_embeds_shortlist():
+    embedded = []
+    def fake_get_embeddings(texts):
+        embedded.extend(texts)
+        return [[1.0, 0.0] if "battery" in t.lower() else [0.0, 1.0] for t in texts]
+    ranked = relevance.rank_segments_by_relevance(SEGMENTS, "battery", fake_get_embeddings, prerank_top_n=2)
+    assert embedded == ["battery", SEGMENTS[1], SEGMENTS[3]]
+    # Equal cosine scores; the fused score breaks the tie with the lexical rank
+    assert [s for s, _ in ranked] == [SEGMENTS[1], SEGMENTS[3]]
+    assert [score for _, score in ranked] == pytest.approx([1.0, 0.7])
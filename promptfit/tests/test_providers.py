@@ -0,0 +1,90 @@
+# test_providers.py
+# Unit tests for embedding providers
+
+import numpy as np # type: ignore
+import pytest # type: ignore
+from promptfit import optimizer, providers
+from promptfit.embedding_cache import MemoryEmbeddingCache
+
+def test_hashing_provider_is_deterministic_and_normalized():
+    p = providers.HashingProvider(dim=256)
+    embs = p(["the cat sat on the mat", "the cat sat on the mat", "stock prices fell sharply", ""])
+    assert embs.dtype == np.float32 and embs.shape == (4, 256)
+    assert np.allclose(np.linalg.norm(embs[:3], axis=1), 1.0)
+    assert not embs[3].any()
+    assert np.array_equal(embs[0], embs[1])
+    sims = embs @ providers.HashingProvider(dim=256)(["cat on a mat"])[0]
+    assert sims[0] > sims[2]
+
+def test_hashing_projection():
+    p = providers.HashingProvider(dim=4096, projection_dim=64, seed=1)
+    embs = p(["alpha beta gamma", "alpha beta delta", "zeta eta theta"])
+    assert embs.shape == (3, 64)
+    assert embs[0] @ embs[1] > embs[0] @ embs[2]
+
+def test_registry_and_defaults(monkeypatch):
+    assert {"cohere", "hashing", "onnx", "sentence-transformers"} <= set(providers.available_providers())
+    assert isinstance(providers.get_provider("hashing"), providers.HashingProvider)
+    fn = lambda texts: [[1.0]] * len(texts)
+    assert providers.get_provider(fn) is fn
+    with pytest.raises(KeyError):
+        providers.get_provider("nope")
+    monkeypatch.setenv("PROMPTFIT_EMBEDDINGS", "hashing")
+    assert providers.get_provider() is providers.get_provider("hashing")
+
+def test_optimize_prompt_with_local_provider(monkeypatch):
+    monkeypatch.setattr(optimizer, "get_embeddings_array", lambda texts: pytest.fail("remote embeddings called"))
+    prompt = "Paris is the capital of France. Bananas are yellow. The Eiffel Tower is in Paris."
+    result = optimizer.optimize_prompt_detailed(prompt, "capital of France Paris", max_tokens=16, preserve_order=True, embedding_provider="hashing")
+    assert result.text == "Paris is the capital of France. The Eiffel Tower is in Paris."
+    assert result.scores[1] < min(result.scores[0], result.scores[2])
+
+def test_provider_cache(monkeypatch):
+    from promptfit import embedder
+    monkeypatch.setattr(embedder, "_cache", MemoryEmbeddingCache(10))
+    class Counting(providers.EmbeddingProvider):
+        cache_model = "counting"
+        def __init__(self):
+            self.seen = []
+        def encode(self, texts):
+            self.seen.append(list(texts))
+            return np.array([[len(t), 1.0] for t in texts])
+    p = Counting()
+    first = p(["a", "bb", "a"])
+    second = p(["bb", "ccc"])
+    assert p.seen == [["a", "bb"], ["ccc"]]
+    assert first.tolist() == [[1, 1], [2, 1], [1, 1]] and second.tolist() == [[2, 1], [3, 1]]
+
+def _tiny_onnx_model(tmp_path):
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from onnx import TensorProto, helper, numpy_helper # type: ignore
+    from tokenizers import Tokenizer, models, pre_tokenizers # type: ignore
+    vocab = {"[PAD]": 0, "[UNK]": 1, "cats": 2, "dogs": 3, "stocks": 4, "pets": 5}
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tok.pre_tokenizer = pre_tokenizers.Whitespace()
+    tok.save(str(tmp_path / "tokenizer.json"))
+    table = np.array([[0, 0, 0], [0, 0, 1], [1, 0.2, 0], [0.8, 0.3, 0], [0, 1, 0], [1, 0.3, 0]], dtype=np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["hidden"])],
+        "tiny",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, [None, None]),
+         helper.make_tensor_value_info("attention_mask", TensorProto.INT64, [None, None])],
+        [helper.make_tensor_value_info("hidden", TensorProto.FLOAT, [None, None, 3])],
+        [numpy_helper.from_array(table, "table")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    path = tmp_path / "model.onnx"
+    onnx.save(model, str(path))
+    return str(path)
+
+def test_onnx_provider_mean_pools_and_batches(tmp_path):
+    path = _tiny_onnx_model(tmp_path)
+    p = providers.ONNXProvider(path, batch_size=2, threads=2, cache=False)
+    embs = p(["cats", "cats dogs", "stocks", "pets pets pets"])
+    assert embs.shape == (4, 3)
+    assert np.allclose(np.linalg.norm(embs, axis=1), 1.0)
+    # Padding in the two-text batch doesn't leak into the mean
+    assert np.allclose(embs[0], p(["cats"])[0], atol=1e-6)
+    assert embs[0] @ embs[3] > embs[0] @ embs[2]
@@ -0,0 +1,65 @@
+# test_quantize.py
+# Unit tests for compact embedding representations
+
+import numpy as np # type: ignore
+import pytest # type: ignore
+from promptfit import quantize, relevance
+from promptfit.embedding_cache import MemoryEmbeddingCache
+
+def _data(n=2000, dim=128, n_queries=20, seed=0):
+    rng = np.random.default_rng(seed)
+    embs = rng.standard_normal((n, dim)).astype(np.float32)
+    queries = embs[rng.choice(n, n_queries)] + 0.5 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    return embs, queries
+
+def test_sizes_and_exact_float32():
+    embs, queries = _data()
+    f32 = quantize.QuantizedEmbeddings.from_float(embs, "float32")
+    i8 = quantize.QuantizedEmbeddings.from_float(embs, "int8")
+    b1 = quantize.QuantizedEmbeddings.from_float(embs, "binary")
+    assert f32.nbytes / i8.nbytes > 3.8 and f32.nbytes / b1.nbytes == 32
+    assert np.allclose(f32.scores(queries), relevance.similarity_matrix(queries, embs), atol=1e-5)
+    with pytest.raises(ValueError):
+        quantize.QuantizedEmbeddings.from_float(embs, "int4")
+
+def test_int8_error_bound_and_certified_top_k():
+    embs, queries = _data()
+    exact = quantize.QuantizedEmbeddings.from_float(embs, "float32")
+    i8 = quantize.QuantizedEmbeddings.from_float(embs, "int8")
+    for q in queries:
+        err = np.abs(i8.scores(q) - exact.scores(q))
+        assert np.all(err <= i8.error_bound(q) + 1e-6)
+        certified = i8.certified_top_k(q, 10)
+        top = np.argsort(-exact.scores(q))[:10]
+        assert set(top) <= set(certified.tolist())
+        assert len(certified) < len(embs) // 10
+    assert quantize.estimate_recall(embs, queries, "int8", k=10) >= 0.95
+
+def test_binary_hamming_and_rerank():
+    embs, queries = _data()
+    b1 = quantize.QuantizedEmbeddings.from_float(embs, "binary")
+    bits = np.packbits(quantize.l2_normalize(queries[:1]) > 0, axis=1)
+    assert np.array_equal(quantize.hamming_distances(bits, b1.codes)[0], quantize.hamming_distances(bits[0], b1.codes))
+    exact = quantize.l2_normalize(embs) @ quantize.l2_normalize(queries).T
+    first_pass = quantize.recall_at_k(exact.T, b1.scores(queries), 10)
+    reranked = []
+    for qi, q in enumerate(queries):
+        idx, scores = b1.top_k(q, 10, oversample=50, rerank=embs)
+        assert np.all(np.diff(scores) <= 0)
+        reranked.append(len(set(idx) & set(np.argsort(-exact[:, qi])[:10])) / 10)
+    # 1-bit codes lose most of the exact top-k on their own; reranking a shortlist recovers it
+    assert first_pass < 0.5 and np.mean(reranked) >= 0.85
+
+def test_similarity_matrix_accepts_quantized():
+    embs, queries = _data(n=50)
+    i8 = quantize.QuantizedEmbeddings.from_float(embs, "int8")
+    assert relevance.similarity_matrix(queries, i8).shape == (20, 50)
+
+def test_int8_memory_cache():
+    cache = MemoryEmbeddingCache(dtype="int8")
+    vec = np.linspace(-1, 1, 256, dtype=np.float32)
+    cache.put_many("m", "t", ["x"], [vec])
+    got = cache.get_many("m", "t", ["x", "y"])
+    assert got[1] is None and got[0].dtype == np.float32
+    assert np.max(np.abs(got[0] - vec)) <= 1 / 254 + 1e-6
+    assert cache.nbytes() == 256
@@ -2,6 +2,7 @@
 # Unit tests for relevance module
 
 import numpy as np
+import pytest
 from promptfit import relevance
 
 def test_compute_cosine_similarities_basic():
@@ -25,4 +26,69 @@ def test_rank_segments_by_relevance():
     assert isinstance(ranked, list)
     assert all(isinstance(x, tuple) and isinstance(x[0], str) and isinstance(x[1], float) for x in ranked)
     # Highest similarity should be C (dot with ref is 1), then A/B (dot is 0)
-    assert ranked[0][0] == "C" 
\ No newline at end of file
+    assert ranked[0][0] == "C" 
+
+def test_similarity_matrix():
+    sims = relevance.similarity_matrix([[1.0, 0.0], [0.0, 2.0]], [[3.0, 0.0], [0.0, 1.0], [1.0, 1.0]])
+    assert sims.shape == (2, 3)
+    assert np.allclose(sims, [[1.0, 0.0, 0.7071], [0.0, 1.0, 0.7071]], atol=1e-4)
+
+def test_top_k_indices_matches_stable_sort():
+    from promptfit.shared_rank import top_k_indices
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 20, size=500).astype(np.float32)  # many ties
+    full = np.argsort(-scores, kind="stable")
+    for k in (0, 1, 7, 50, 499, 500, 600):
+        assert list(top_k_indices(scores, k)) == list(full[:k])
+    assert list(top_k_indices(scores)) == list(full)
+
+def test_parallel_top_k_matches_in_process():
+    from promptfit.shared_rank import SharedArray, parallel_top_k, shutdown_pools, top_k_indices
+    rng = np.random.default_rng(1)
+    embs = relevance._l2_normalize(rng.standard_normal((1001, 32)).astype(np.float32))
+    query = embs[0]
+    exact = embs @ query
+    try:
+        with SharedArray.copy_of(embs) as shared:
+            for k in (10, None):
+                idx, scores = parallel_top_k(shared, query, k, workers=3)
+                assert list(idx) == list(top_k_indices(exact, k))
+                assert np.allclose(scores, exact[idx], atol=1e-6)
+            name = shared.name
+    finally:
+        shutdown_pools()
+    # The owner unlinks the block
+    with pytest.raises(FileNotFoundError):
+        SharedArray((1,), name=name)
+
+def test_rank_segments_in_worker_processes(monkeypatch):
+    from promptfit.shared_rank import shutdown_pools
+    monkeypatch.setattr(relevance, "RANK_PARALLEL_MIN_SEGMENTS", 10)
+    rng = np.random.default_rng(2)
+    vectors = rng.standard_normal((201, 16))
+    segments = [f"s{i}" for i in range(200)]
+    embed = lambda texts: [vectors[0] if t == "ref" else vectors[int(t[1:]) + 1] for t in texts]
+    expected = relevance.rank_segments_by_relevance(segments, "ref", embed, workers=1)
+    try:
+        for top_k in (None, 5):
+            ranked = relevance.rank_segments_by_relevance(segments, "ref", embed, workers=2, top_k=top_k)
+            assert [s for s, _ in ranked] == [s for s, _ in expected[:top_k]]
+            assert np.allclose([x for _, x in ranked], [x for _, x in expected[:top_k]], atol=1e-6)
+    finally:
+        shutdown_pools()
+
+def test_rank_segments_in_worker_processes_fuses_lexical_scores(monkeypatch):
+    from promptfit.shared_rank import shutdown_pools
+    monkeypatch.setattr(relevance, "RANK_PARALLEL_MIN_SEGMENTS", 10)
+    rng = np.random.default_rng(3)
+    vectors = rng.standard_normal((201, 16))
+    segments = [f"s{i} refund policy" if i % 3 == 0 else f"s{i} office hours" for i in range(200)]
+    embed = lambda texts: [vectors[0] if t == "refund" else vectors[int(t.split()[0][1:]) + 1] for t in texts]
+    expected = relevance.rank_segments_by_relevance(segments, "refund", embed, workers=1, prerank_top_n=120)
+    try:
+        for top_k in (None, 5):
+            ranked = relevance.rank_segments_by_relevance(segments, "refund", embed, workers=2, top_k=top_k, prerank_top_n=120)
+            assert [s for s, _ in ranked] == [s for s, _ in expected[:top_k]]
+            assert np.allclose([x for _, x in ranked], [x for _, x in expected[:top_k]], atol=1e-6)
+    finally:
+        shutdown_pools()
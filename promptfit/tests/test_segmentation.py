@@ -0,0 +1,57 @@
+# test_segmentation.py
+# Unit tests for segmentation module
+
+import pytest
+from promptfit import segmentation
+
+def test_split_regex_handles_abbreviations_and_quotes():
+    text = 'Dr. Smith arrived at 3.30 p.m. on Monday. He said "Hello!" J. Doe stayed, e.g. late.\n\nNew paragraph'
+    assert segmentation.split_regex(text) == [
+        "Dr. Smith arrived at 3.30 p.m. on Monday.",
+        'He said "Hello!"',
+        "J. Doe stayed, e.g. late.",
+        "New paragraph",
+    ]
+
+def test_split_structured_keeps_blocks_whole():
+    text = "\n".join([
+        "# Instructions",
+        "Answer briefly. Cite sources.",
+        "",
+        "- first rule",
+        "  still first rule",
+        "- second rule",
+        "```python",
+        "x = 1",
+        "",
+        "y = 2",
+        "```",
+        "Example 1:",
+        "Input: hi",
+        "Output: hello",
+        "",
+        "User: what now?",
+    ])
+    assert segmentation.split_sentences(text, method="structured") == [
+        "# Instructions",
+        "Answer briefly.",
+        "Cite sources.",
+        "- first rule\n  still first rule",
+        "- second rule",
+        "```python\nx = 1\n\ny = 2\n```",
+        "Example 1:\nInput: hi\nOutput: hello",
+        "User: what now?",
+    ]
+
+def test_auto_never_downloads(monkeypatch):
+    import nltk
+    monkeypatch.setattr(nltk, "download", lambda *a, **k: pytest.fail("segmentation must not download"))
+    monkeypatch.setattr(segmentation, "_punkt", {"english": None})
+    assert segmentation.split_sentences("One here. Two there.") == ["One here.", "Two there."]
+    with pytest.raises(LookupError):
+        segmentation.split_sentences("One.", method="punkt")
+
+def test_split_many():
+    assert segmentation.split_many(["A b. C d.", "", "E f!"], method="regex") == [["A b.", "C d."], [], ["E f!"]]
+    with pytest.raises(ValueError):
+        segmentation.split_many(["x"], method="nope")
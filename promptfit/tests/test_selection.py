@@ -0,0 +1,56 @@
+# test_selection.py
+# Unit tests for selection module
+
+import numpy as np
+import pytest
+from promptfit import selection
+
+def test_greedy_skips_overflowing_segments():
+    sel = selection.select_segments([0.9, 0.8, 0.7], [60, 50, 40], 100)
+    assert sel.indices == [0, 2]
+    assert sel.scores == [0.9, 0.7]
+    assert sel.tokens == 100
+
+def test_knapsack_packs_more_relevance_than_greedy():
+    scores = [0.9, 0.6, 0.6]
+    tokens = [60, 50, 50]
+    greedy = selection.select_segments(scores, tokens, 100, method="greedy")
+    knapsack = selection.select_segments(scores, tokens, 100, method="knapsack")
+    assert greedy.indices == [0]
+    assert sorted(knapsack.indices) == [1, 2]
+    assert sum(knapsack.scores) > sum(greedy.scores)
+
+def test_knapsack_approximation_stays_within_budget():
+    rng = np.random.default_rng(0)
+    scores = rng.random(200)
+    tokens = rng.integers(5, 80, size=200)
+    sel = selection.select_segments(scores, tokens, 3000, method="knapsack", max_cells=100_000)
+    assert sel.approximate
+    assert sel.tokens <= 3000
+    exact = selection.select_segments(scores, tokens, 3000, method="knapsack")
+    assert sum(sel.scores) >= 0.95 * sum(exact.scores)
+
+def test_mmr_avoids_redundant_segments():
+    embeddings = [[1.0, 0.0], [1.0, 0.01], [0.6, 0.8]]
+    sel = selection.select_segments([0.9, 0.89, 0.7], [10, 10, 10], 20, method="mmr", embeddings=embeddings, diversity=0.5)
+    assert sel.indices == [0, 2]
+    with pytest.raises(ValueError):
+        selection.select_segments([0.9], [10], 20, method="mmr")
+
+def test_preserve_order():
+    sel = selection.select_segments([0.1, 0.9, 0.5], [10, 10, 10], 20, preserve_order=True)
+    assert sel.indices == [1, 2]
+    sel = selection.select_segments([0.1, 0.9, 0.5], [10, 10, 10], 30, preserve_order=True)
+    assert sel.indices == [0, 1, 2]
+
+@pytest.mark.parametrize("method", ["greedy", "knapsack"])
+def test_multi_budget_matches_single_budget(method):
+    rng = np.random.default_rng(1)
+    scores = rng.random(60)
+    tokens = rng.integers(5, 80, size=60)
+    budgets = [300, 50, 1200, 0]
+    multi = selection.select_segments_multi(scores, tokens, budgets, method=method, preserve_order=True)
+    for budget, sel in zip(budgets, multi):
+        single = selection.select_segments(scores, tokens, budget, method=method, preserve_order=True)
+        assert sel.indices == single.indices
+        assert sel.tokens <= budget
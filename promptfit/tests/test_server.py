@@ -0,0 +1,151 @@
+# test_server.py
+# Tests for micro-batching and the optimization server (stub backends, no network)
+
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest # type: ignore
+from promptfit import optimizer
+from promptfit.concurrency import MicroBatcher, Overloaded
+from promptfit.providers import HashingProvider
+from promptfit.server import OptimizerService, make_server
+from promptfit.tokenizer_backends import HeuristicTokenizer
+
+PROMPT = "Paris is the capital of France. Bananas are yellow. The Eiffel Tower is in Paris. Cats sleep a lot."
+
+class CountingProvider(HashingProvider):
+    def __init__(self):
+        super().__init__(dim=256)
+        self.calls = []
+    def encode(self, texts):
+        self.calls.append(len(texts))
+        time.sleep(0.01)
+        return super().encode(texts)
+
+class CountingTokenizer(HeuristicTokenizer):
+    def __init__(self):
+        super().__init__()
+        self.name = "counting-test"
+        self.calls = 0
+    def count_many(self, texts):
+        self.calls += 1
+        return super().count_many(texts)
+
+def test_micro_batcher_coalesces_and_pushes_back():
+    calls = []
+    def fn(items):
+        calls.append(list(items))
+        time.sleep(0.02)
+        return [x * 2 for x in items]
+    batcher = MicroBatcher(fn, window=0.01, max_batch=100, max_pending=100)
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda i: batcher([i, i + 100]), range(20)))
+    assert results == [[2 * i, 2 * i + 200] for i in range(20)]
+    assert len(calls) < 10
+    stats = batcher.stats()
+    assert stats["requests"] == 20 and stats["items"] == 40 and stats["mean_batch_items"] > 4
+
+    blocked = threading.Event()
+    slow = MicroBatcher(lambda items: blocked.wait() and items, window=0, max_pending=3)
+    first = slow.submit([1, 2])  # taken by the worker, which then blocks
+    time.sleep(0.05)
+    slow.submit([3, 4, 5])
+    with pytest.raises(Overloaded):
+        slow.submit([6])
+    assert slow.stats()["rejected"] == 1
+    blocked.set()
+    assert first.result(timeout=1) == [1, 2]
+    slow.close()
+    batcher.close()
+
+def test_micro_batcher_propagates_errors():
+    batcher = MicroBatcher(lambda items: 1 / 0, window=0)
+    with pytest.raises(ZeroDivisionError):
+        batcher([1])
+    batcher.close()
+
+def test_service_batches_concurrent_requests():
+    provider = CountingProvider()
+    tokenizer = CountingTokenizer()
+    service = OptimizerService(provider, tokenizer, window=0.02)
+    requests = [{"prompt": PROMPT + f" Extra sentence number {i}.", "query": "capital of France", "max_tokens": 12,
+                 "preserve_order": True, "mode": "prune_only"} for i in range(16)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        responses = list(pool.map(service.optimize, requests))
+    # Sixteen requests share a handful of embedding and tokenizer calls
+    assert len(provider.calls) <= 4
+    assert tokenizer.calls <= 4
+    expected = [optimizer.optimize_prompt(r["prompt"], r["query"], 12, preserve_order=True,
+                                          embedding_provider=HashingProvider(dim=256),
+                                          policy=optimizer.CompressionPolicy("prune_only")) for r in requests]
+    assert [r["text"] for r in responses] == expected
+    metrics = service.metrics()
+    assert metrics["requests"] == 16 and metrics["inflight"] == 0 and metrics["embed"]["depth"] == 0
+    with pytest.raises(ValueError):
+        service.optimize({"prompt": PROMPT, "query": "q", "selector": "nope"})
+    service.close()
+
+@pytest.fixture
+def http_server():
+    service = OptimizerService(HashingProvider(dim=256), "heuristic", max_inflight=4)
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", service
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+def _post(url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.status, json.loads(resp.read())
+
+def test_http_endpoints(http_server):
+    base, service = http_server
+    status, body = _post(base + "/optimize", {"prompt": PROMPT, "query": "capital of France", "max_tokens": 10, "mode": "prune_only"})
+    assert status == 200
+    assert body["text"] == "Paris is the capital of France."
+    assert body["tokens"] <= 10 and "rank" in body["timings_ms"]
+    with pytest.raises(urllib.error.HTTPError) as err:
+        _post(base + "/optimize", {"prompt": PROMPT})
+    assert err.value.code == 400
+    with urllib.request.urlopen(base + "/metrics", timeout=5) as resp:
+        metrics = json.loads(resp.read())
+    assert metrics["requests"] == 1 and "embed" in metrics
+
+def test_http_backpressure(http_server):
+    base, service = http_server
+    for _ in range(service.max_inflight):
+        service._slots.acquire()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as err:
+            _post(base + "/optimize", {"prompt": PROMPT, "query": "q"})
+        assert err.value.code == 503 and err.value.headers["Retry-After"] == "1"
+    finally:
+        for _ in range(service.max_inflight):
+            service._slots.release()
+    assert service.metrics()["rejected"] == 1
+
+def test_unix_socket(tmp_path):
+    path = str(tmp_path / "promptfit.sock")
+    service = OptimizerService(HashingProvider(dim=256), "heuristic")
+    server = make_server(service, socket_path=path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(b"GET /healthz HTTP/1.1\r\nHost: local\r\nConnection: close\r\n\r\n")
+            data = b""
+            while chunk := sock.recv(4096):
+                data += chunk
+        assert data.startswith(b"HTTP/1.1 200") and data.endswith(b'{"status": "ok"}')
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
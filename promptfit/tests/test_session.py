@@ -0,0 +1,54 @@
+# test_session.py
+# Unit tests for session module
+
+from promptfit import session
+from promptfit.policy import CompressionPolicy
+
+VECTORS = {"battery": [1.0, 0.0], "tone": [0.0, 1.0]}
+
+def fake_embedder(calls):
+    def get_embeddings(texts):
+        calls.append(list(texts))
+        return [VECTORS.get(t, [1.0, 0.2] if "battery" in t else [0.1, 1.0]) for t in texts]
+    return get_embeddings
+
+def make_session(calls, **kwargs):
+    return session.PromptFitSession(
+        "battery",
+        max_tokens=kwargs.pop("max_tokens", 8),
+        get_embeddings_fn=fake_embedder(calls),
+        policy=CompressionPolicy(mode="prune_only"),
+        **kwargs,
+    )
+
+def test_session_embeds_only_new_segments(monkeypatch):
+    monkeypatch.setattr(session, "split_sentences", lambda text: text.split("|"))
+    calls = []
+    s = make_session(calls)
+    s.append("battery dies fast|user is angry")
+    assert s.optimize() == "battery dies fast user is angry"  # 4 + 4 tokens fit, nothing embedded
+    assert calls == []
+    s.append("battery swelling reported")
+    assert s.optimize() == "battery dies fast battery swelling reported"
+    assert calls == [["battery", "battery dies fast", "user is angry", "battery swelling reported"]]
+    s.append("please reply soon")
+    s.optimize()
+    assert calls[-1] == ["please reply soon"]
+    # A new query re-scores stored embeddings; only the query itself is embedded
+    assert s.optimize(query="tone") == "user is angry please reply soon"
+    assert calls[-1] == ["tone"]
+    # Alternating back to an earlier query embeds nothing
+    n = len(calls)
+    s.optimize()
+    s.optimize(query="tone")
+    assert len(calls) == n
+
+def test_session_remove_and_selection():
+    calls = []
+    s = make_session(calls, max_tokens=3)
+    ids = s.extend(["battery first", "tone words", "battery second"])
+    s.remove([ids[0]])
+    assert s.segments == ["tone words", "battery second"]
+    assert s.optimize() == "battery second"
+    assert s.last_selection.indices == [1]
+    assert s.total_tokens == 4
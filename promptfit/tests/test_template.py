@@ -0,0 +1,97 @@
+# test_template.py
+# Unit tests for template module
+
+import json
+import re
+import pytest
+from promptfit import template, token_budget
+from promptfit.policy import CompressionPolicy
+from promptfit.template import PromptTemplate, Slot, allocate
+from promptfit.tokenizer_backends import HeuristicTokenizer, LocalBPETokenizer
+
+SYSTEM = "You are a careful assistant. Answer only from the context below. Cite every source you use."
+
+class CountingTokenizer(HeuristicTokenizer):
+    def __init__(self):
+        super().__init__()
+        self.name = "counting"
+        self.seen = []
+
+    def count_many(self, texts):
+        self.seen.extend(texts)
+        return super().count_many(texts)
+
+def test_static_text_is_counted_once():
+    token_budget.clear_token_cache()
+    tok = CountingTokenizer()
+    t = PromptTemplate(SYSTEM + "\n\n{docs}\n\nQuestion: {question}", tokenizer=tok)
+    assert tok.seen == [SYSTEM + "\n\n", "\n\nQuestion: "]
+    assert t.static_tokens == 22
+    tok.seen.clear()
+    for q in ("Who?", "Why?"):
+        t.fill({"docs": "Short doc.", "question": q}, query=q, max_tokens=100)
+    # Per request only the slot values are counted
+    assert set(tok.seen) <= {"Short doc.", "Who?", "Why?"}
+
+def test_format_and_placeholders():
+    t = PromptTemplate("{{literal}} {a} and {b} and {a}")
+    assert t.names == ["a", "b", "a"]
+    assert t.format({"a": "x", "b": "y"}) == "{literal} x and y and x"
+    with pytest.raises(KeyError):
+        t.format({"a": "x"})
+    with pytest.raises(ValueError):
+        PromptTemplate("{a:>10}")
+    with pytest.raises(ValueError):
+        PromptTemplate("{a}", {"b": Slot()})
+
+def test_allocate_by_priority_and_caps():
+    slots = {"q": Slot(required=True), "docs": Slot(priority=3.0), "history": Slot(priority=1.0), "notes": Slot(max_tokens=5)}
+    alloc = allocate({"q": 10, "docs": 500, "history": 500, "notes": 50}, 110, slots)
+    assert alloc["q"] == 10
+    assert alloc["notes"] == 5
+    # 95 tokens left, split 3:1
+    assert (alloc["docs"], alloc["history"]) == (71, 23)
+    # Slots needing less than their share give the rest back
+    alloc = allocate({"q": 10, "docs": 500, "history": 5, "notes": 0}, 110, slots)
+    assert alloc == {"q": 10, "docs": 95, "history": 5, "notes": 0}
+    with pytest.raises(ValueError):
+        allocate({"q": 200}, 110, slots)
+
+def test_fill_optimizes_only_over_budget_slots(monkeypatch):
+    calls = []
+    def fake_optimize(text, query, max_tokens, **kwargs):
+        calls.append((text, max_tokens))
+        return "TRIMMED"
+    monkeypatch.setattr(template, "optimize_prompt", fake_optimize)
+    t = PromptTemplate("Context: {docs}\nQuestion: {question}", {"question": Slot(required=True)})
+    docs = " ".join(["word"] * 300)
+    out = t.fill({"docs": docs, "question": "What is it?"}, query="What is it?", max_tokens=100, policy=CompressionPolicy(mode="prune_only"))
+    assert out == "Context: TRIMMED\nQuestion: What is it?"
+    assert calls == [(docs, 100 - t.static_tokens - 4)]
+    assert t.fill({"docs": "Tiny.", "question": "Why?"}, query="Why?", max_tokens=100) == "Context: Tiny.\nQuestion: Why?"
+    with pytest.raises(ValueError):
+        t.fill({"docs": docs, "question": "Why?"}, query="Why?", max_tokens=1)
+
+def test_fill_keeps_slots_within_budget_with_bpe(tmp_path):
+    spec = {
+        "model": {"type": "BPE", "vocab": {}, "merges": ["r e", "Ġ t", "Ġt h", "Ġth e", "Ġ a", "Ġ o", "Ġ i"]},
+        "pre_tokenizer": {"type": "ByteLevel"},
+    }
+    path = tmp_path / "tokenizer.json"
+    path.write_text(json.dumps(spec))
+    bpe = LocalBPETokenizer(str(path))
+    t = PromptTemplate("Docs: {docs}\nHistory: {history}\nQ: {question}",
+                       {"question": Slot(required=True), "docs": Slot(priority=2.0)}, tokenizer=bpe)
+    values = {
+        "docs": "Refunds are issued within 14 days. The office is closed on holidays. Returns need the receipt.",
+        "history": "The user asked about shipping. We said it is free over 50 euros. They asked about refunds.",
+        "question": "How do refunds work?",
+    }
+    budget = t.budget(values, 120)
+    out = t.fill(values, query=values["question"], max_tokens=120, embedding_provider="hashing",
+                 policy=CompressionPolicy(mode="prune_only"))
+    filled = re.fullmatch(r"Docs: (.*)\nHistory: (.*)\nQ: (.*)", out).groups()
+    for name, text in zip(("docs", "history", "question"), filled):
+        assert text and token_budget.estimate_tokens(text, bpe) <= budget[name]
+    # Character-level BPE counts far more than the heuristic, so both free slots were cut
+    assert filled[0] != values["docs"] and filled[1] != values["history"]
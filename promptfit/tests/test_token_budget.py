@@ -1,8 +1,9 @@
 # test_token_budget.py
 # Unit tests for token_budget module
 
+import json
 import pytest
-from promptfit import token_budget
+from promptfit import token_budget, tokenizer_backends
 
 # Test fallback token estimation (no Cohere)
 def test_estimate_tokens_fallback():
@@ -24,16 +25,49 @@ def test_estimate_total_tokens():
     # Each section: 1/0.75=1, 2/0.75≈2, 3/0.75=4; sum=7
     assert total == 7
 
-# Optionally, add a test for Cohere if API key is present and cohere is installed
-@pytest.mark.skipif(not token_budget._has_cohere, reason="Cohere not installed")
-def test_estimate_tokens_with_cohere(monkeypatch):
+def test_estimate_tokens_many_matches_single():
+    texts = ["One.", "Two three.", "One.", None]
+    assert token_budget.estimate_tokens_many(texts) == [1, 2, 1, 0]
+    assert token_budget.estimate_tokens_many(texts) == [token_budget.estimate_tokens(t) for t in texts]
+
+# The remote Cohere backend is opt-in; its client is stubbed so nothing hits the network
+def test_estimate_tokens_with_cohere():
     class DummyResp:
         tokens = [1,2,3]
     class DummyCohere:
-        def __init__(self, key): pass
-        def tokenize(self, text): return DummyResp()
-    monkeypatch.setattr(token_budget, "cohere", type("cohere", (), {"Client": DummyCohere}))
-    monkeypatch.setattr(token_budget, "_has_cohere", True)
-    monkeypatch.setattr("promptfit.utils.get_cohere_api_key", lambda: "dummy")
-    tokens = token_budget.estimate_tokens("foo bar baz")
-    assert tokens == 3 
\ No newline at end of file
+        def tokenize(self, **kwargs): return DummyResp()
+    backend = tokenizer_backends.CohereTokenizer()
+    backend._co = DummyCohere()
+    tokens = token_budget.estimate_tokens("foo bar baz", tokenizer=backend)
+    assert tokens == 3
+
+def test_transient_backend_failure_is_not_cached():
+    class FlakyBackend(tokenizer_backends.TokenizerBackend):
+        name = "flaky"
+        fail = True
+        def count(self, text):
+            if self.fail:
+                raise tokenizer_backends.TokenizerError("down")
+            return 42
+    backend = FlakyBackend()
+    token_budget.clear_token_cache()
+    assert token_budget.estimate_tokens("foo bar baz", tokenizer=backend) == 4  # heuristic
+    backend.fail = False
+    assert token_budget.estimate_tokens("foo bar baz", tokenizer=backend) == 42
+
+def test_local_bpe_tokenizer_json(tmp_path):
+    # Tiny byte-level vocabulary: "Ġ" is the byte-level symbol for a space
+    spec = {
+        "model": {"type": "BPE", "vocab": {}, "merges": ["h e", "he l", "hel l", "hell o", "Ġ w", "Ġw o"]},
+        "pre_tokenizer": {"type": "ByteLevel"},
+    }
+    path = tmp_path / "tokenizer.json"
+    path.write_text(json.dumps(spec))
+    backend = tokenizer_backends.LocalBPETokenizer(str(path))
+    # "hello" -> [hello], " world" -> [Ġwo, r, l, d]
+    assert token_budget.estimate_tokens("hello world", tokenizer=backend) == 5
+    assert token_budget.estimate_tokens_many(["hello", "hello world"], tokenizer=backend) == [1, 5]
+
+def test_unknown_tokenizer_backend():
+    with pytest.raises(KeyError):
+        token_budget.estimate_tokens("foo", tokenizer="no-such-backend")
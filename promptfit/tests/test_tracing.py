@@ -0,0 +1,101 @@
+# test_tracing.py
+# Unit tests for pipeline instrumentation and optimize_prompt_detailed
+
+import pytest # type: ignore
+from promptfit import optimizer, paraphraser, tracing
+from promptfit.policy import CompressionPolicy
+
+class FakeLLM:
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+    def generate(self, **kwargs):
+        text = self.outputs.pop(0) if len(self.outputs) > 1 else self.outputs[0]
+        return type("Resp", (), {"generations": [type("Gen", (), {"text": text})()]})()
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(optimizer, "split_sentences", lambda text: ["A", "B", "C"])
+    monkeypatch.setattr(optimizer, "estimate_tokens_per_section", lambda sections, tokenizer=None: [50, 60, 60])
+    monkeypatch.setattr(optimizer, "estimate_tokens", lambda s, tokenizer=None: 50 if s == "A" else 60)
+    monkeypatch.setattr(optimizer, "rank_segments_by_relevance", lambda sections, query, get_emb, prerank_top_n=None: [("C", 0.9), ("A", 0.5), ("B", 0.1)])
+
+def test_optimize_prompt_detailed(pipeline):
+    result = optimizer.optimize_prompt_detailed("irrelevant", "query", max_tokens=50)
+    assert result.text == "A"
+    assert (result.original_tokens, result.tokens, result.max_tokens) == (170, 50, 50)
+    assert result.segments == ["A", "B", "C"]
+    assert result.selected == [0]
+    assert result.scores == [0.5, 0.1, 0.9]
+    assert not result.paraphrased
+    assert {"split", "tokens", "rank", "pack", "compress"} <= set(result.timings)
+    assert all(t >= 0 for t in result.timings.values())
+    # Nothing leaks into later calls
+    assert tracing._targets() == ()
+
+def test_detailed_counts_paraphrase_work(pipeline, monkeypatch):
+    monkeypatch.setattr(paraphraser, "_client", FakeLLM(["expanded", "w " * 200, "short"]))
+    monkeypatch.setattr(paraphraser.time, "sleep", lambda s: None)
+    paraphraser.clear_paraphrase_cache()
+    result = optimizer.optimize_prompt_detailed("irrelevant", "query", max_tokens=40, policy=CompressionPolicy(mode="always"))
+    assert result.text == "short" and result.paraphrased
+    # One round of concurrent candidates; a too-long candidate is not retried with backoff
+    assert result.counters["paraphrase.attempts"] == 3
+    assert "paraphrase.retries" not in result.counters
+    # Spans from the candidate threads reach the caller's recorder
+    assert {"paraphrase.hyde", "paraphrase.attempt"} <= set(result.timings)
+
+def test_global_tracer_and_embed_counters(monkeypatch):
+    from promptfit import embedder
+    from promptfit.embedding_cache import MemoryEmbeddingCache
+    class Client:
+        def embed(self, texts, **kwargs):
+            return type("Resp", (), {"embeddings": [[1.0, float(len(t))] for t in texts]})()
+    monkeypatch.setattr(embedder, "_client", Client())
+    monkeypatch.setattr(embedder, "_cache", MemoryEmbeddingCache(100))
+    recorder = tracing.TraceRecorder()
+    tracing.set_tracer(recorder)
+    try:
+        embedder.get_embeddings(["a", "bb", "a"], batch_size=1)
+        embedder.get_embeddings(["a", "ccc"])
+    finally:
+        tracing.set_tracer(None)
+    assert recorder.counters == {"embed.cache_hits": 1, "embed.cache_misses": 3, "embed.requests": 3}
+    assert [s.name for s in recorder.spans] == ["embed", "embed"]
+    assert recorder.spans[0].attributes == {"texts": 3, "uncached": 2, "requests": 2}
+
+def test_prometheus_adapter():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    registry = prometheus_client.CollectorRegistry()
+    tracer = tracing.PrometheusTracer(registry=registry)
+    tracing.set_tracer(tracer)
+    try:
+        with tracing.span("rank"):
+            tracing.count("embed.cache_hits", 3)
+        with pytest.raises(RuntimeError):
+            with tracing.span("pack"):
+                raise RuntimeError("boom")
+    finally:
+        tracing.set_tracer(None)
+    assert registry.get_sample_value("promptfit_stage_duration_seconds_count", {"stage": "rank"}) == 1
+    assert registry.get_sample_value("promptfit_stage_errors_total", {"stage": "pack"}) == 1
+    assert registry.get_sample_value("promptfit_events_total", {"event": "embed.cache_hits"}) == 3
+
+def test_opentelemetry_adapter():
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracing.set_tracer(tracing.OpenTelemetryTracer(tracer=provider.get_tracer("test")))
+    try:
+        with tracing.span("rank", segments=3):
+            with tracing.span("embed") as s:
+                s.set(requests=1)
+    finally:
+        tracing.set_tracer(None)
+    spans = {s.name: s for s in exporter.get_finished_spans()}
+    assert spans["promptfit.embed"].parent.span_id == spans["promptfit.rank"].context.span_id
+    assert spans["promptfit.embed"].attributes["requests"] == 1
+    assert spans["promptfit.rank"].attributes["segments"] == 3
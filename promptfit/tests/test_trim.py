@@ -0,0 +1,110 @@
+# test_trim.py
+# Unit tests for trim module
+
+import json
+import time
+import pytest
+from promptfit import optimizer, token_budget, tokenizer_backends
+from promptfit.policy import CompressionPolicy
+from promptfit.trim import cut_points, trim_to_tokens
+
+TEXT = "Refunds are issued within 30 days, provided the item is unused; shipping costs are not refunded unless the item arrived damaged."
+
+@pytest.fixture
+def bpe(tmp_path):
+    spec = {
+        "model": {"type": "BPE", "vocab": {}, "merges": ["h e", "he l", "hel l", "hell o", "Ġ w", "Ġw o", "Ġ t", "Ġt h", "Ġth e"]},
+        "pre_tokenizer": {"type": "ByteLevel"},
+    }
+    path = tmp_path / "tokenizer.json"
+    path.write_text(json.dumps(spec))
+    return tokenizer_backends.LocalBPETokenizer(str(path))
+
+def test_trim_fills_budget_at_word_boundary():
+    for budget in range(1, 27):
+        piece = trim_to_tokens(TEXT, budget)
+        assert TEXT.startswith(piece)
+        assert token_budget.estimate_tokens(piece) <= budget
+        # One more word would not fit
+        rest = TEXT[len(piece):].split()
+        if rest:
+            assert token_budget.estimate_tokens(piece + " " + rest[0]) > budget
+    assert trim_to_tokens(TEXT, 1000) == TEXT
+    assert trim_to_tokens(TEXT, 0) == ""
+
+def test_trim_at_clause_boundary():
+    assert cut_points("a, b c; d", "clause") == [2, 7]
+    assert trim_to_tokens(TEXT, 12, boundary="clause") == "Refunds are issued within 30 days"
+    # No clause fits: fall back to words
+    assert trim_to_tokens(TEXT, 3, boundary="clause") == "Refunds are"
+    with pytest.raises(ValueError):
+        cut_points(TEXT, "sentence")
+
+def test_prefix_counts_match_recounting(bpe):
+    text = "hello the world, hello there world"
+    cuts = cut_points(text)
+    assert bpe.prefix_counts(text, cuts) == [bpe.count(text[:c]) for c in cuts]
+    heuristic = tokenizer_backends.HeuristicTokenizer()
+    assert heuristic.prefix_counts(TEXT, cut_points(TEXT)) == [heuristic.count(TEXT[:c]) for c in cut_points(TEXT)]
+    for budget in range(1, 30):
+        piece = trim_to_tokens(text, budget, bpe)
+        assert bpe.count(piece or "x") <= budget or not piece
+
+def test_backend_without_offsets_is_binary_searched():
+    class Chars(tokenizer_backends.TokenizerBackend):
+        name = "chars"
+        calls = 0
+        def count(self, text):
+            Chars.calls += 1
+            return len(text)
+    token_budget.clear_token_cache()
+    assert trim_to_tokens(TEXT, 40, Chars()) == "Refunds are issued within 30 days,"
+    assert Chars.calls <= 10
+
+def test_joined_count_matches_joined_string(bpe):
+    parts = ["hello world.", "the world", "hello"]
+    for tok in (None, bpe):
+        assert token_budget.estimate_joined_tokens(parts, tok) == token_budget.estimate_tokens(" ".join(parts), tok)
+    assert token_budget.estimate_joined_tokens([]) == 0
+
+def test_optimizer_trims_instead_of_paraphrasing(monkeypatch):
+    def no_llm(*args, **kwargs):
+        raise AssertionError("paraphrase should not be needed")
+    monkeypatch.setattr(optimizer, "paraphrase_prompt", no_llm)
+    prompt = "Short fact one. " + TEXT + " Unrelated trailing note here."
+    ranked = lambda sections, query, get_emb, prerank_top_n=None: [(sections[1], 0.9), (sections[0], 0.5), (sections[2], 0.1)]
+    monkeypatch.setattr(optimizer, "rank_segments_by_relevance", ranked)
+    policy = CompressionPolicy(trim=True)
+    result = optimizer.optimize_prompt_detailed(prompt, "refunds", max_tokens=20, policy=policy, preserve_order=True)
+    assert result.trimmed == 1
+    assert result.selected == [0, 1, 2]
+    assert result.tokens <= 20 and result.tokens == token_budget.estimate_tokens(result.text)
+    assert result.text.startswith("Short fact one. Refunds are issued")
+    assert not result.paraphrased
+    # Nothing fits whole: the best segment is trimmed rather than paraphrased
+    assert optimizer.optimize_prompt(prompt, "refunds", max_tokens=3, policy=policy) == "Refunds are"
+
+def test_trim_is_fast():
+    text = " ".join(["word"] * 5000)
+    start = time.perf_counter()
+    piece = trim_to_tokens(text, 1000)
+    assert time.perf_counter() - start < 0.05
+    assert token_budget.estimate_tokens(piece) == 1000
+
+def test_every_entry_point_trims(monkeypatch):
+    from promptfit.providers import get_provider
+    from promptfit.session import PromptFitSession
+    def no_llm(*args, **kwargs):
+        raise AssertionError("paraphrase should not be needed")
+    monkeypatch.setattr(optimizer, "paraphrase_prompt", no_llm)
+    prompt = "Short fact one. " + TEXT + " Unrelated trailing note here."
+    policy = CompressionPolicy(trim=True)
+    expected = optimizer.optimize_prompt(prompt, "refunds", 20, preserve_order=True, policy=policy, embedding_provider="hashing")
+    assert "Refunds are" in expected and token_budget.estimate_tokens(expected) <= 20
+    assert optimizer.optimize_for_budgets(prompt, "refunds", [20], preserve_order=True, policy=policy,
+                                          embedding_provider="hashing") == [expected]
+    assert optimizer.optimize_prompts([(prompt, "refunds")], 20, preserve_order=True, policy=policy,
+                                      get_embeddings_fn=get_provider("hashing")) == [expected]
+    session = PromptFitSession("refunds", 20, policy=policy, get_embeddings_fn=get_provider("hashing"))
+    session.append(prompt)
+    assert session.optimize() == expected
@@ -1,39 +1,84 @@
-import re
-from typing import List
-from functools import lru_cache
-
-try:
-    import cohere # type: ignore
-    _has_cohere = True
-except ImportError:
-    _has_cohere = False
-
-_S_NON_WS_RE = re.compile(r'\S+')
-
-@lru_cache(maxsize=4096)
-def _estimate_tokens_uncached(text: str) -> int:
-    if _has_cohere:
-        try:
-            from .utils import get_cohere_api_key
-            api_key = get_cohere_api_key()
-            co = cohere.Client(api_key)
-            resp = co.tokenize(text)
-            return len(resp.tokens)
-        except Exception:
-            pass
-    tokens = _S_NON_WS_RE.findall(text)
-    return max(1, int(len(tokens) / 0.75))
-
-def estimate_tokens(text: str) -> int:
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import TOKEN_CACHE_SIZE
+from .tokenizer_backends import HeuristicTokenizer, TokenizerError, TokenizerSpec, get_tokenizer
+
+# LRU of (backend name, text) -> count, shared by the single and batched entry points
+_token_cache: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+_fallback = HeuristicTokenizer()
+
+def estimate_tokens_many(texts: Sequence[Optional[str]], tokenizer: TokenizerSpec = None) -> List[int]:
+    """Count tokens for many texts in one pass with a local backend.
+
+    Cached counts are reused, the remaining unique texts go to the backend in a single
+    ``count_many`` call. If a backend raises ``TokenizerError`` the heuristic estimate is
+    returned for those texts and is not cached, so a transient failure doesn't stick.
+    """
+    backend = get_tokenizer(tokenizer)
+    counts = [0] * len(texts)
+    missing: Dict[str, List[int]] = {}
+    with _token_cache_lock:
+        for i, text in enumerate(texts):
+            if text is None:
+                continue
+            key = (backend.name, text)
+            cached = _token_cache.get(key)
+            if cached is None:
+                missing.setdefault(text, []).append(i)
+            else:
+                _token_cache.move_to_end(key)
+                counts[i] = cached
+    if not missing:
+        return counts
+
+    unique = list(missing)
+    try:
+        fresh = backend.count_many(unique)
+        cacheable = True
+    except TokenizerError:
+        fresh = _fallback.count_many(unique)
+        cacheable = False
+
+    with _token_cache_lock:
+        for text, n in zip(unique, fresh):
+            for i in missing[text]:
+                counts[i] = n
+            if cacheable:
+                _token_cache[(backend.name, text)] = n
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return counts
+
+def estimate_tokens(text: Optional[str], tokenizer: TokenizerSpec = None) -> int:
     if text is None:
         return 0
-    return _estimate_tokens_uncached(text)
+    return estimate_tokens_many([text], tokenizer)[0]
+
+def estimate_tokens_per_section(sections: List[str], tokenizer: TokenizerSpec = None) -> List[int]:
+    return estimate_tokens_many(sections, tokenizer)
 
-def estimate_tokens_per_section(sections: List[str]) -> List[int]:
-    return [estimate_tokens(section) for section in sections]
+def estimate_total_tokens(sections: List[str], tokenizer: TokenizerSpec = None) -> int:
+    return sum(estimate_tokens_many(sections, tokenizer))
 
-def estimate_total_tokens(sections: List[str]) -> int:
-    return sum(estimate_tokens_per_section(sections))
+def estimate_joined_tokens(texts: Sequence[str], tokenizer: TokenizerSpec = None, sep: str = " ") -> int:
+    """Count ``sep.join(texts)`` from per-part counts instead of tokenizing the joined string.
+
+    Parts after the first are counted with their leading separator (and cached like any other
+    text); BPE encoders split before whitespace, so the parts add up to the joined count. The
+    heuristic backend scales words, so its word counts are added before scaling.
+    """
+    texts = [t for t in texts if t]
+    if not texts:
+        return 0
+    backend = get_tokenizer(tokenizer)
+    if isinstance(backend, HeuristicTokenizer) and not sep.strip():
+        words = sum(len(t.split()) for t in texts)
+        return max(1, int(words / backend.words_per_token))
+    return sum(estimate_tokens_many([texts[0]] + [sep + t for t in texts[1:]], backend))
 
 def clear_token_cache() -> None:
-    _estimate_tokens_uncached.cache_clear()
+    with _token_cache_lock:
+        _token_cache.clear()
@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from .config import COHERE_LLM_MODEL, DEFAULT_TOKENIZER_BACKEND, TOKENIZER_BACKEND_ENV, TOKENIZER_JSON_ENV
+
+_S_NON_WS_RE = re.compile(r'\S+')
+
+# GPT-2 style pre-tokenization, used when a tokenizer.json does not carry its own Split regex
+_BYTE_LEVEL_PAT = r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+
+
+class TokenizerError(RuntimeError):
+    """Raised by a backend when it cannot produce a count (e.g. a transient network failure)."""
+
+
+class TokenizerBackend:
+    """Base class for token counters. Subclasses implement ``count``; ``count_many`` can be overridden to batch."""
+
+    name = "base"
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        return [self.count(t) for t in texts]
+
+    def prefix_counts(self, text: str, cuts: Sequence[int]) -> Optional[List[int]]:
+        """Counts of ``text[:c]`` for ascending word-boundary offsets ``cuts``, from one pass
+        over ``text``. ``None`` when the backend can't map tokens to offsets."""
+        return None
+
+
+class HeuristicTokenizer(TokenizerBackend):
+    """Regex word count scaled by ``words_per_token`` (roughly 0.75 words per token for English)."""
+
+    def __init__(self, words_per_token: float = 0.75):
+        self.words_per_token = words_per_token
+        self.name = "heuristic" if words_per_token == 0.75 else f"heuristic:{words_per_token}"
+
+    def count(self, text: str) -> int:
+        return max(1, int(len(_S_NON_WS_RE.findall(text)) / self.words_per_token))
+
+    def prefix_counts(self, text: str, cuts: Sequence[int]) -> Optional[List[int]]:
+        ends = [m.end() for m in _S_NON_WS_RE.finditer(text)]
+        return [max(1, int(bisect_right(ends, c) / self.words_per_token)) for c in cuts]
+
+
+class TiktokenTokenizer(TokenizerBackend):
+    """In-process BPE counting with a tiktoken encoding, loaded on first use.
+
+    ``encoding`` is an encoding name (``"cl100k_base"``) or a ready ``tiktoken.Encoding``.
+    Named encodings are read from tiktoken's local cache (``TIKTOKEN_CACHE_DIR``); populate it
+    once at build time to keep counting fully offline.
+    """
+
+    def __init__(self, encoding: Any = "cl100k_base", num_threads: int = 8):
+        self._encoding = None if isinstance(encoding, str) else encoding
+        self._encoding_name = encoding if isinstance(encoding, str) else encoding.name  # type: ignore
+        self._lock = threading.Lock()
+        self.num_threads = num_threads
+        self.name = f"tiktoken:{self._encoding_name}"
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            with self._lock:
+                if self._encoding is None:
+                    import tiktoken  # type: ignore
+                    self._encoding = tiktoken.get_encoding(self._encoding_name)
+        return self._encoding
+
+    def encode(self, text: str) -> List[int]:
+        return self.encoding.encode_ordinary(text)
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode_ordinary(text))
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        if len(texts) == 1:
+            return [self.count(texts[0])]
+        encoded = self.encoding.encode_ordinary_batch(list(texts), num_threads=self.num_threads)
+        return [len(ids) for ids in encoded]
+
+    def prefix_counts(self, text: str, cuts: Sequence[int]) -> Optional[List[int]]:
+        # Pre-tokenization splits before whitespace, so a cut at a word end is a token boundary
+        # and the prefix encodes to exactly the tokens that start before it
+        _, starts = self.encoding.decode_with_offsets(self.encode(text))
+        return [bisect_left(starts, c) for c in cuts]
+
+
+def _bytes_to_unicode() -> Dict[int, str]:
+    """The reversible byte <-> printable-unicode table used by byte-level BPE vocabularies."""
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, (chr(c) for c in cs)))
+
+
+def _find_split_pattern(node) -> Optional[str]:
+    if isinstance(node, dict):
+        if node.get("type") == "Split" and isinstance(node.get("pattern"), dict) and "Regex" in node["pattern"]:
+            return node["pattern"]["Regex"]
+        for child in node.get("pretokenizers", []) or []:
+            found = _find_split_pattern(child)
+            if found:
+                return found
+    return None
+
+
+def load_bpe_encoding(path: str, name: Optional[str] = None):
+    """Build a ``tiktoken.Encoding`` from a HuggingFace ``tokenizer.json`` with a byte-level BPE model.
+
+    Merge order becomes tiktoken rank order, so counts match the original tokenizer without any
+    network access. Only byte-level vocabularies (Cohere, GPT-2/RoBERTa style) are supported.
+    """
+    import tiktoken  # type: ignore
+
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    model = spec.get("model") or {}
+    if model.get("type") != "BPE":
+        raise ValueError(f"{path}: expected a BPE model, got {model.get('type')!r}")
+
+    byte_decoder = {c: b for b, c in _bytes_to_unicode().items()}
+
+    def to_bytes(token: str) -> bytes:
+        try:
+            return bytes(byte_decoder[ch] for ch in token)
+        except KeyError:
+            raise ValueError(f"{path}: only byte-level BPE vocabularies are supported") from None
+
+    ranks: Dict[bytes, int] = {bytes([b]): b for b in range(256)}
+    for merge in model.get("merges", []):
+        left, right = merge.split(" ", 1) if isinstance(merge, str) else merge
+        merged = to_bytes(left) + to_bytes(right)
+        if merged not in ranks:
+            ranks[merged] = len(ranks)
+
+    pat_str = _find_split_pattern(spec.get("pre_tokenizer") or {}) or _BYTE_LEVEL_PAT
+    return tiktoken.Encoding(
+        name or os.path.basename(os.path.dirname(os.path.abspath(path))) or "local-bpe",
+        pat_str=pat_str,
+        mergeable_ranks=ranks,
+        special_tokens={},
+    )
+
+
+class LocalBPETokenizer(TiktokenTokenizer):
+    """Counts tokens with a local ``tokenizer.json`` (e.g. a downloaded Cohere vocabulary)."""
+
+    def __init__(self, path: str, num_threads: int = 8):
+        super().__init__(load_bpe_encoding(path), num_threads=num_threads)
+        self.name = f"bpe:{os.path.abspath(path)}"
+
+
+class CohereTokenizer(TokenizerBackend):
+    """Remote ``co.tokenize`` counting. Opt-in only: every uncached string is a network round-trip."""
+
+    def __init__(self, model: str = COHERE_LLM_MODEL):
+        self.model = model
+        self.name = f"cohere:{model}"
+        self._co = None
+
+    def _client(self):
+        if self._co is None:
+            import cohere  # type: ignore
+            from .utils import get_cohere_api_key
+            self._co = cohere.Client(get_cohere_api_key())
+        return self._co
+
+    def count(self, text: str) -> int:
+        try:
+            resp = self._client().tokenize(text=text, model=self.model)
+        except Exception as e:
+            raise TokenizerError(f"Cohere tokenize failed: {e}") from e
+        return len(resp.tokens)
+
+
+TokenizerSpec = Union[str, TokenizerBackend, None]
+
+_registry: Dict[str, Callable[[], TokenizerBackend]] = {}
+_instances: Dict[str, TokenizerBackend] = {}
+_registry_lock = threading.Lock()
+_default_name: Optional[str] = None
+
+
+def register_tokenizer(name: str, factory: Callable[[], TokenizerBackend]) -> None:
+    """Register a backend factory under ``name``. The factory is called once, on first use."""
+    with _registry_lock:
+        _registry[name] = factory
+        _instances.pop(name, None)
+
+
+def unregister_tokenizer(name: str) -> None:
+    """Remove a backend registered with ``register_tokenizer`` (no-op if unknown)."""
+    global _default_name
+    with _registry_lock:
+        _registry.pop(name, None)
+        _instances.pop(name, None)
+        if _default_name == name:
+            _default_name = None
+
+
+def available_tokenizers() -> List[str]:
+    return sorted(_registry)
+
+
+def set_default_tokenizer(name: Optional[str]) -> None:
+    """Select the backend used when no tokenizer is passed. ``None`` restores the configured default."""
+    global _default_name
+    if name is not None and name not in _registry:
+        raise KeyError(f"Unknown tokenizer backend {name!r}. Available: {available_tokenizers()}")
+    _default_name = name
+
+
+def get_tokenizer(tokenizer: TokenizerSpec = None) -> TokenizerBackend:
+    """Resolve a backend instance, a registered name, or ``None`` (the default backend)."""
+    if isinstance(tokenizer, TokenizerBackend):
+        return tokenizer
+    name = tokenizer or _default_name or os.getenv(TOKENIZER_BACKEND_ENV) or DEFAULT_TOKENIZER_BACKEND
+    backend = _instances.get(name)
+    if backend is None:
+        with _registry_lock:
+            backend = _instances.get(name)
+            if backend is None:
+                if name not in _registry:
+                    raise KeyError(f"Unknown tokenizer backend {name!r}. Available: {available_tokenizers()}")
+                backend = _registry[name]()
+                _instances[name] = backend
+    return backend
+
+
+register_tokenizer("heuristic", HeuristicTokenizer)
+register_tokenizer("tiktoken", lambda: TiktokenTokenizer("cl100k_base"))
+register_tokenizer("cl100k_base", lambda: TiktokenTokenizer("cl100k_base"))
+register_tokenizer("o200k_base", lambda: TiktokenTokenizer("o200k_base"))
+register_tokenizer("cohere", CohereTokenizer)
+register_tokenizer("local-bpe", lambda: LocalBPETokenizer(os.environ[TOKENIZER_JSON_ENV]))
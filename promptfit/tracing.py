@@ -0,0 +1,224 @@
+"""Opt-in instrumentation for the optimization pipeline.
+
+Pipeline code reports spans (``split``, ``tokens``, ``rank``, ``embed``, ``pack``,
+``compress``, ``paraphrase.hyde``, ``paraphrase.attempt``) and counters (embedding cache
+hits/misses and requests, paraphrase attempts, retries and backoff seconds) through
+``span`` and ``count``. Nothing is recorded unless a tracer is installed::
+
+    from promptfit.tracing import set_tracer, PrometheusTracer
+    set_tracer(PrometheusTracer())
+
+Spans nest: ``rank`` includes the ``embed`` calls made while ranking.
+"""
+import time
+import threading
+from contextvars import ContextVar
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class Tracer:
+    """Receives pipeline spans and counters. The base class ignores everything."""
+
+    def start_span(self, name: str, attributes: Dict[str, Any]) -> Any:
+        """Called when a stage starts; the return value is passed back to ``end_span``."""
+        return None
+
+    def end_span(self, handle: Any, name: str, duration: float, attributes: Dict[str, Any], error: Optional[BaseException]) -> None:
+        """Called when a stage ends, with its wall time in seconds and final attributes."""
+
+    def count(self, name: str, value: float, attributes: Dict[str, Any]) -> None:
+        """Called to add ``value`` to the counter ``name``."""
+
+
+NoopTracer = Tracer
+
+_tracer: Optional[Tracer] = None
+# Per-context recorders, e.g. the one behind optimize_prompt_detailed
+_recorders: ContextVar[Tuple[Tracer, ...]] = ContextVar("promptfit_recorders", default=())
+
+
+def set_tracer(tracer: Optional[Tracer]) -> None:
+    """Install the process-wide tracer. ``None`` turns instrumentation off."""
+    global _tracer
+    _tracer = None if tracer is None or type(tracer) is Tracer else tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer or Tracer()
+
+
+def _targets() -> Tuple[Tracer, ...]:
+    recorders = _recorders.get()
+    return recorders + (_tracer,) if _tracer is not None else recorders
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name: str, attributes: Dict[str, Any], targets: Tuple[Tracer, ...]):
+        self.name = name
+        self.attributes = attributes
+        self.targets = targets
+
+    def __enter__(self):
+        self.handles = [t.start_span(self.name, self.attributes) for t in self.targets]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        for t, h in zip(self.targets, self.handles):
+            t.end_span(h, self.name, duration, self.attributes, exc)
+        return False
+
+    def set(self, **attributes) -> None:
+        """Attach attributes known only once the stage has run (e.g. result sizes)."""
+        self.attributes.update(attributes)
+
+
+def span(name: str, **attributes):
+    """Context manager timing one pipeline stage; free when no tracer is active."""
+    targets = _targets()
+    if not targets:
+        return _NULL_SPAN
+    return _Span(name, attributes, targets)
+
+
+def count(name: str, value: float = 1, **attributes) -> None:
+    """Add ``value`` to counter ``name`` on every active tracer."""
+    for t in _targets():
+        t.count(name, value, attributes)
+
+
+# ----- in-process recording -----
+
+@dataclass
+class SpanRecord:
+    name: str
+    duration: float
+    attributes: Dict[str, Any]
+    error: Optional[str] = None
+
+
+@dataclass
+class TraceRecorder(Tracer):
+    """Collects spans and counters in memory (thread-safe)."""
+
+    spans: List[SpanRecord] = field(default_factory=list)
+    counters: Dict[str, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def end_span(self, handle, name, duration, attributes, error):
+        with self._lock:
+            self.spans.append(SpanRecord(name, duration, dict(attributes), repr(error) if error else None))
+
+    def count(self, name, value, attributes):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def timings(self) -> Dict[str, float]:
+        """Total seconds per span name."""
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            totals[s.name] = totals.get(s.name, 0.0) + s.duration
+        return totals
+
+
+@contextmanager
+def recording() -> Iterator[TraceRecorder]:
+    """Record spans and counters emitted in the current context (and threads it hands off to
+    via ``asyncio.to_thread``) in addition to the process-wide tracer."""
+    recorder = TraceRecorder()
+    token = _recorders.set(_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+# ----- adapters -----
+
+class OpenTelemetryTracer(Tracer):
+    """Spans become OpenTelemetry spans (nested under the caller's current span) and
+    counters become OpenTelemetry counters. Requires ``opentelemetry-api``."""
+
+    def __init__(self, tracer=None, meter=None, prefix: str = "promptfit"):
+        try:
+            from opentelemetry import metrics, trace  # type: ignore
+        except ImportError as e:
+            raise ImportError("opentelemetry-api is required for OpenTelemetryTracer.") from e
+        self.prefix = prefix
+        self._tracer = tracer or trace.get_tracer(prefix)
+        self._meter = meter or metrics.get_meter(prefix)
+        self._counters: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def start_span(self, name, attributes):
+        cm = self._tracer.start_as_current_span(f"{self.prefix}.{name}", attributes=_otel_attributes(attributes))
+        return cm, cm.__enter__()
+
+    def end_span(self, handle, name, duration, attributes, error):
+        cm, otel_span = handle
+        otel_span.set_attributes(_otel_attributes(attributes))
+        if error is None:
+            cm.__exit__(None, None, None)
+        else:
+            cm.__exit__(type(error), error, error.__traceback__)
+
+    def count(self, name, value, attributes):
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.get(name)
+                if counter is None:
+                    counter = self._counters[name] = self._meter.create_counter(f"{self.prefix}.{name}")
+        counter.add(value, _otel_attributes(attributes))
+
+
+def _otel_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in attributes.items() if isinstance(v, (str, bool, int, float))}
+
+
+class PrometheusTracer(Tracer):
+    """Stage durations go to a ``<namespace>_stage_duration_seconds`` histogram and counters to
+    ``<namespace>_events_total``, both labelled by name. Requires ``prometheus_client``."""
+
+    def __init__(self, registry=None, namespace: str = "promptfit"):
+        try:
+            from prometheus_client import REGISTRY, Counter, Histogram  # type: ignore
+        except ImportError as e:
+            raise ImportError("prometheus_client is required for PrometheusTracer.") from e
+        registry = registry if registry is not None else REGISTRY
+        self.durations = Histogram(
+            f"{namespace}_stage_duration_seconds", "Time spent per promptfit pipeline stage.", ["stage"], registry=registry
+        )
+        self.errors = Counter(
+            f"{namespace}_stage_errors_total", "Pipeline stages that raised.", ["stage"], registry=registry
+        )
+        self.events = Counter(
+            f"{namespace}_events_total", "promptfit pipeline counters.", ["event"], registry=registry
+        )
+
+    def end_span(self, handle, name, duration, attributes, error):
+        self.durations.labels(name).observe(duration)
+        if error is not None:
+            self.errors.labels(name).inc()
+
+    def count(self, name, value, attributes):
+        self.events.labels(name).inc(value)
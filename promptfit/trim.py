@@ -0,0 +1,66 @@
+"""Token-exact trimming of a segment to a leftover budget.
+
+When the next-ranked segment doesn't fit, the pruner drops it whole and the budget it
+leaves unused is wasted (or handed to the LLM). ``trim_to_tokens`` instead keeps the longest
+prefix of the segment that fits, cut at a word or clause boundary. Backends that map tokens
+to offsets (``TokenizerBackend.prefix_counts``: tiktoken, local BPE, heuristic) encode the
+segment once and binary-search the prefix sums; other backends are binary-searched with
+O(log n) counts. Deterministic, local and typically microseconds.
+"""
+import re
+from bisect import bisect_right
+from typing import List
+
+from .policy import TRIM_BOUNDARIES
+from .token_budget import estimate_tokens, estimate_tokens_many
+from .tokenizer_backends import TokenizerSpec, get_tokenizer
+
+_WORD_RE = re.compile(r"\S+")
+_CLAUSE_END = ",;:)]"
+_CLAUSE_STRIP = ",;:"
+
+
+def cut_points(text: str, boundary: str = "word") -> List[int]:
+    """Ascending offsets where ``text`` may be cut: after every word, or after words ending a clause."""
+    if boundary not in TRIM_BOUNDARIES:
+        raise ValueError(f"Unknown trim boundary {boundary!r}. Available: {list(TRIM_BOUNDARIES)}")
+    ends = [m.end() for m in _WORD_RE.finditer(text)]
+    if boundary == "clause":
+        ends = [e for e in ends if text[e - 1] in _CLAUSE_END]
+    return ends
+
+
+def _longest_fit(text: str, cuts: List[int], max_tokens: int, backend) -> int:
+    """Number of ``cuts`` whose prefix fits ``max_tokens`` (prefix counts are non-decreasing)."""
+    counts = backend.prefix_counts(text, cuts)
+    if counts is not None:
+        return bisect_right(counts, max_tokens)
+    lo, hi = 0, len(cuts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if estimate_tokens_many([text[:cuts[mid]]], backend)[0] <= max_tokens:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def trim_to_tokens(text: str, max_tokens: int, tokenizer: TokenizerSpec = None, *, boundary: str = "word") -> str:
+    """Longest prefix of ``text`` cut at a ``boundary`` that fits in ``max_tokens`` ("" if none).
+
+    With ``boundary="clause"`` the cut falls after a comma, semicolon, colon or closing
+    bracket, falling back to a word boundary when no clause fits.
+    """
+    if max_tokens <= 0 or not text.strip():
+        return ""
+    backend = get_tokenizer(tokenizer)
+    if estimate_tokens(text, backend) <= max_tokens:
+        return text
+    if boundary == "clause":
+        cuts = cut_points(text, "clause")
+        k = _longest_fit(text, cuts, max_tokens, backend)
+        if k:
+            return text[:cuts[k - 1]].rstrip(_CLAUSE_STRIP)
+    cuts = cut_points(text, "word")
+    k = _longest_fit(text, cuts, max_tokens, backend)
+    return text[:cuts[k - 1]] if k else ""
@@ -1,27 +1,62 @@
 import os
-from dotenv import load_dotenv
-import nltk
+import importlib
+import importlib.util
 
 from .config import COHERE_API_KEY_ENV
 
-# Always load .env from the project root
+# Always load .env from the project root (on first key lookup, not at import)
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, '.env'))
+_dotenv_loaded = False
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    Truthy only if the module is installed, so ``if not cohere:`` still guards optional deps.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __bool__(self):
+        return self._module is not None or importlib.util.find_spec(self._name) is not None
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
+def _load_dotenv():
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        _dotenv_loaded = True
+        try:
+            from dotenv import load_dotenv # type: ignore
+        except ImportError:
+            return
+        load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, '.env'))
 
 
 def get_cohere_api_key():
     """Load Cohere API key from environment or .env file."""
     key = os.getenv(COHERE_API_KEY_ENV)
+    if not key:
+        _load_dotenv()
+        key = os.getenv(COHERE_API_KEY_ENV)
     if not key:
         raise ValueError("Cohere API key not found. Set COHERE_API_KEY in your environment or .env file.")
     return key
 
 # Sentence splitting utility
 def split_sentences(text):
-    """Split text into sentences using nltk. Ensures punkt and punkt_tab are available."""
-    for resource in ['punkt', 'punkt_tab']:
-        try:
-            nltk.data.find(f'tokenizers/{resource}')
-        except LookupError:
-            nltk.download(resource)
-    return nltk.sent_tokenize(text) 
\ No newline at end of file
+    """Split text into sentences. Uses punkt if its data is installed, else a rule-based splitter; never downloads."""
+    from .segmentation import split_sentences as _split
+    return _split(text)